@@ -0,0 +1,79 @@
+"""SQL building for `aggregateVisitas`: GROUP BY over VisitaType fields with count metrics.
+
+The filter is the same compiled `VisitaFilterInput` as `getVisitas` uses, so both queries
+always agree on which visits match; grouping, counting, ordering and the top-N limit all
+run inside SQLite.
+"""
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from filter_compiler import CompiledFilter
+from query_planner import build_from_clause, required_aliases
+from rollups import ROLLUP_ALIAS, Rollup, rollup_where
+from warehouse import FACT_FIELDS, FIELD_MAPPING, VISITA_FIELDS
+
+AGGREGATE_MAX_LIMIT = int(os.environ.get("AGGREGATE_MAX_LIMIT", "10000"))  # Most groups one request may return
+
+# Grouping by a per-visit key would return one group per visit
+GROUPABLE_FIELDS: Tuple[str, ...] = tuple(field for field in VISITA_FIELDS if field not in FACT_FIELDS)
+
+METRICS: Dict[str, str] = {
+    "visits": "COUNT(*)",
+    "distinct_sessions": "COUNT(DISTINCT fv.id_dim_sessao)",
+    "distinct_ips": "COUNT(DISTINCT fv.id_dim_ip)",
+}
+ROLLUP_METRICS: Dict[str, str] = {"visits": f"SUM({ROLLUP_ALIAS}.visits)"}  # Metrics a rollup can answer
+
+
+def build_aggregate_query(
+    compiled_filter: CompiledFilter,
+    group_by: Sequence[str],
+    metrics: Sequence[str],
+    order_by: Optional[str] = None,
+    descending: bool = True,
+    limit: Optional[int] = None,
+    rollup: Optional[Rollup] = None,
+) -> Tuple[str, List[Any]]:
+    """Builds the GROUP BY statement; result columns are the `group_by` fields, then `metrics`.
+
+    Groups are ordered by `order_by` (a metric) and then by their keys, so top-N results are
+    deterministic; without `order_by` they are ordered by their keys. With `rollup`, the
+    statement sums the rollup's counts instead of scanning facts; the filter must be the
+    un-rewritten one and its fields, like `group_by`, must lie in the rollup's grain.
+    """
+    unknown = [field for field in group_by if field not in GROUPABLE_FIELDS]
+    if unknown:
+        raise ValueError(f"Cannot group by: {', '.join(unknown)}.")
+    if not metrics:
+        raise ValueError("At least one metric is required.")
+    if order_by is not None and order_by not in metrics:
+        raise ValueError("`orderBy` must be one of the requested metrics.")
+    if rollup is not None:
+        outside = (set(group_by) | set(compiled_filter.fields)) - rollup.field_set
+        if outside or set(metrics) - set(ROLLUP_METRICS):
+            raise ValueError(f"{rollup.table} cannot answer this aggregate.")
+        group_columns = [f"{ROLLUP_ALIAS}.{field}" for field in group_by]
+        metric_sql = dict(ROLLUP_METRICS)
+        if not group_by: # SUM over no rows is NULL; COUNT(*) would be 0
+            metric_sql = {metric: f"COALESCE({expr}, 0)" for metric, expr in metric_sql.items()}
+    else:
+        group_columns = [f"{FIELD_MAPPING[field][0]}.{FIELD_MAPPING[field][1]}" for field in group_by]
+        metric_sql = METRICS
+    select_list = [f"{column} AS {field}" for column, field in zip(group_columns, group_by)]
+    select_list += [f"{metric_sql[metric]} AS {metric}" for metric in metrics]
+    sql = f"SELECT {', '.join(select_list)}"
+    if rollup is not None:
+        sql += f" FROM {rollup.table} {ROLLUP_ALIAS}{rollup_where(rollup, compiled_filter)}"
+    else:
+        sql += build_from_clause(required_aliases(group_by) | required_aliases(compiled_filter.fields))
+        sql += compiled_filter.where
+    params = list(compiled_filter.params)
+    if group_columns:
+        sql += f" GROUP BY {', '.join(group_columns)}"
+        order_terms = [f"{order_by} {'DESC' if descending else 'ASC'}"] if order_by else []
+        order_terms += list(group_by)
+        sql += f" ORDER BY {', '.join(order_terms)}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+    return sql, params
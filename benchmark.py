@@ -0,0 +1,254 @@
+"""Resolver benchmarks across data sizes and query shapes.
+
+For each scale (number of visits), a database is built once with generate_data.py and kept
+in `--data-dir`. Every case then runs `getVisitas` through the GraphQL schema, and times
+`build_where_clause` on the case's filter:
+
+- latency percentiles (p50/p95/p99) and the first, cold run;
+- rows/sec: page rows returned per second of resolver time (SQL parameters built per
+  second for `build_where_clause`);
+- peak memory: the largest Python allocation peak of one run, measured with tracemalloc
+  in a separate pass (tracing slows everything down, so it never overlaps the timings).
+
+Results are printed and can be saved as JSON. With `--baseline`, the p50 and p95 of each
+result are compared with a saved run, and any that grew by more than `--threshold` are
+reported as regressions (exit status 1). Baselines are only meaningful on the machine that
+recorded them.
+
+Usage:
+    python benchmark.py [--scales 10000,100000,1000000] [--iterations 30] [--cases no_filter,deep_offset]
+        [--save-baseline benchmarks.json] [--baseline benchmarks.json] [--threshold 0.25]
+"""
+import os
+import sys
+import json
+import math
+import time
+import asyncio
+import argparse
+import platform
+import tracemalloc
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+from count_cache import get_count_cache
+from db_pool import configure_pool
+from filter_inputs import parse_filter
+from generate_data import build_parser, generate, parse_options
+from response_cache import get_response_cache
+from schema import build_where_clause, schema
+
+BENCHMARK_DATA_DIR = os.environ.get("BENCHMARK_DATA_DIR", ".benchmarks")
+PAGE_SIZE = 20
+REGRESSION_MIN_DELTA_MS = 0.05
+
+QUERY = """
+query Benchmark($filter: VisitaFilterInput, $cursorArgs: CursorModeInput, $offsetArgs: PaginationModeInput) {
+  getVisitas(filter: $filter, cursorArgs: $cursorArgs, offsetArgs: $offsetArgs) {
+    totalCount
+    edges { cursor node { idVisita timestampVisita nomeDominio caminhoPagina tipoDispositivo paisGeografia } }
+    pageInfo { hasNextPage hasPreviousPage }
+  }
+}
+"""
+
+
+class Case(NamedTuple):
+    filter: Optional[dict]  # VisitaFilterInput variables (GraphQL field names)
+    pagination: Callable[[int, str], dict]  # (rows, middle cursor) -> cursorArgs/offsetArgs variables
+
+
+def _domain(i: int) -> str:
+    return f"site{i:07d}.com"  # generate_data.py naming (i % 5 == 0 -> .com)
+
+
+CASES: Dict[str, Case] = {
+    "no_filter": Case(None, lambda rows, cursor: {"offsetArgs": {"limit": PAGE_SIZE}}),
+    "dimension_equals": Case({"tipoDispositivo": {"equals": "Mobile"}}, lambda rows, cursor: {"offsetArgs": {"limit": PAGE_SIZE}}),
+    "contains": Case({"caminhoPagina": {"contains": "/docs/page-0000"}}, lambda rows, cursor: {"offsetArgs": {"limit": PAGE_SIZE}}),
+    "nested_and_or": Case({
+        "OR": [
+            {"AND": [{"nomeDominio": {"In": [_domain(0), _domain(5)]}}, {"tipoDispositivo": {"notEquals": "Tablet"}}]},
+            {"AND": [
+                {"paisGeografia": {"equals": "Brazil"}},
+                {"OR": [{"nomeNavegador": {"equals": "Firefox"}}, {"hora": {"between": [8, 18]}}]},
+            ]},
+        ],
+    }, lambda rows, cursor: {"offsetArgs": {"limit": PAGE_SIZE}}),
+    "large_in": Case(
+        {"enderecoIp": {"In": [f"11.0.{i // 256}.{i % 256}" for i in range(0, 2000, 4)]}},
+        lambda rows, cursor: {"offsetArgs": {"limit": PAGE_SIZE}},
+    ),
+    "deep_offset": Case(None, lambda rows, cursor: {"offsetArgs": {"limit": PAGE_SIZE, "offset": max(0, rows * 9 // 10)}}),
+    "cursor_forward": Case(None, lambda rows, cursor: {"cursorArgs": {"first": PAGE_SIZE, "after": cursor}}),
+    "cursor_backward": Case(None, lambda rows, cursor: {"cursorArgs": {"last": PAGE_SIZE, "before": cursor}}),
+}
+
+
+class Result(NamedTuple):
+    iterations: int
+    cold_ms: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    rows_per_sec: float
+    peak_kib: float
+
+
+def percentile(samples: Sequence[float], p: float) -> float:
+    """Nearest-rank percentile of `samples`."""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def _measure(run: Callable[[], int], iterations: int, warmup: int) -> Result:
+    """Times `run` (which returns the rows it produced) and measures its allocation peak."""
+    start = time.perf_counter()
+    rows = run()
+    cold = time.perf_counter() - start
+    for _ in range(warmup):
+        run()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        rows = run()
+        samples.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return Result(
+        iterations=iterations, cold_ms=cold * 1000, p50_ms=percentile(samples, 50) * 1000,
+        p95_ms=percentile(samples, 95) * 1000, p99_ms=percentile(samples, 99) * 1000,
+        rows_per_sec=rows / (sum(samples) / len(samples)) if rows else 0.0, peak_kib=peak / 1024,
+    )
+
+
+def build_database(rows: int, data_dir: str, seed: int = 42) -> str:
+    """Returns the benchmark database for `rows` visits, generating it on first use."""
+    path = os.path.join(data_dir, f"visits-{rows}-seed{seed}.db")
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        options = parse_options(build_parser().parse_args(["--rows", str(rows), "--seed", str(seed), "--days", "30"]))
+        generate(path, options, workers=os.cpu_count() or 1, log=lambda message: print(message, file=sys.stderr))
+    return path
+
+
+class _Runner:
+    """Runs getVisitas through the schema on one event loop."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+
+    def query(self, variables: dict) -> dict:
+        for cache in (get_response_cache(), get_count_cache()):
+            if cache is not None:
+                cache.clear()  # Measure the resolver, not repeated-request hits
+        result = self.loop.run_until_complete(schema.execute(QUERY, variable_values=variables, context_value={}))
+        if result.errors:
+            raise RuntimeError(f"getVisitas failed: {result.errors[0].message}")
+        return result.data["getVisitas"]
+
+    def close(self) -> None:
+        self.loop.close()
+
+
+def run_benchmarks(scales: Sequence[int], cases: Sequence[str], iterations: int = 30, warmup: int = 3,
+                   data_dir: str = BENCHMARK_DATA_DIR, where_iterations: int = 2000) -> Dict[str, Any]:
+    """Returns `{"meta": ..., "results": {"<rows>/<case>/<target>": Result as dict}}`."""
+    results: Dict[str, dict] = {}
+    for rows in scales:
+        configure_pool(database_file=build_database(rows, data_dir))
+        runner = _Runner()
+        try:
+            middle = runner.query({"offsetArgs": {"limit": 1, "offset": rows // 2}})["edges"]
+            cursor = middle[0]["cursor"] if middle else None
+            for name in cases:
+                case = CASES[name]
+                variables = {"filter": case.filter, **case.pagination(rows, cursor)}
+                if "cursorArgs" in variables and cursor is None:
+                    continue
+                resolver = _measure(lambda: len(runner.query(variables)["edges"]), iterations, warmup)
+                results[f"{rows}/{name}/get_visitas"] = resolver._asdict()
+                if case.filter is not None:  # Without a filter there is nothing to compile
+                    filter_input = parse_filter(case.filter)
+                    where = _measure(lambda: len(build_where_clause(filter_input)[1]), where_iterations, warmup)
+                    results[f"{rows}/{name}/build_where_clause"] = where._asdict()
+        finally:
+            runner.close()
+            configure_pool()  # Back to the default database
+    return {
+        "meta": {"python": platform.python_version(), "platform": platform.platform(), "iterations": iterations,
+                 "created": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "results": results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float,
+            min_delta_ms: float = REGRESSION_MIN_DELTA_MS) -> List[str]:
+    """Lists the p50/p95 latencies that grew by more than `threshold` (a fraction) over the baseline.
+
+    Differences below `min_delta_ms` are timer noise for sub-millisecond benchmarks and never count.
+    """
+    regressions = []
+    for key, result in current["results"].items():
+        before = baseline.get("results", {}).get(key)
+        if before is None:
+            continue
+        for metric in ("p50_ms", "p95_ms"):
+            grown = result[metric] - before[metric]
+            if before[metric] > 0 and grown > before[metric] * threshold and grown >= min_delta_ms:
+                regressions.append(
+                    f"{key} {metric}: {before[metric]:.3f} -> {result[metric]:.3f} ms (+{result[metric] / before[metric] - 1:.0%})"
+                )
+    return regressions
+
+
+def format_table(report: Dict[str, Any]) -> str:
+    lines = [f"{'benchmark':<48} {'cold ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'rows/s':>10} {'peak KiB':>9}"]
+    for key, r in report["results"].items():
+        lines.append(
+            f"{key:<48} {r['cold_ms']:>9.3f} {r['p50_ms']:>9.3f} {r['p95_ms']:>9.3f} {r['p99_ms']:>9.3f}"
+            f" {r['rows_per_sec']:>10.0f} {r['peak_kib']:>9.1f}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark getVisitas and build_where_clause.")
+    parser.add_argument("--scales", default="10000,100000", help="Comma-separated visit counts.")
+    parser.add_argument("--cases", default=",".join(CASES), help=f"Comma-separated cases: {', '.join(CASES)}.")
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--data-dir", default=BENCHMARK_DATA_DIR, help="Where generated databases are kept.")
+    parser.add_argument("--output", help="Write the results as JSON.")
+    parser.add_argument("--save-baseline", metavar="PATH", help="Write the results as the new baseline.")
+    parser.add_argument("--baseline", metavar="PATH", help="Compare with a saved baseline.")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown before flagging (0.25 = 25%%).")
+    args = parser.parse_args(argv)
+    cases = [name for name in args.cases.split(",") if name]
+    unknown = set(cases) - set(CASES)
+    if unknown:
+        parser.error(f"Unknown cases: {', '.join(sorted(unknown))}.")
+    scales = [int(value) for value in args.scales.split(",") if value]
+
+    report = run_benchmarks(scales, cases, args.iterations, args.warmup, args.data_dir)
+    print(format_table(report))
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%}.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
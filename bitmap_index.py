@@ -0,0 +1,349 @@
+"""Per-value bitmap indexes over `id_visita` for the low-cardinality dimensions.
+
+For every key of an indexed dimension the index keeps the set of `id_visita` values whose
+fact row references it, as a `Bitmap`. A filter whose fields all belong to indexed
+dimensions (or `id_visita`) is evaluated with set operations only: each dimension leaf is
+resolved by SQLite against its dimension table to the matching keys, whose bitmaps are
+ORed, and AND/OR groups become `&`/`|`. The result is the exact row set of the filter:
+its cardinality answers `totalCount`, and small sets drive the page query by rowid.
+
+Bitmaps are split into 2**16-bit chunks held as Python ints, and empty chunks are not
+stored, so sparse values stay small (a simplified roaring bitmap). Facts are assumed to be
+append-only: a refresh adds the facts above the highest `id_visita` indexed, and a new
+data-version epoch rebuilds the index.
+"""
+import os
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from db_pool import get_pool
+from filter_compiler import CompiledFilter, render_leaf
+from warehouse import DIMENSIONS_BY_ALIAS, FACT_ALIAS, FACT_TABLE, FIELD_MAPPING
+
+BITMAP_INDEX_ENABLED = os.environ.get("BITMAP_INDEX_ENABLED", "0") == "1"
+BITMAP_INDEX_ALIASES = tuple(
+    alias for alias in os.environ.get("BITMAP_INDEX_ALIASES", "dd,dp,dn,ddi,dg,dr,dut").split(",") if alias
+)
+BITMAP_PAGE_MAX_IDS = int(os.environ.get("BITMAP_PAGE_MAX_IDS", "10000"))  # Larger row sets page through SQL instead
+BITMAP_CACHE_SIZE = int(os.environ.get("BITMAP_CACHE_SIZE", "256"))  # Resolved leaves kept per data version
+BITMAP_LOAD_BATCH = int(os.environ.get("BITMAP_LOAD_BATCH", "100000"))  # Fact rows fetched per batch
+
+CHUNK_BITS = 16
+CHUNK_SIZE = 1 << CHUNK_BITS
+_CHUNK_MASK = CHUNK_SIZE - 1
+_SPARSE_CHUNK = 64  # Chunks with fewer ids are built by summing bits instead of through a byte buffer
+
+# Page-query condition restricting the rows to an id set (one parameter: a JSON array)
+ID_SET_CONDITION = f"{FACT_ALIAS}.id_visita IN (SELECT value FROM json_each(?))"
+
+
+def _chunk_from_offsets(offsets: Sequence[int]) -> int:
+    if len(offsets) < _SPARSE_CHUNK:
+        return sum(1 << offset for offset in offsets)
+    buffer = bytearray(CHUNK_SIZE >> 3)
+    for offset in offsets:
+        buffer[offset >> 3] |= 1 << (offset & 7)
+    return int.from_bytes(buffer, "little")
+
+
+class Bitmap:
+    """An immutable set of non-negative integers stored as chunked bitsets."""
+
+    __slots__ = ("chunks",)
+
+    def __init__(self, chunks: Optional[Dict[int, int]] = None):
+        self.chunks: Dict[int, int] = chunks if chunks is not None else {}  # chunk number -> bits (never 0)
+
+    @classmethod
+    def from_ids(cls, ids: Iterable[int]) -> "Bitmap":
+        grouped: Dict[int, List[int]] = {}
+        for id_ in ids:
+            grouped.setdefault(id_ >> CHUNK_BITS, []).append(id_ & _CHUNK_MASK)
+        return cls({chunk: _chunk_from_offsets(sorted(set(offsets))) for chunk, offsets in grouped.items()})
+
+    @classmethod
+    def union(cls, bitmaps: Iterable["Bitmap"]) -> "Bitmap":
+        chunks: Dict[int, int] = {}
+        for bitmap in bitmaps:
+            for chunk, bits in bitmap.chunks.items():
+                chunks[chunk] = chunks.get(chunk, 0) | bits
+        return cls(chunks)
+
+    def __and__(self, other: "Bitmap") -> "Bitmap":
+        small, large = (self, other) if len(self.chunks) <= len(other.chunks) else (other, self)
+        chunks = {}
+        for chunk, bits in small.chunks.items():
+            both = bits & large.chunks.get(chunk, 0)
+            if both:
+                chunks[chunk] = both
+        return Bitmap(chunks)
+
+    def __or__(self, other: "Bitmap") -> "Bitmap":
+        return Bitmap.union((self, other))
+
+    def __sub__(self, other: "Bitmap") -> "Bitmap":
+        chunks = {}
+        for chunk, bits in self.chunks.items():
+            rest = bits & ~other.chunks.get(chunk, 0)
+            if rest:
+                chunks[chunk] = rest
+        return Bitmap(chunks)
+
+    def clip(self, low: Optional[int] = None, high: Optional[int] = None) -> "Bitmap":
+        """Returns the members within `low <= id <= high` (either bound may be None)."""
+        chunks = {}
+        for chunk, bits in self.chunks.items():
+            base = chunk << CHUNK_BITS
+            if low is not None and low > base:
+                if low >= base + CHUNK_SIZE:
+                    continue
+                bits &= ~((1 << (low - base)) - 1)
+            if high is not None and high < base + CHUNK_SIZE - 1:
+                if high < base:
+                    continue
+                bits &= (1 << (high - base + 1)) - 1
+            if bits:
+                chunks[chunk] = bits
+        return Bitmap(chunks)
+
+    def __len__(self) -> int:
+        return sum(bits.bit_count() for bits in self.chunks.values())
+
+    def __bool__(self) -> bool:
+        return bool(self.chunks)
+
+    def __iter__(self) -> Iterator[int]:
+        """Yields the members in ascending order."""
+        for chunk in sorted(self.chunks):
+            base = chunk << CHUNK_BITS
+            digits = bin(self.chunks[chunk])[:1:-1]  # Least significant bit first
+            position = digits.find("1")
+            while position != -1:
+                yield base + position
+                position = digits.find("1", position + 1)
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Bitmap) and self.chunks == other.chunks
+
+    def nbytes(self) -> int:
+        """Approximate size of the bitsets in bytes."""
+        return sum((bits.bit_length() + 7) // 8 for bits in self.chunks.values())
+
+
+def _leaf_param_count(operators: Sequence[Tuple[str, int]]) -> int:
+    return sum(count for _, count in operators)
+
+
+class BitmapIndex:
+    """Bitmaps of `id_visita` per key of the configured dimensions, plus the set of all facts."""
+
+    def __init__(self, aliases: Iterable[str] = BITMAP_INDEX_ALIASES, cache_size: int = BITMAP_CACHE_SIZE,
+                 batch_size: int = BITMAP_LOAD_BATCH):
+        aliases = tuple(aliases)
+        unknown = set(aliases) - set(DIMENSIONS_BY_ALIAS)
+        if unknown:
+            raise ValueError(f"Unknown dimension aliases: {', '.join(sorted(unknown))}.")
+        self.dimensions = tuple(DIMENSIONS_BY_ALIAS[alias] for alias in aliases)
+        self.aliases = frozenset(aliases)
+        self.cache_size = cache_size
+        self.batch_size = batch_size
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._bitmaps: Dict[str, Dict[int, Bitmap]] = {alias: {} for alias in aliases}
+        self._universe = Bitmap()
+        self._high_water = 0
+        self._token: Optional[Hashable] = None
+        self._resolved: "OrderedDict[Hashable, Bitmap]" = OrderedDict()
+        self._counters = {"refreshes": 0, "full_loads": 0, "rows_indexed": 0, "evaluations": 0}
+
+    def covers(self, fields: Iterable[str]) -> bool:
+        """Whether a filter over `fields` can be evaluated on the bitmaps alone."""
+        return all(field == "id_visita" or FIELD_MAPPING[field][0] in self.aliases for field in fields)
+
+    # --- Loading ---
+    def _index_rows(self, rows: List[tuple]) -> None:
+        """Adds one batch of (id_visita, key per dimension) rows, replacing touched bitmaps."""
+        pending: Dict[Tuple[int, Optional[int], int], List[int]] = {}
+        for row in rows:
+            id_visita = row[0]
+            chunk, offset = id_visita >> CHUNK_BITS, id_visita & _CHUNK_MASK
+            pending.setdefault((-1, None, chunk), []).append(offset)
+            for i, key in enumerate(row[1:]):
+                if key is not None:  # A NULL foreign key matches no dimension predicate
+                    pending.setdefault((i, key, chunk), []).append(offset)
+        updates: Dict[Tuple[int, Optional[int]], Dict[int, int]] = {}
+        for (i, key, chunk), offsets in pending.items():
+            updates.setdefault((i, key), {})[chunk] = _chunk_from_offsets(offsets)
+        for (i, key), chunks in updates.items():
+            # Copy-on-write: queries running concurrently keep seeing the previous bitmap
+            current = self._universe if i < 0 else self._bitmaps[self.dimensions[i].alias].get(key, Bitmap())
+            merged = dict(current.chunks)
+            for chunk, bits in chunks.items():
+                merged[chunk] = merged.get(chunk, 0) | bits
+            if i < 0:
+                self._universe = Bitmap(merged)
+            else:
+                self._bitmaps[self.dimensions[i].alias][key] = Bitmap(merged)
+        self._high_water = rows[-1][0]
+        self._counters["rows_indexed"] += len(rows)
+
+    def _load(self, conn: sqlite3.Connection, full: bool) -> None:
+        if full:
+            self._bitmaps = {dim.alias: {} for dim in self.dimensions}
+            self._universe = Bitmap()
+            self._high_water = 0
+        keys = "".join(f", {dim.key}" for dim in self.dimensions)
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        try:
+            cursor.execute(f"SELECT id_visita{keys} FROM {FACT_TABLE} WHERE id_visita > ? ORDER BY id_visita", (self._high_water,))
+            while True:
+                rows = cursor.fetchmany(self.batch_size)
+                if not rows:
+                    break
+                self._index_rows(rows)
+        finally:
+            cursor.close()
+
+    def refresh(self, conn: sqlite3.Connection, token: Optional[Hashable] = None) -> None:
+        """Indexes facts committed since the last refresh if the data-version token moved."""
+        token = get_pool().data_version() if token is None else token
+        if token == self._token:
+            return
+        with self._lock:
+            if token == self._token:
+                return
+            full = self._token is None or not isinstance(token, tuple) or token[:1] != self._token[:1]
+            self._load(conn, full)
+            if full:
+                self._counters["full_loads"] += 1
+            self._counters["refreshes"] += 1
+            self._resolved.clear()
+            self._token = token
+
+    def invalidate(self) -> None:
+        """Forces a rebuild on the next refresh (e.g. after facts were deleted or updated)."""
+        with self._lock:
+            self._token = None
+
+    # --- Evaluation ---
+    def _cached(self, key: Hashable, build) -> Bitmap:
+        with self._lock:
+            if key in self._resolved:
+                self._resolved.move_to_end(key)
+                return self._resolved[key]
+            token = self._token
+        value = build()
+        with self._lock:
+            if token == self._token:
+                self._resolved[key] = value
+                if len(self._resolved) > self.cache_size:
+                    self._resolved.popitem(last=False)
+        return value
+
+    def _dimension_rows(self, conn: sqlite3.Connection, field_name: str, operators: tuple, params: List[Any]) -> Bitmap:
+        dim = DIMENSIONS_BY_ALIAS[FIELD_MAPPING[field_name][0]]
+        def build():
+            keys = conn.execute(
+                f"SELECT {dim.key} FROM {dim.table} {dim.alias} WHERE {render_leaf(field_name, operators)}", params
+            ).fetchall()
+            bitmaps = self._bitmaps[dim.alias]
+            return Bitmap.union(bitmaps[row[0]] for row in keys if row[0] in bitmaps)
+        return self._cached(("leaf", field_name, operators, tuple(params)), build)
+
+    def _joined_rows(self, conn: sqlite3.Connection, alias: str) -> Bitmap:
+        """Facts whose key exists in an inner-joined dimension (the SQL path drops the others)."""
+        dim = DIMENSIONS_BY_ALIAS[alias]
+        def build():
+            bitmaps = self._bitmaps[alias]
+            return Bitmap.union(bitmaps[row[0]] for row in conn.execute(f"SELECT {dim.key} FROM {dim.table}") if row[0] in bitmaps)
+        return self._cached(("joined", alias), build)
+
+    def _id_rows(self, universe: Bitmap, operators: tuple, params: List[Any]) -> Bitmap:
+        rows = universe
+        position = 0
+        for operator, count in operators:
+            values = params[position:position + count]
+            position += count
+            if operator == "equals": rows = rows & Bitmap.from_ids(values)
+            elif operator == "notEquals": rows = rows - Bitmap.from_ids(values)
+            elif operator == "greaterThan": rows = rows.clip(low=values[0] + 1)
+            elif operator == "greaterThanOrEqual": rows = rows.clip(low=values[0])
+            elif operator == "lessThan": rows = rows.clip(high=values[0] - 1)
+            elif operator == "lessThanOrEqual": rows = rows.clip(high=values[0])
+            elif operator == "In": rows = rows & Bitmap.from_ids(values)
+            elif operator == "notIn": rows = rows - Bitmap.from_ids(values)
+            elif operator == "between": rows = rows.clip(values[0], values[1])
+            elif operator == "notBetween": rows = rows - rows.clip(values[0], values[1])
+            else:
+                raise ValueError(f"Unsupported operator for id_visita: {operator}.")
+        return rows
+
+    def _group_rows(self, conn, universe: Bitmap, group: tuple, params: List[Any], position: List[int]) -> Bitmap:
+        """Evaluates one shape group, consuming its parameters in the order `filter_compiler` emitted them."""
+        leaves, and_groups, or_groups = group
+        rows = universe
+        for field_name, operators in leaves:
+            count = _leaf_param_count(operators)
+            leaf_params = params[position[0]:position[0] + count]
+            position[0] += count
+            if FIELD_MAPPING[field_name][0] == FACT_ALIAS:
+                rows = rows & self._id_rows(universe, operators, leaf_params)
+            else:
+                rows = rows & self._dimension_rows(conn, field_name, operators, leaf_params)
+        for sub_group in and_groups:
+            rows = rows & self._group_rows(conn, universe, sub_group, params, position)
+        if or_groups:
+            rows = rows & Bitmap.union([self._group_rows(conn, universe, sub_group, params, position) for sub_group in or_groups])
+        return rows
+
+    def rows(self, conn: sqlite3.Connection, compiled_filter: CompiledFilter,
+             token: Optional[Hashable] = None) -> Optional[Bitmap]:
+        """Returns the `id_visita` set matching an (un-rewritten) compiled filter, or None if not covered."""
+        if not self.covers(compiled_filter.fields):
+            return None
+        self.refresh(conn, token)
+        with self._lock:
+            universe = self._universe
+            self._counters["evaluations"] += 1
+        for alias in {FIELD_MAPPING[field][0] for field in compiled_filter.fields} - {FACT_ALIAS}:
+            if not DIMENSIONS_BY_ALIAS[alias].left_join:
+                universe = universe & self._joined_rows(conn, alias)
+        if compiled_filter.shape is None:
+            return universe
+        return self._group_rows(conn, universe, compiled_filter.shape, compiled_filter.params, [0])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "bitmaps": {alias: len(bitmaps) for alias, bitmaps in self._bitmaps.items()},
+                "bytes": self._universe.nbytes() + sum(b.nbytes() for bitmaps in self._bitmaps.values() for b in bitmaps.values()),
+                "high_water": self._high_water, "token": self._token, **self._counters,
+            }
+
+
+def id_set_filter(rows: Bitmap) -> CompiledFilter:
+    """A compiled filter selecting exactly `rows` by rowid (for the page query)."""
+    return CompiledFilter(ID_SET_CONDITION, [json.dumps(list(rows))], frozenset({"id_visita"}), ("idSet",))
+
+
+# --- Per-process index ---
+_index: Optional[BitmapIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_bitmap_index() -> Optional[BitmapIndex]:
+    """Returns this worker process's bitmap index, or None when `BITMAP_INDEX_ENABLED` is off."""
+    global _index
+    if not BITMAP_INDEX_ENABLED:
+        return None
+    index = _index
+    if index is not None and index.pid == os.getpid():
+        return index
+    with _index_lock:
+        if _index is None or _index.pid != os.getpid():
+            _index = BitmapIndex()
+        return _index
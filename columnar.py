@@ -0,0 +1,339 @@
+"""Optional in-memory, column-oriented copy of `FatoVisitas` for counts and aggregates.
+
+The fact table's integer columns (`id_visita`, `timestamp_visita` and every `id_dim_*`
+foreign key, NULL stored as 0) are held as NumPy arrays. A filter is evaluated as boolean
+masks: fact leaves compare the columns directly, and each dimension leaf is resolved by
+SQLite against its dimension table into a key lookup table, so operator semantics (LIKE,
+NULLs, collations) are exactly those of the SQL path. Counts are `count_nonzero`; groups
+are dense value codes counted with `bincount` (or `unique` for sparse key spaces).
+
+Facts are assumed to be append-only: a refresh loads only the rows above the highest
+`id_visita` seen, and a new data-version epoch (replaced file, rebuilt pool) reloads
+everything. Deleted or updated facts need `invalidate()`.
+
+NumPy is optional: without it (or with `COLUMNAR_ENABLED=0`, the default) the SQL path is used.
+"""
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # Optional dependency
+    np = None
+
+from db_pool import get_pool
+from filter_compiler import CompiledFilter, render_leaf
+from warehouse import DIMENSIONS, DIMENSIONS_BY_ALIAS, FACT_ALIAS, FACT_TABLE, FIELD_MAPPING
+
+COLUMNAR_ENABLED = os.environ.get("COLUMNAR_ENABLED", "0") == "1"
+COLUMNAR_LOAD_BATCH = int(os.environ.get("COLUMNAR_LOAD_BATCH", "100000"))  # Fact rows fetched per batch
+COLUMNAR_LOOKUP_CACHE = int(os.environ.get("COLUMNAR_LOOKUP_CACHE", "256"))  # Resolved dimension leaves kept per data version
+COLUMNAR_DENSE_GROUPS = 1 << 24  # Larger group-code spaces are counted with `unique` instead of `bincount`
+
+COLUMNS: Tuple[str, ...] = ("id_visita", "timestamp_visita") + tuple(dim.key for dim in DIMENSIONS)
+AGGREGATE_METRIC_KEYS = {"distinct_sessions": "id_dim_sessao", "distinct_ips": "id_dim_ip"}
+
+
+def _numeric_mask(column, operators: Sequence[Tuple[str, int]], params: List[Any]):
+    """Evaluates the ANDed conditions of a fact-column leaf, consuming `params` in order."""
+    mask = np.ones(len(column), dtype=bool)
+    position = 0
+    for operator, count in operators:
+        values = params[position:position + count]
+        position += count
+        if operator == "equals": mask &= column == values[0]
+        elif operator == "notEquals": mask &= column != values[0]
+        elif operator == "greaterThan": mask &= column > values[0]
+        elif operator == "greaterThanOrEqual": mask &= column >= values[0]
+        elif operator == "lessThan": mask &= column < values[0]
+        elif operator == "lessThanOrEqual": mask &= column <= values[0]
+        elif operator == "In": mask &= np.isin(column, values)
+        elif operator == "notIn": mask &= ~np.isin(column, values)
+        elif operator == "between": mask &= (column >= values[0]) & (column <= values[1])
+        elif operator == "notBetween": mask &= (column < values[0]) | (column > values[1])
+        else:
+            raise ValueError(f"Unsupported operator for {FACT_TABLE} columns: {operator}.")
+    return mask
+
+
+def _leaf_param_count(operators: Sequence[Tuple[str, int]]) -> int:
+    return sum(count for _, count in operators)
+
+
+class ColumnarStore:
+    """NumPy arrays of the fact table's integer columns, refreshed from an `id_visita` high-water mark."""
+
+    def __init__(self, batch_size: int = COLUMNAR_LOAD_BATCH, lookup_cache_size: int = COLUMNAR_LOOKUP_CACHE):
+        if np is None:
+            raise RuntimeError("The columnar engine requires NumPy (pip install numpy).")
+        self.batch_size = batch_size
+        self.lookup_cache_size = lookup_cache_size
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._columns: Dict[str, Any] = {name: np.zeros(0, dtype=np.int64) for name in COLUMNS}
+        self._size = 0
+        self._high_water = 0
+        self._max_keys: Dict[str, int] = {dim.key: 0 for dim in DIMENSIONS}  # Kept on append: lookup tables are sized from them
+        self._token: Optional[Hashable] = None
+        self._lookups: "OrderedDict[Hashable, Any]" = OrderedDict()  # Per data version: key masks and value codes
+        self._counters = {"refreshes": 0, "full_loads": 0, "rows_loaded": 0, "lookups_built": 0}
+
+    # --- Loading ---
+    def _append(self, rows: List[tuple]) -> None:
+        batch = np.array(rows, dtype=np.int64).reshape(len(rows), len(COLUMNS))
+        needed = self._size + len(rows)
+        capacity = len(self._columns["id_visita"])
+        for i, name in enumerate(COLUMNS):
+            column = self._columns[name]
+            if needed > capacity:
+                # Grow by doubling into fresh buffers; readers keep their old (consistent) ones
+                grown = np.zeros(max(needed, 2 * capacity), dtype=np.int64)
+                grown[:self._size] = column[:self._size]
+                column = self._columns[name] = grown
+            column[self._size:needed] = batch[:, i]
+            if name in self._max_keys:
+                self._max_keys[name] = max(self._max_keys[name], int(batch[:, i].max()))
+        self._size = needed
+        self._high_water = int(batch[-1, 0])
+        self._counters["rows_loaded"] += len(rows)
+
+    def _load(self, conn: sqlite3.Connection, full: bool) -> None:
+        if full:
+            self._columns = {name: np.zeros(0, dtype=np.int64) for name in COLUMNS}
+            self._size = 0
+            self._high_water = 0
+            self._max_keys = {dim.key: 0 for dim in DIMENSIONS}
+        select = ", ".join(name if name in ("id_visita", "timestamp_visita") else f"COALESCE({name}, 0)" for name in COLUMNS)
+        cursor = conn.cursor()
+        cursor.row_factory = None  # Plain tuples convert straight into arrays
+        try:
+            cursor.execute(f"SELECT {select} FROM {FACT_TABLE} WHERE id_visita > ? ORDER BY id_visita", (self._high_water,))
+            while True:
+                rows = cursor.fetchmany(self.batch_size)
+                if not rows:
+                    break
+                self._append(rows)
+        finally:
+            cursor.close()
+
+    def refresh(self, conn: sqlite3.Connection, token: Optional[Hashable] = None) -> None:
+        """Loads facts committed since the last refresh if the data-version token moved."""
+        token = get_pool().data_version() if token is None else token
+        if token == self._token:
+            return
+        with self._lock:
+            if token == self._token:
+                return
+            full = self._token is None or not isinstance(token, tuple) or token[:1] != self._token[:1]
+            self._load(conn, full)
+            if full:
+                self._counters["full_loads"] += 1
+            self._counters["refreshes"] += 1
+            self._lookups.clear()
+            self._token = token
+
+    def invalidate(self) -> None:
+        """Forces a full reload on the next refresh (e.g. after facts were deleted or updated)."""
+        with self._lock:
+            self._token = None
+
+    def _snapshot(self) -> Tuple[Dict[str, Any], int, Dict[str, int]]:
+        """The loaded columns, their length and, per dimension key, one past its largest value."""
+        with self._lock:
+            columns = {name: column[:self._size] for name, column in self._columns.items()}
+            return columns, self._size, {key: high + 1 for key, high in self._max_keys.items()}
+
+    # --- Dimension lookups ---
+    def _lookup(self, key: Hashable, build):
+        with self._lock:
+            if key in self._lookups:
+                self._lookups.move_to_end(key)
+                return self._lookups[key]
+            token = self._token
+        value = build()
+        with self._lock:
+            if token != self._token:
+                return value  # Built from data older than the current version: don't keep it
+            self._lookups[key] = value
+            self._counters["lookups_built"] += 1
+            if len(self._lookups) > self.lookup_cache_size:
+                self._lookups.popitem(last=False)
+        return value
+
+    @staticmethod
+    def _key_mask(keys: List[int], bound: int):
+        mask = np.zeros(bound, dtype=bool)
+        keys = np.asarray(keys, dtype=np.int64)
+        mask[keys[(keys > 0) & (keys < bound)]] = True
+        return mask
+
+    def _leaf_keys(self, conn: sqlite3.Connection, field_name: str, operators: tuple, params: List[Any], bound: int):
+        """Boolean lookup table over dimension keys: True where the dimension row matches the leaf."""
+        def build():
+            dim = DIMENSIONS_BY_ALIAS[FIELD_MAPPING[field_name][0]]
+            rows = conn.execute(
+                f"SELECT {dim.key} FROM {dim.table} {dim.alias} WHERE {render_leaf(field_name, operators)}", params
+            ).fetchall()
+            return self._key_mask([row[0] for row in rows], bound)
+        return self._lookup(("leaf", field_name, operators, tuple(params), bound), build)
+
+    def _existing_keys(self, conn: sqlite3.Connection, alias: str, bound: int):
+        """Keys present in an inner-joined dimension (an INNER JOIN drops facts pointing elsewhere)."""
+        dim = DIMENSIONS_BY_ALIAS[alias]
+        def build():
+            return self._key_mask([row[0] for row in conn.execute(f"SELECT {dim.key} FROM {dim.table}")], bound)
+        return self._lookup(("exists", alias, bound), build)
+
+    def _value_codes(self, conn: sqlite3.Connection, field_name: str, bound: int):
+        """Maps dimension keys to dense codes of the field's distinct values, in SQLite ascending order.
+
+        Returns (codes, values): code 0 is NULL (a NULL value or a NULL/unknown left-joined key).
+        """
+        alias, column = FIELD_MAPPING[field_name]
+        dim = DIMENSIONS_BY_ALIAS[alias]
+        def build():
+            rows = conn.execute(f"SELECT {dim.key}, {column} FROM {dim.table}").fetchall()
+            values = sorted({row[1] for row in rows if row[1] is not None})
+            code_of = {value: code for code, value in enumerate(values, start=1)}
+            codes = np.zeros(bound, dtype=np.int64)
+            for key, value in rows:
+                if 0 < key < bound and value is not None:
+                    codes[key] = code_of[value]
+            return codes, [None] + values
+        return self._lookup(("codes", field_name, bound), build)
+
+    # --- Evaluation ---
+    def _group_mask(self, conn, columns, size, bounds, group, params: List[Any], position: List[int]):
+        """Evaluates one shape group, consuming its parameters in the order `filter_compiler` emitted them."""
+        leaves, and_groups, or_groups = group
+        mask = np.ones(size, dtype=bool)
+        for field_name, operators in leaves:
+            count = _leaf_param_count(operators)
+            leaf_params = params[position[0]:position[0] + count]
+            position[0] += count
+            alias, column = FIELD_MAPPING[field_name]
+            if alias == FACT_ALIAS:
+                mask &= _numeric_mask(columns[column], operators, leaf_params)
+            else:
+                key = DIMENSIONS_BY_ALIAS[alias].key
+                mask &= self._leaf_keys(conn, field_name, operators, leaf_params, bounds[key])[columns[key]]
+        for sub_group in and_groups:
+            mask &= self._group_mask(conn, columns, size, bounds, sub_group, params, position)
+        if or_groups:
+            any_branch = np.zeros(size, dtype=bool)
+            for sub_group in or_groups:
+                any_branch |= self._group_mask(conn, columns, size, bounds, sub_group, params, position)
+            mask &= any_branch
+        return mask
+
+    def _mask(self, conn: sqlite3.Connection, compiled_filter: CompiledFilter, aliases, columns, size, bounds):
+        mask = np.ones(size, dtype=bool)
+        # The SQL path inner-joins these dimensions, so facts with dangling keys never match
+        for alias in aliases:
+            dim = DIMENSIONS_BY_ALIAS[alias]
+            if not dim.left_join:
+                mask &= self._existing_keys(conn, alias, bounds[dim.key])[columns[dim.key]]
+        if compiled_filter.shape is not None:
+            mask &= self._group_mask(conn, columns, size, bounds, compiled_filter.shape, compiled_filter.params, [0])
+        return mask
+
+    def count(self, conn: sqlite3.Connection, compiled_filter: CompiledFilter, token: Optional[Hashable] = None) -> int:
+        """Counts the facts matching an (un-rewritten) compiled filter; equals the SQL `COUNT`."""
+        self.refresh(conn, token)
+        columns, size, bounds = self._snapshot()
+        aliases = {FIELD_MAPPING[field][0] for field in compiled_filter.fields} - {FACT_ALIAS}
+        mask = self._mask(conn, compiled_filter, aliases, columns, size, bounds)
+        return int(np.count_nonzero(mask))
+
+    def aggregate(
+        self,
+        conn: sqlite3.Connection,
+        compiled_filter: CompiledFilter,
+        group_by: Sequence[str],
+        metrics: Sequence[str],
+        order_by: Optional[str] = None,
+        descending: bool = True,
+        limit: Optional[int] = None,
+        token: Optional[Hashable] = None,
+    ) -> Optional[List[tuple]]:
+        """Returns the rows `aggregates.build_aggregate_query` would (group values, then metrics).
+
+        Returns None when the group-code space is too large to index with int64 codes.
+        """
+        self.refresh(conn, token)
+        columns, size, bounds = self._snapshot()
+        aliases = {FIELD_MAPPING[field][0] for field in compiled_filter.fields | set(group_by)} - {FACT_ALIAS}
+        mask = self._mask(conn, compiled_filter, aliases, columns, size, bounds)
+        # Combine the value codes of the group fields into one mixed-radix code per fact
+        combined = np.zeros(int(np.count_nonzero(mask)), dtype=np.int64)
+        radix = 1
+        values_per_field = []
+        for field_name in group_by:
+            key = DIMENSIONS_BY_ALIAS[FIELD_MAPPING[field_name][0]].key
+            codes, values = self._value_codes(conn, field_name, bounds[key])
+            radix *= len(values)
+            if radix >= 1 << 62:
+                return None
+            combined = combined * len(values) + codes[columns[key][mask]]
+            values_per_field.append(values)
+        if group_by:
+            if radix <= COLUMNAR_DENSE_GROUPS:
+                counts = np.bincount(combined, minlength=radix)
+                group_codes = np.flatnonzero(counts)
+                counts = counts[group_codes]
+            else:
+                group_codes, counts = np.unique(combined, return_counts=True)
+        else:
+            group_codes, counts = np.zeros(1, dtype=np.int64), np.array([len(combined)])
+        results = {"visits": counts}
+        for metric in metrics:
+            if metric in AGGREGATE_METRIC_KEYS:
+                column = columns[AGGREGATE_METRIC_KEYS[metric]][mask]
+                span = int(column.max(initial=0)) + 1
+                if radix * span >= 1 << 62:
+                    return None
+                pairs = np.unique(combined * span + column)
+                distinct = np.bincount(np.searchsorted(group_codes, pairs // span), minlength=len(group_codes))
+                results[metric] = distinct
+        # Codes ascend in the SQL key order; a stable sort by the metric keeps that order for ties
+        order = np.arange(len(group_codes))
+        if order_by is not None and group_by:
+            metric_values = results[order_by]
+            order = np.argsort(-metric_values if descending else metric_values, kind="stable")
+        if limit is not None and group_by:
+            order = order[:limit]
+        rows = []
+        for i in order:
+            code = int(group_codes[i])
+            keys = []
+            for values in reversed(values_per_field):
+                code, value_code = divmod(code, len(values))
+                keys.append(values[value_code])
+            rows.append(tuple(reversed(keys)) + tuple(int(results[metric][i]) for metric in metrics))
+        return rows
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"rows": self._size, "high_water": self._high_water, "token": self._token, **self._counters}
+
+
+# --- Per-process store ---
+_store: Optional[ColumnarStore] = None
+_store_lock = threading.Lock()
+
+
+def get_columnar_store() -> Optional[ColumnarStore]:
+    """Returns this worker process's store, or None when disabled or NumPy is missing."""
+    global _store
+    if not COLUMNAR_ENABLED or np is None:
+        return None
+    store = _store
+    if store is not None and store.pid == os.getpid():
+        return store
+    with _store_lock:
+        if _store is None or _store.pid != os.getpid():
+            _store = ColumnarStore()
+        return _store
@@ -0,0 +1,132 @@
+"""Shared `totalCount` cache, keyed by the canonical filter.
+
+`totalCount` depends only on the filter, so every page of every pagination mode of the
+same filter can reuse one count. Each entry keeps the count, the data-version token it is
+valid for, and the fact table's highest `id_visita` when it was counted (the high-water
+mark). When the token moves, only the facts above the high-water mark are counted and
+added, in the same statement that reads the new high-water mark:
+
+    SELECT COUNT(fv.id_visita), (SELECT MAX(id_visita) FROM FatoVisitas) ... WHERE (<filter>) AND fv.id_visita > ?
+
+Like the rollups, this relies on facts being append-only and dimension rows never being
+updated in place (new dimension rows are fine: the filter is re-resolved on every call).
+A new token epoch (a replaced database file or a rebuilt pool) or a high-water mark that
+went backwards recounts from scratch.
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, NamedTuple, Optional, Sequence, Tuple
+
+from filter_compiler import CompiledFilter
+from warehouse import FACT_ALIAS, FACT_TABLE
+
+COUNT_CACHE_ENABLED = os.environ.get("COUNT_CACHE_ENABLED", "1") == "1"
+COUNT_CACHE_SIZE = int(os.environ.get("COUNT_CACHE_SIZE", "4096"))  # Distinct filters kept
+
+
+class CountEntry(NamedTuple):
+    count: int
+    high_water: int  # MAX(id_visita) of the fact table when counted (0 when empty)
+    token: Tuple[int, int]
+
+
+# (sql, params) -> (count, high-water mark) row
+CountRunner = Callable[[str, Sequence], Tuple[int, Optional[int]]]
+
+
+class CountCache:
+    """LRU of filter key -> `CountEntry`, brought up to date incrementally."""
+
+    def __init__(self, max_size: int = COUNT_CACHE_SIZE):
+        if max_size < 1:
+            raise ValueError("Count cache `max_size` must be at least 1.")
+        self.max_size = max_size
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, CountEntry]" = OrderedDict()
+        self._counters = {"hits": 0, "increments": 0, "misses": 0}
+
+    def cached(self, filter_key: Hashable, token: Tuple[int, int]) -> Optional[int]:
+        """The filter's count if it is cached for `token`, without counting anything."""
+        with self._lock:
+            entry = self._entries.get(filter_key)
+            if entry is None or entry.token != token:
+                return None
+            self._entries.move_to_end(filter_key)
+            self._counters["hits"] += 1
+            return entry.count
+
+    def count(self, filter_key: Hashable, token: Tuple[int, int], from_clause: str,
+              compiled_filter: CompiledFilter, run: CountRunner) -> Tuple[int, int]:
+        """Returns `(total count, facts counted by this call)` for the filter.
+
+        `compiled_filter` is the filter as it will be executed (possibly rewritten), and
+        `filter_key` identifies its original form.
+        """
+        with self._lock:
+            entry = self._entries.get(filter_key)
+            if entry is not None:
+                self._entries.move_to_end(filter_key)
+                if entry.token == token:
+                    self._counters["hits"] += 1
+                    return entry.count, 0
+        incremental = entry is not None and entry.token[0] == token[0]
+        where, params = compiled_filter.where, list(compiled_filter.params)
+        if incremental:
+            condition = f"{FACT_ALIAS}.id_visita > ?"
+            where = f" WHERE ({compiled_filter.condition}) AND {condition}" if compiled_filter.condition else f" WHERE {condition}"
+            params.append(entry.high_water)
+        counted, high_water = run(
+            f"SELECT COUNT({FACT_ALIAS}.id_visita), (SELECT MAX(id_visita) FROM {FACT_TABLE}) {from_clause}{where}", params
+        )
+        high_water = high_water or 0
+        if incremental and high_water < entry.high_water:  # Facts were deleted: the increment is meaningless
+            incremental = False
+            counted, high_water = run(
+                f"SELECT COUNT({FACT_ALIAS}.id_visita), (SELECT MAX(id_visita) FROM {FACT_TABLE}) {from_clause}{compiled_filter.where}",
+                compiled_filter.params,
+            )
+            high_water = high_water or 0
+        total = entry.count + counted if incremental else counted
+        with self._lock:
+            self._counters["increments" if incremental else "misses"] += 1
+            current = self._entries.get(filter_key)
+            if current is None or (current.token, current.high_water) <= (token, high_water):
+                self._entries[filter_key] = CountEntry(total, high_water, token)
+                self._entries.move_to_end(filter_key)
+                if len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return total, counted
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "max_size": self.max_size, **self._counters}
+
+
+_cache: Optional[CountCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_count_cache() -> Optional[CountCache]:
+    """Returns this process's count cache, or None when `COUNT_CACHE_ENABLED=0`."""
+    global _cache
+    if not COUNT_CACHE_ENABLED:
+        return None
+    cache = _cache
+    if cache is not None and cache.pid == os.getpid():
+        return cache
+    with _cache_lock:
+        if _cache is None or _cache.pid != os.getpid():
+            _cache = CountCache()
+        return _cache
+
+
+def close_count_cache() -> None:
+    global _cache
+    with _cache_lock:
+        _cache = None
@@ -0,0 +1,110 @@
+import os
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from db_pool import get_pool
+
+# Executor defaults (overridable through environment variables)
+EXECUTOR_MAX_WORKERS = int(os.environ.get("DB_EXECUTOR_MAX_WORKERS", "4"))
+EXECUTOR_MAX_QUEUE = int(os.environ.get("DB_EXECUTOR_MAX_QUEUE", "64"))  # Jobs allowed to wait for a worker
+
+
+class ExecutorSaturatedError(RuntimeError):
+    """Raised when the database executor already has `max_workers + max_queue` jobs in flight."""
+
+
+class DatabaseExecutor:
+    """Runs blocking SQLite work on a bounded thread pool so the event loop stays free.
+
+    Each job checks a connection out of the process pool for its duration, so the
+    connection pool should be at least as large as `max_workers`. Jobs beyond the
+    queue limit are rejected immediately instead of piling up behind slow queries.
+    """
+
+    def __init__(self, max_workers: int = EXECUTOR_MAX_WORKERS, max_queue: int = EXECUTOR_MAX_QUEUE):
+        if max_workers < 1:
+            raise ValueError("Executor `max_workers` must be at least 1.")
+        if max_queue < 0:
+            raise ValueError("Executor `max_queue` must be non-negative.")
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.pid = os.getpid()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db-executor")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._counters = {"submitted": 0, "completed": 0, "rejected": 0}
+
+    def _job_done(self, _future) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            self._counters["completed"] += 1
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Runs `fn(*args)` on a worker thread, preserving the caller's context variables."""
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.max_queue:
+                self._counters["rejected"] += 1
+                raise ExecutorSaturatedError("Database executor is saturated, please retry later.")
+            self._in_flight += 1
+            self._counters["submitted"] += 1
+        ctx = contextvars.copy_context()
+        try:
+            future = self._executor.submit(ctx.run, fn, *args)
+        except RuntimeError:  # Executor shut down
+            self._job_done(None)
+            raise
+        # Track completion on the worker future itself, so cancelled awaiters don't undercount
+        future.add_done_callback(self._job_done)
+        return await asyncio.wrap_future(future)
+
+    async def run_with_connection(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Runs `fn(conn, *args)` on a worker thread with a pooled connection."""
+        return await self.run(functools.partial(_call_with_connection, fn), *args)
+
+    def stats(self) -> dict:
+        """Returns a snapshot of executor load and counters."""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers, "max_queue": self.max_queue,
+                "in_flight": self._in_flight, "queued": max(0, self._in_flight - self.max_workers),
+                **self._counters,
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+
+def _call_with_connection(fn: Callable[..., Any], *args: Any) -> Any:
+    with get_pool().connection() as conn:
+        return fn(conn, *args)
+
+
+# --- Per-process executor ---
+_executor: Optional[DatabaseExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> DatabaseExecutor:
+    """Returns this worker process's executor, creating it on first use (or after a fork)."""
+    global _executor
+    executor = _executor
+    if executor is not None and executor.pid == os.getpid():
+        return executor
+    with _executor_lock:
+        if _executor is None or _executor.pid != os.getpid():
+            _executor = DatabaseExecutor()
+        return _executor
+
+
+def configure_executor(**options) -> DatabaseExecutor:
+    """Replaces the process executor with one built from `options` (see `DatabaseExecutor`)."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None and _executor.pid == os.getpid():
+            _executor.shutdown(wait=False)
+        _executor = DatabaseExecutor(**options)
+        return _executor
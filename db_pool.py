@@ -0,0 +1,324 @@
+import os
+import itertools
+import sqlite3
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple, Iterator
+
+DATABASE_FILE = 'database.db'
+
+# Pool defaults (overridable through environment variables)
+POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", "8"))
+POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "5.0"))  # Seconds to wait for a free connection
+POOL_HEALTH_CHECK_INTERVAL = float(os.environ.get("DB_POOL_HEALTH_CHECK_INTERVAL", "30.0"))  # Seconds idle before re-validating
+POOL_READ_ONLY = os.environ.get("DB_POOL_READ_ONLY", "0") == "1"
+POOL_IMMUTABLE = os.environ.get("DB_POOL_IMMUTABLE", "0") == "1"
+POOL_MMAP_SIZE = int(os.environ.get("DB_POOL_MMAP_SIZE", str(256 * 1024 * 1024)))  # Bytes
+POOL_CACHE_SIZE_KIB = int(os.environ.get("DB_POOL_CACHE_SIZE_KIB", str(64 * 1024)))  # Page cache per connection
+POOL_STATEMENT_CACHE_SIZE = int(os.environ.get("DB_POOL_STATEMENT_CACHE_SIZE", "256"))
+
+
+# Epochs of data-version tokens; unique across pools, so a rebuilt pool never repeats a token
+_data_epochs = itertools.count(1)
+
+
+class PoolTimeoutError(RuntimeError):
+    """Raised when no pooled connection becomes available within the timeout."""
+
+
+def _file_identity(path: str) -> Optional[Tuple[int, int]]:
+    """Returns (device, inode) for the database file, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_dev, st.st_ino
+
+
+class ConnectionPool:
+    """A bounded, thread-safe pool of tuned SQLite connections.
+
+    Connections are configured once when opened (journal mode, mmap, page cache,
+    temp store) and then reused, so requests keep a warm page cache and parsed schema.
+    The pool belongs to a single process: `get_pool()` builds a fresh one after a fork.
+    """
+
+    def __init__(
+        self,
+        database_file: str = DATABASE_FILE,
+        max_size: int = POOL_MAX_SIZE,
+        timeout: float = POOL_TIMEOUT,
+        read_only: bool = POOL_READ_ONLY,
+        immutable: bool = POOL_IMMUTABLE,
+        mmap_size: int = POOL_MMAP_SIZE,
+        cache_size_kib: int = POOL_CACHE_SIZE_KIB,
+        health_check_interval: float = POOL_HEALTH_CHECK_INTERVAL,
+        statement_cache_size: int = POOL_STATEMENT_CACHE_SIZE,
+    ):
+        if max_size < 1:
+            raise ValueError("Pool `max_size` must be at least 1.")
+        self.database_file = database_file
+        self.max_size = max_size
+        self.timeout = timeout
+        self.read_only = read_only or immutable
+        self.immutable = immutable
+        self.mmap_size = mmap_size
+        self.cache_size_kib = cache_size_kib
+        self.health_check_interval = health_check_interval
+        self.statement_cache_size = statement_cache_size
+        self.pid = os.getpid()
+        self.generation = 0  # Bumped whenever the database file is replaced
+
+        self._cond = threading.Condition()
+        self._idle = []  # LIFO stack of (connection, generation, last_used_monotonic)
+        self._checked_out: Dict[int, int] = {}  # id(connection) -> generation it was opened for
+        self._open = 0
+        self._closed = False
+        self._file_id = _file_identity(database_file)
+        # Dedicated connection used only to watch PRAGMA data_version (never writes)
+        self._watch_lock = threading.Lock()
+        self._watcher: Optional[sqlite3.Connection] = None
+        self._watcher_generation = -1
+        self._watch_epoch = 0
+        self._watch_last_version = None
+        self._watch_counter = 0
+        self._counters = {
+            "connections_created": 0, "connections_closed": 0, "acquired": 0,
+            "waits": 0, "timeouts": 0, "health_check_failures": 0, "file_replacements": 0,
+        }
+
+    # --- Connection setup ---
+    def _connect(self) -> sqlite3.Connection:
+        """Opens and tunes a new connection according to the pool configuration."""
+        if self.read_only:
+            uri = f"file:{urllib.request.pathname2url(os.path.abspath(self.database_file))}?mode=ro"
+            if self.immutable:
+                uri += "&immutable=1"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=self.statement_cache_size)
+        else:
+            conn = sqlite3.connect(self.database_file, check_same_thread=False, cached_statements=self.statement_cache_size)
+        conn.row_factory = sqlite3.Row  # Allows accessing columns by name
+        if not self.read_only:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        conn.execute(f"PRAGMA cache_size=-{int(self.cache_size_kib)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        self._counters["connections_created"] += 1
+        return conn
+
+    def _close_connection(self, conn: sqlite3.Connection) -> None:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        self._counters["connections_closed"] += 1
+
+    def _check_file_replaced(self) -> None:
+        """Drops idle connections if the database file was deleted and recreated. Caller holds the lock."""
+        current = _file_identity(self.database_file)
+        if current != self._file_id:
+            self._file_id = current
+            self.generation += 1
+            self._counters["file_replacements"] += 1
+            for conn, _, _ in self._idle:
+                self._close_connection(conn)
+                self._open -= 1
+            self._idle.clear()
+
+    @staticmethod
+    def _is_healthy(conn: sqlite3.Connection) -> bool:
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    # --- Checkout / checkin ---
+    def acquire(self) -> sqlite3.Connection:
+        """Checks out a connection, opening a new one if the pool is below `max_size`."""
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Connection pool is closed.")
+            self._check_file_replaced()
+            waited = False
+            while True:
+                while self._idle:
+                    conn, generation, last_used = self._idle.pop()
+                    if generation != self.generation:
+                        self._close_connection(conn); self._open -= 1
+                        continue
+                    if time.monotonic() - last_used > self.health_check_interval and not self._is_healthy(conn):
+                        self._counters["health_check_failures"] += 1
+                        self._close_connection(conn); self._open -= 1
+                        continue
+                    self._counters["acquired"] += 1
+                    self._checked_out[id(conn)] = generation
+                    return conn
+                if self._open < self.max_size:
+                    self._open += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters["timeouts"] += 1
+                    raise PoolTimeoutError(f"No database connection available after {self.timeout:.1f}s (pool size {self.max_size}).")
+                if not waited:
+                    self._counters["waits"] += 1
+                    waited = True
+                self._cond.wait(remaining)
+            generation = self.generation
+        # Open outside the lock; the slot was reserved above
+        try:
+            conn = self._connect()
+        except sqlite3.Error:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            if generation != self.generation:
+                # File replaced while connecting; the connection may point at the old file
+                self._close_connection(conn)
+                try:
+                    conn = self._connect()
+                except sqlite3.Error:
+                    self._open -= 1
+                    self._cond.notify()
+                    raise
+                generation = self.generation
+            self._counters["acquired"] += 1
+            self._checked_out[id(conn)] = generation
+        return conn
+
+    def release(self, conn: sqlite3.Connection, discard: bool = False) -> None:
+        """Returns a connection to the pool (or closes it when `discard` is set)."""
+        if not discard and conn.in_transaction:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                discard = True
+        with self._cond:
+            generation = self._checked_out.pop(id(conn), None)
+            if discard or self._closed or generation != self.generation:
+                # A connection opened before the file was replaced still reads the old inode
+                self._close_connection(conn)
+                self._open -= 1
+            else:
+                self._idle.append((conn, generation, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Context manager that checks a connection out and always returns it."""
+        conn = self.acquire()
+        discard = False
+        try:
+            yield conn
+        except sqlite3.DatabaseError as e:
+            # Corruption / IO errors leave the connection in an unknown state
+            discard = not isinstance(e, (sqlite3.OperationalError, sqlite3.IntegrityError, sqlite3.ProgrammingError))
+            raise
+        finally:
+            self.release(conn, discard=discard)
+
+    # --- Change detection ---
+    def data_version(self) -> Tuple[int, int]:
+        """Returns a token that changes whenever the database content may have changed.
+
+        The token is `(epoch, counter)`: the epoch moves when the file is replaced or the pool
+        is rebuilt, the counter when `PRAGMA data_version` on a dedicated, never-writing
+        connection reports a commit from any other connection. Caches keep the token they
+        were built with and refresh when it differs.
+        """
+        with self._cond:
+            self._check_file_replaced()
+            generation = self.generation
+        with self._watch_lock:
+            if self._watcher is None or self._watcher_generation != generation:
+                if self._watcher is not None:
+                    self._close_connection(self._watcher)
+                self._watcher = self._connect()
+                self._watcher_generation = generation
+                self._watch_epoch = next(_data_epochs)
+                self._watch_last_version = None
+            version = self._watcher.execute("PRAGMA data_version").fetchone()[0]
+            if version != self._watch_last_version:
+                self._watch_last_version = version
+                self._watch_counter += 1
+            return self._watch_epoch, self._watch_counter
+
+    # --- Introspection ---
+    def health_check(self) -> dict:
+        """Validates that a connection can be checked out and can run a trivial query."""
+        try:
+            with self.connection() as conn:
+                healthy = self._is_healthy(conn)
+                error = None if healthy else "Connection failed `SELECT 1`."
+        except (sqlite3.Error, PoolTimeoutError, RuntimeError) as e:
+            healthy, error = False, str(e)
+        return {"healthy": healthy, "error": error, "pool": self.stats()}
+
+    def stats(self) -> dict:
+        """Returns a snapshot of pool size and usage counters."""
+        with self._cond:
+            idle = len(self._idle)
+            return {
+                "database_file": self.database_file, "read_only": self.read_only, "immutable": self.immutable,
+                "max_size": self.max_size, "open": self._open, "idle": idle, "in_use": self._open - idle,
+                "generation": self.generation, **self._counters,
+            }
+
+    def close(self) -> None:
+        """Closes idle connections and refuses further checkouts. In-use connections close on release."""
+        with self._cond:
+            self._closed = True
+            for conn, _, _ in self._idle:
+                self._close_connection(conn)
+                self._open -= 1
+            self._idle.clear()
+            self._cond.notify_all()
+        with self._watch_lock:
+            if self._watcher is not None:
+                self._close_connection(self._watcher)
+                self._watcher = None
+
+
+# --- Per-process pool ---
+_pool: Optional[ConnectionPool] = None
+_pool_options: dict = {}
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Returns this worker process's pool, creating it on first use (or after a fork)."""
+    global _pool
+    pool = _pool
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            _pool = ConnectionPool(**_pool_options)
+        return _pool
+
+
+def configure_pool(**options) -> ConnectionPool:
+    """Replaces the process pool with one built from `options` (see `ConnectionPool`)."""
+    global _pool, _pool_options
+    with _pool_lock:
+        if _pool is not None and _pool.pid == os.getpid():
+            _pool.close()
+        _pool_options = dict(options)
+        _pool = ConnectionPool(**_pool_options)
+        return _pool
+
+
+def close_pool() -> None:
+    """Closes the process pool; the next `get_pool()` call opens a new one."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool.pid == os.getpid():
+            _pool.close()
+        _pool = None
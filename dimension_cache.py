@@ -0,0 +1,140 @@
+"""Process-level cache of the small, slowly changing dimension tables.
+
+Each cached dimension is held as a list indexed by surrogate key, whose entries are the
+row's attribute tuple in `Dimension.fields` order. With the dimensions in memory, the page
+query only has to read the fact table's foreign keys; nodes are assembled from the cache.
+
+Dimension keys are AUTOINCREMENT and never reused, so refreshing only loads rows above the
+highest key seen so far. The cache refreshes whenever the pool's data-version token moves;
+in-place UPDATEs of dimension rows are not detected incrementally and need `invalidate()`.
+"""
+import os
+import sqlite3
+import threading
+from typing import Dict, Hashable, Iterable, List, Optional
+
+from db_pool import get_pool
+from warehouse import DIMENSIONS_BY_ALIAS, Dimension
+
+DIMENSION_CACHE_ENABLED = os.environ.get("DIMENSION_CACHE_ENABLED", "1") == "1"
+# Dimensions small enough to keep in memory (URLs, pages, sessions, IPs and time grow with traffic)
+DIMENSION_CACHE_ALIASES = tuple(
+    alias for alias in os.environ.get("DIMENSION_CACHE_ALIASES", "dd,dn,dut,ddi,dg,dr").split(",") if alias
+)
+
+
+class DimensionCache:
+    """Id-indexed, in-memory copies of the configured dimension tables."""
+
+    def __init__(self, aliases: Iterable[str] = DIMENSION_CACHE_ALIASES):
+        aliases = tuple(aliases)
+        unknown = set(aliases) - set(DIMENSIONS_BY_ALIAS)
+        if unknown:
+            raise ValueError(f"Unknown dimension aliases: {', '.join(sorted(unknown))}.")
+        self.dimensions = tuple(DIMENSIONS_BY_ALIAS[alias] for alias in aliases)
+        self.aliases = frozenset(aliases)
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._rows: Dict[str, List[Optional[tuple]]] = {alias: [None] for alias in aliases}
+        self._high_water: Dict[str, int] = {alias: 0 for alias in aliases}
+        self._token: Optional[Hashable] = None
+        self._counters = {"refreshes": 0, "full_loads": 0, "rows_loaded": 0, "point_loads": 0}
+
+    @staticmethod
+    def _select(dim: Dimension) -> str:
+        return f"SELECT {dim.key}, {', '.join(dim.fields.values())} FROM {dim.table}"
+
+    def _load(self, conn: sqlite3.Connection, dim: Dimension, full: bool) -> None:
+        """Loads rows above the high-water key (or the whole table) into the id-indexed list."""
+        if full:
+            rows, high_water = [None], 0
+        else:
+            rows, high_water = self._rows[dim.alias], self._high_water[dim.alias]
+        for row in conn.execute(f"{self._select(dim)} WHERE {dim.key} > ? ORDER BY {dim.key}", (high_water,)):
+            values = tuple(row)
+            key = values[0]
+            if key >= len(rows):
+                rows.extend([None] * (key - len(rows)))
+                rows.append(values[1:])
+            else:
+                rows[key] = values[1:]
+            high_water = key
+            self._counters["rows_loaded"] += 1
+        # Appends above are safe for concurrent readers; a full load swaps the list in
+        self._rows[dim.alias] = rows
+        self._high_water[dim.alias] = high_water
+
+    def refresh(self, conn: sqlite3.Connection, token: Optional[Hashable] = None) -> None:
+        """Brings the cache up to date if the database changed since the last refresh.
+
+        `token` defaults to the pool's data-version token. It is read before loading, so a
+        commit racing with the refresh moves the token and triggers another one next time.
+        """
+        token = get_pool().data_version() if token is None else token
+        if token == self._token:
+            return
+        with self._lock:
+            if token == self._token:
+                return
+            # A new token epoch means the database file was replaced (or the pool rebuilt): start over
+            full = self._token is None or not isinstance(token, tuple) or token[:1] != self._token[:1]
+            for dim in self.dimensions:
+                self._load(conn, dim, full)
+            if full:
+                self._counters["full_loads"] += 1
+            self._counters["refreshes"] += 1
+            self._token = token
+
+    def row(self, conn: sqlite3.Connection, alias: str, key: Optional[int]) -> Optional[tuple]:
+        """Returns the cached attribute tuple for `key` (None for a NULL foreign key).
+
+        Keys newer than the last refresh (committed while a query was running) are read
+        from `conn` and added to the cache.
+        """
+        if key is None:
+            return None
+        rows = self._rows[alias]
+        values = rows[key] if key < len(rows) else None
+        if values is None:
+            dim = DIMENSIONS_BY_ALIAS[alias]
+            found = conn.execute(f"{self._select(dim)} WHERE {dim.key} = ?", (key,)).fetchone()
+            if found is None:
+                return None
+            values = tuple(found)[1:]
+            with self._lock:
+                rows = self._rows[alias]
+                if key >= len(rows):
+                    rows.extend([None] * (key + 1 - len(rows)))
+                rows[key] = values
+                self._counters["point_loads"] += 1
+        return values
+
+    def invalidate(self) -> None:
+        """Forces a full reload on the next refresh (e.g. after dimension rows were updated in place)."""
+        with self._lock:
+            self._token = None
+
+    def stats(self) -> dict:
+        """Returns the cached row count per dimension and refresh counters."""
+        with self._lock:
+            return {
+                "dimensions": {alias: sum(1 for r in rows if r is not None) for alias, rows in self._rows.items()},
+                "token": self._token, **self._counters,
+            }
+
+
+# --- Per-process cache ---
+_cache: Optional[DimensionCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_dimension_cache() -> DimensionCache:
+    """Returns this worker process's dimension cache, creating it on first use (or after a fork)."""
+    global _cache
+    cache = _cache
+    if cache is not None and cache.pid == os.getpid():
+        return cache
+    with _cache_lock:
+        if _cache is None or _cache.pid != os.getpid():
+            _cache = DimensionCache()
+        return _cache
@@ -0,0 +1,193 @@
+"""Streaming export of filtered visits as NDJSON or CSV.
+
+An export runs one query, ordered like `getVisitas` (`timestamp_visita`, `id_visita`), on a
+single pooled connection, and reads it in `fetchmany` batches on the database executor.
+Each batch is encoded and sent before the next one is read, so memory stays constant
+whatever the row count, and the response is sent with chunked transfer encoding. The
+query reads one consistent snapshot of the database (its WAL read transaction lasts for
+the whole export).
+
+When the client disconnects, the running batch is interrupted and the connection is
+returned to the pool as soon as its worker thread lets go of it.
+
+Each export holds its pooled connection for the whole stream, so at most
+`EXPORT_MAX_CONCURRENT` exports run at once, and always fewer than the pool holds
+connections: `getVisitas` keeps at least one. Further exports are refused with
+`ExportSaturatedError` instead of starving the pool.
+"""
+import io
+import os
+import csv
+import json
+import asyncio
+import datetime
+import sqlite3
+import threading
+from typing import Any, AsyncIterator, List, Optional, Sequence, Tuple
+
+from strawberry.utils.str_converters import to_camel_case
+
+from db_executor import ExecutorSaturatedError, get_executor
+from db_pool import POOL_MAX_SIZE, get_pool
+from filter_compiler import compile_filter
+from filter_inputs import VisitaFilterInput
+from query_planner import build_from_clause, required_aliases, select_column
+from semi_join import SEMI_JOIN_ENABLED, rewrite_semi_joins
+
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", "1000"))  # Rows fetched and sent per chunk
+EXPORT_SATURATED_RETRY = 0.05  # Seconds to wait for a free executor slot mid-stream
+EXPORT_MAX_CONCURRENT = int(os.environ.get("EXPORT_MAX_CONCURRENT", str(max(1, POOL_MAX_SIZE // 2))))  # Exports streaming at once
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+_active_exports = 0
+_exports_lock = threading.Lock()
+
+
+class ExportSaturatedError(Exception):
+    """Raised when `EXPORT_MAX_CONCURRENT` exports are already streaming."""
+
+
+def _acquire_export_slot() -> None:
+    global _active_exports
+    limit = max(1, min(EXPORT_MAX_CONCURRENT, get_pool().max_size - 1))  # Leave a connection for queries
+    with _exports_lock:
+        if _active_exports >= limit:
+            raise ExportSaturatedError("Too many exports are running, please retry later.")
+        _active_exports += 1
+
+
+def _release_export_slot() -> None:
+    global _active_exports
+    with _exports_lock:
+        _active_exports -= 1
+
+
+class VisitaExport:
+    """One export: a pooled connection, its cursor, and the encoder for the chosen format."""
+
+    def __init__(self, filter: Optional[VisitaFilterInput], fields: Sequence[str], format: str = "ndjson",
+                 batch_size: int = EXPORT_BATCH_SIZE):
+        if format not in MEDIA_TYPES:
+            raise ValueError(f"Unsupported export format: {format}. Use one of: {', '.join(MEDIA_TYPES)}.")
+        self.filter = filter
+        self.fields = tuple(fields)
+        self.format = format
+        self.batch_size = batch_size
+        self.media_type = MEDIA_TYPES[format]
+        self._names = [to_camel_case(field) for field in self.fields]
+        self._timestamp_index = self.fields.index("timestamp_visita") if "timestamp_visita" in self.fields else None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._cursor: Optional[sqlite3.Cursor] = None
+        self._pending: Optional[asyncio.Future] = None
+        self._closed = False
+        self._has_slot = False
+
+    def _query(self, conn: sqlite3.Connection) -> Optional[Tuple[str, List[Any]]]:
+        compiled_filter = compile_filter(self.filter)
+        if SEMI_JOIN_ENABLED and compiled_filter.shape is not None:
+            compiled_filter = rewrite_semi_joins(compiled_filter, conn, get_pool().data_version())
+            if compiled_filter is None:
+                return None  # No row can match
+        aliases = required_aliases(self.fields) | required_aliases(compiled_filter.fields)
+        sql = (
+            f"SELECT {', '.join(select_column(field) for field in self.fields)}{build_from_clause(aliases)}"
+            f"{compiled_filter.where} ORDER BY fv.timestamp_visita ASC, fv.id_visita ASC"
+        )
+        return sql, compiled_filter.params
+
+    def _open(self) -> None:
+        """Checks out a connection and starts the query (on an executor thread)."""
+        pool = get_pool()
+        conn = pool.acquire()
+        try:
+            query = self._query(conn)
+            cursor = conn.cursor()
+            cursor.row_factory = None  # Plain tuples; rows are encoded positionally
+            if query is not None:
+                cursor.execute(*query)
+        except BaseException:
+            pool.release(conn)
+            raise
+        self._conn, self._cursor = conn, (cursor if query is not None else None)
+
+    def _fetch(self) -> list:
+        return self._cursor.fetchmany(self.batch_size) if self._cursor is not None else []
+
+    async def _run(self, fn, retry: bool):
+        """Runs `fn` on the executor; the job is shielded so a disconnect never abandons it mid-use."""
+        while True:
+            task = asyncio.ensure_future(get_executor().run(fn))
+            self._pending = task
+            try:
+                return await asyncio.shield(task)
+            except ExecutorSaturatedError:
+                if not retry:
+                    raise
+                await asyncio.sleep(EXPORT_SATURATED_RETRY)
+
+    async def open(self) -> None:
+        """Starts the export.
+
+        Raises `ExportSaturatedError` or `ExecutorSaturatedError` (before any byte is sent)
+        when too many exports are running or the executor is full.
+        """
+        _acquire_export_slot()
+        self._has_slot = True
+        try:
+            await self._run(self._open, retry=False)
+        except BaseException:
+            self.close()
+            raise
+
+    def _encode(self, rows: List[tuple], header: bool) -> bytes:
+        if self._timestamp_index is not None:
+            i = self._timestamp_index
+            rows = [row[:i] + (datetime.datetime.fromtimestamp(row[i]).isoformat(),) + row[i + 1:] for row in rows]
+        if self.format == "ndjson":
+            names = self._names
+            return "".join(json.dumps(dict(zip(names, row)), ensure_ascii=False) + "\n" for row in rows).encode("utf-8")
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        if header:
+            writer.writerow(self._names)
+        writer.writerows(rows)
+        return buffer.getvalue().encode("utf-8")
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        """Yields encoded chunks until the rows run out, then releases the connection."""
+        try:
+            header = self.format == "csv"
+            if header:
+                yield self._encode([], header=True)
+            while True:
+                rows = await self._run(self._fetch, retry=True)
+                if not rows:
+                    break
+                yield self._encode(rows, header=False)
+        finally:
+            self.close()
+
+    def _release(self) -> None:
+        if self._cursor is not None:
+            self._cursor.close()
+        if self._conn is not None:
+            get_pool().release(self._conn)
+        self._cursor = self._conn = None
+        if self._has_slot:
+            self._has_slot = False
+            _release_export_slot()
+
+    def close(self) -> None:
+        """Releases the connection, interrupting a batch that is still being read."""
+        if self._closed:
+            return
+        self._closed = True
+        pending = self._pending
+        if pending is not None and not pending.done():
+            if self._conn is not None:
+                self._conn.interrupt()
+            # The worker still holds the connection: release it once the job has finished
+            pending.add_done_callback(lambda task: (task.cancelled() or task.exception(), self._release()))
+        else:
+            self._release()
@@ -0,0 +1,171 @@
+"""Compiles `VisitaFilterInput` trees into SQL WHERE clauses.
+
+A filter is split into a *shape* (which fields, operators and list lengths appear, and how
+they nest under AND/OR) and a flat parameter vector. The SQL text depends only on the
+shape, so it is rendered once per distinct shape and cached; requests that differ only
+in their values reuse the same SQL text, which also lets sqlite3's statement cache hit.
+"""
+import os
+import datetime
+from functools import lru_cache
+from typing import Any, FrozenSet, Hashable, List, NamedTuple, Optional, Tuple
+
+from warehouse import FIELD_MAPPING
+
+FILTER_CACHE_SIZE = int(os.environ.get("FILTER_CACHE_SIZE", "1024"))  # Distinct filter shapes kept
+
+# Operators per filter input type, in the order their conditions are emitted
+STRING_OPERATORS = ("equals", "notEquals", "contains", "startsWith", "endsWith", "In", "notIn")
+NUMERIC_OPERATORS = (
+    "equals", "notEquals", "greaterThan", "greaterThanOrEqual", "lessThan", "lessThanOrEqual",
+    "In", "notIn", "between", "notBetween",
+)
+
+# Field types as declared on VisitaFilterInput (everything else is a StringFilterInput)
+INT_FIELDS = frozenset({"id_visita", "ano", "mes", "dia", "dia_semana", "hora", "minuto"})
+DATETIME_FIELDS = frozenset({"timestamp_visita"})
+
+_SQL_OPERATORS = {
+    "equals": "= ?", "notEquals": "!= ?",
+    "contains": "LIKE ?", "startsWith": "LIKE ?", "endsWith": "LIKE ?",
+    "greaterThan": "> ?", "greaterThanOrEqual": ">= ?", "lessThan": "< ?", "lessThanOrEqual": "<= ?",
+    "between": "BETWEEN ? AND ?", "notBetween": "NOT BETWEEN ? AND ?",
+}
+_LIST_OPERATORS = ("In", "notIn")
+_RANGE_OPERATORS = ("between", "notBetween")
+
+# Shape nodes: a leaf is (field, ((operator, placeholder_count), ...));
+# a group is (leaves, and_groups, or_groups) mirroring one VisitaFilterInput level.
+Leaf = Tuple[str, Tuple[Tuple[str, int], ...]]
+
+
+class CompiledFilter(NamedTuple):
+    condition: str  # SQL boolean expression, or "" when the filter has no conditions
+    params: List[Any]
+    fields: FrozenSet[str]  # VisitaFilterInput fields referenced anywhere in the tree
+    shape: Optional[Hashable]  # None when the filter has no conditions
+
+    @property
+    def key(self) -> Hashable:
+        """Canonical, hashable identity of the filter (shape plus values)."""
+        return (self.shape, tuple(self.params))
+
+    @property
+    def where(self) -> str:
+        """The condition as a WHERE clause: " WHERE ..." or ""."""
+        return f" WHERE {self.condition}" if self.condition else ""
+
+
+def _operators_for(field_name: str) -> Tuple[str, ...]:
+    return NUMERIC_OPERATORS if field_name in INT_FIELDS or field_name in DATETIME_FIELDS else STRING_OPERATORS
+
+
+def _param(field_name: str, operator: str, value: Any) -> Any:
+    """Converts a filter value into its SQL parameter."""
+    if field_name in DATETIME_FIELDS and isinstance(value, datetime.datetime):
+        return int(value.timestamp())
+    if operator == "contains": return f"%{value}%"
+    if operator == "startsWith": return f"{value}%"
+    if operator == "endsWith": return f"%{value}"
+    return value
+
+
+def _leaf_shape(field_name: str, filter_input: Any, params: list) -> Optional[Leaf]:
+    operators = []
+    for operator in _operators_for(field_name):
+        value = getattr(filter_input, operator, None)
+        if value is None: continue
+        if operator in _RANGE_OPERATORS and len(value) != 2: continue
+        if operator in _LIST_OPERATORS or operator in _RANGE_OPERATORS:
+            params.extend(_param(field_name, operator, v) for v in value)
+            operators.append((operator, len(value)))
+        else:
+            params.append(_param(field_name, operator, value))
+            operators.append((operator, 1))
+    return (field_name, tuple(operators)) if operators else None
+
+
+def _group_shape(filter_obj: Any, params: list) -> Optional[tuple]:
+    """Walks one filter level in declaration order, collecting its shape and parameters."""
+    leaves = []
+    for field_name, f_input_val in filter_obj.__dict__.items():
+        if field_name in ("AND", "OR") or f_input_val is None or field_name not in FIELD_MAPPING: continue
+        leaf = _leaf_shape(field_name, f_input_val, params)
+        if leaf: leaves.append(leaf)
+    and_groups = tuple(g for g in (_group_shape(sub, params) for sub in (filter_obj.AND or ()) if sub) if g)
+    or_groups = tuple(g for g in (_group_shape(sub, params) for sub in (filter_obj.OR or ()) if sub) if g)
+    if not (leaves or and_groups or or_groups):
+        return None
+    return (tuple(leaves), and_groups, or_groups)
+
+
+def filter_shape(filter: Optional[Any]) -> Tuple[Optional[tuple], List[Any]]:
+    """Returns the canonical shape of `filter` and its parameter vector."""
+    params: List[Any] = []
+    shape = _group_shape(filter, params) if filter else None
+    return shape, params
+
+
+def render_leaf(field_name: str, operators: Tuple[Tuple[str, int], ...], column: Optional[str] = None) -> str:
+    """Renders the ANDed conditions of one field (e.g. `dd.nome_dominio = ?`).
+
+    `column` overrides the star-schema column, for tables that store the field under another name.
+    """
+    if column is None:
+        alias, column_name = FIELD_MAPPING[field_name]
+        column = f"{alias}.{column_name}"
+    conditions = []
+    for operator, count in operators:
+        if operator in _LIST_OPERATORS:
+            placeholders = ', '.join('?' for _ in range(count))
+            conditions.append(f"{column} {'IN' if operator == 'In' else 'NOT IN'} ({placeholders})")
+        else:
+            conditions.append(f"{column} {_SQL_OPERATORS[operator]}")
+    return " AND ".join(conditions)
+
+
+def render_group(group: tuple, render_leaf_fn) -> str:
+    """Renders a shape group, using `render_leaf_fn(field, operators)` for its leaves."""
+    leaves, and_groups, or_groups = group
+    parts = []
+    direct_field_strings = []
+    for leaf in leaves:
+        cond_str = render_leaf_fn(*leaf)
+        direct_field_strings.append(f"({cond_str})" if " AND " in cond_str else cond_str)
+    if direct_field_strings:
+        parts.append(f"({' AND '.join(direct_field_strings)})" if len(direct_field_strings) > 1 else direct_field_strings[0])
+    if and_groups:
+        parts.append(f"({' AND '.join(render_group(g, render_leaf_fn) for g in and_groups)})")
+    if or_groups:
+        parts.append(f"({' OR '.join(render_group(g, render_leaf_fn) for g in or_groups)})")
+    return " AND ".join(parts)
+
+
+def shape_fields(shape: Optional[tuple]) -> FrozenSet[str]:
+    """Returns the fields referenced anywhere in a shape."""
+    if shape is None:
+        return frozenset()
+    leaves, and_groups, or_groups = shape
+    fields = {field_name for field_name, _ in leaves}
+    for group in and_groups + or_groups:
+        fields |= shape_fields(group)
+    return frozenset(fields)
+
+
+@lru_cache(maxsize=FILTER_CACHE_SIZE)
+def _render_shape(shape: Optional[tuple]) -> Tuple[str, FrozenSet[str]]:
+    if shape is None:
+        return "", frozenset()
+    return render_group(shape, render_leaf), shape_fields(shape)
+
+
+def compile_filter(filter: Optional[Any]) -> CompiledFilter:
+    """Compiles a VisitaFilterInput into a SQL condition, reusing the SQL text cached for its shape."""
+    shape, params = filter_shape(filter)
+    condition, fields = _render_shape(shape)
+    return CompiledFilter(condition, params, fields, shape)
+
+
+def filter_cache_info():
+    """Returns hit/miss statistics of the compiled-shape cache."""
+    return _render_shape.cache_info()
@@ -0,0 +1,98 @@
+"""GraphQL filter input types, and parsing of filters and field lists sent as plain JSON.
+
+`VisitaFilterInput` is shared by `getVisitas`, `aggregateVisitas` and the export endpoint.
+`parse_filter` coerces JSON against a schema holding only the filter types, so REST handlers
+and scripts can parse filters without importing the GraphQL schema and its resolvers.
+"""
+import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import strawberry
+from graphql import GraphQLError
+from graphql.utilities import coerce_input_value
+from strawberry.types.arguments import convert_argument
+from strawberry.utils.str_converters import to_camel_case
+
+from warehouse import VISITA_FIELDS
+
+_FIELDS_BY_GRAPHQL_NAME = {to_camel_case(field): field for field in VISITA_FIELDS}
+
+
+# Define generic InputFilter types
+@strawberry.input
+class StringFilterInput:
+    equals: Optional[str] = None; notEquals: Optional[str] = None; contains: Optional[str] = None
+    startsWith: Optional[str] = None; endsWith: Optional[str] = None
+    In: Optional[List[str]] = None; notIn: Optional[List[str]] = None
+
+@strawberry.input
+class IntFilterInput:
+    equals: Optional[int] = None; notEquals: Optional[int] = None
+    greaterThan: Optional[int] = None; greaterThanOrEqual: Optional[int] = None
+    lessThan: Optional[int] = None; lessThanOrEqual: Optional[int] = None
+    In: Optional[List[int]] = None; notIn: Optional[List[int]] = None
+    between: Optional[tuple[int, int]] = None; notBetween: Optional[tuple[int, int]] = None
+
+@strawberry.input
+class DateTimeFilterInput:
+    equals: Optional[datetime.datetime] = None; notEquals: Optional[datetime.datetime] = None
+    greaterThan: Optional[datetime.datetime] = None; greaterThanOrEqual: Optional[datetime.datetime] = None
+    lessThan: Optional[datetime.datetime] = None; lessThanOrEqual: Optional[datetime.datetime] = None
+    In: Optional[List[datetime.datetime]] = None; notIn: Optional[List[datetime.datetime]] = None
+    between: Optional[tuple[datetime.datetime, datetime.datetime]] = None
+    notBetween: Optional[tuple[datetime.datetime, datetime.datetime]] = None
+
+# Define the VisitaFilterInput
+@strawberry.input
+class VisitaFilterInput:
+    id_visita: Optional[IntFilterInput] = None; timestamp_visita: Optional[DateTimeFilterInput] = None
+    nome_dominio: Optional[StringFilterInput] = None; caminho_pagina: Optional[StringFilterInput] = None
+    url_completa: Optional[StringFilterInput] = None; nome_navegador: Optional[StringFilterInput] = None
+    versao_navegador: Optional[StringFilterInput] = None; motor_renderizacao_navegador: Optional[StringFilterInput] = None
+    so_usuario_navegador: Optional[StringFilterInput] = None; utm_source: Optional[StringFilterInput] = None
+    utm_medium: Optional[StringFilterInput] = None; utm_campaign: Optional[StringFilterInput] = None
+    utm_term: Optional[StringFilterInput] = None; utm_content: Optional[StringFilterInput] = None
+    id_usuario_sessao: Optional[StringFilterInput] = None; id_sessao_navegador: Optional[StringFilterInput] = None
+    tipo_dispositivo: Optional[StringFilterInput] = None; marca_dispositivo: Optional[StringFilterInput] = None
+    modelo_dispositivo: Optional[StringFilterInput] = None; resolucao_tela: Optional[StringFilterInput] = None
+    endereco_ip: Optional[StringFilterInput] = None; data_completa: Optional[StringFilterInput] = None
+    ano: Optional[IntFilterInput] = None; mes: Optional[IntFilterInput] = None; dia: Optional[IntFilterInput] = None
+    dia_semana: Optional[IntFilterInput] = None; hora: Optional[IntFilterInput] = None; minuto: Optional[IntFilterInput] = None
+    pais_geografia: Optional[StringFilterInput] = None; regiao_geografia: Optional[StringFilterInput] = None
+    cidade_geografia: Optional[StringFilterInput] = None; url_referencia: Optional[StringFilterInput] = None
+    tipo_referencia: Optional[StringFilterInput] = None
+    AND: Optional[List['VisitaFilterInput']] = None; OR: Optional[List['VisitaFilterInput']] = None
+
+@strawberry.type
+class _FilterQuery:
+    """The smallest schema that contains `VisitaFilterInput` (used by `parse_filter`)."""
+
+    @strawberry.field
+    def visitas(self, filter: Optional[VisitaFilterInput] = None) -> bool:
+        return True
+
+
+_filter_schema = strawberry.Schema(query=_FilterQuery)
+
+
+def parse_filter(value: Optional[Dict[str, Any]]) -> Optional[VisitaFilterInput]:
+    """Coerces `VisitaFilterInput` JSON (GraphQL field names) exactly as the GraphQL endpoint does."""
+    if value is None:
+        return None
+    try:
+        coerced = coerce_input_value(value, _filter_schema._schema.get_type("VisitaFilterInput"))
+    except GraphQLError as e:
+        raise ValueError(e.message) from None
+    return convert_argument(coerced, VisitaFilterInput, _filter_schema.schema_converter.scalar_registry, _filter_schema.config)
+
+
+def parse_fields(names: Optional[Sequence[str]]) -> Tuple[str, ...]:
+    """Maps `VisitaType` GraphQL field names to Python names (all fields when `names` is None)."""
+    if names is None:
+        return VISITA_FIELDS
+    if isinstance(names, str) or not names:
+        raise ValueError("`fields` must be a non-empty list of VisitaType field names.")
+    unknown = [name for name in names if name not in _FIELDS_BY_GRAPHQL_NAME]
+    if unknown:
+        raise ValueError(f"Unknown VisitaType fields: {', '.join(map(str, unknown))}.")
+    return tuple(dict.fromkeys(_FIELDS_BY_GRAPHQL_NAME[name] for name in names))
@@ -0,0 +1,322 @@
+"""Synthetic star-schema data at production-like scale, for load testing.
+
+Dimensions get configurable cardinalities, and facts pick their keys with a Zipf skew
+(rank 1 = key 1 is the most popular), so filters, groupings and caches meet realistic
+distributions. `DimTempo` holds one row per minute of the time span, and facts are spread
+uniformly over it, with `id_visita` ascending in time like live traffic.
+
+Facts are generated in chunks of `--chunk-rows` by worker processes, each into its own
+scratch database, and copied into the target in chunk order. Each chunk has its own RNG
+seeded from `--seed` and the chunk number, so the output depends on the seed and the sizes
+but not on the number of workers. The target is built in a temporary file with loading
+pragmas (no journal, no fsync, exclusive lock) and the non-unique indexes of schema.sql are
+created only after the load. The file is renamed into place when complete.
+
+Usage:
+    python generate_data.py --rows 10000000 --workers 8 [--database database.db] [--force]
+        [--seed 42] [--days 90] [--zipf 1.1] [--cardinality ds=2000000 --cardinality dd=500]
+"""
+import os
+import sys
+import math
+import time
+import random
+import sqlite3
+import argparse
+import datetime
+import ipaddress
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from db_pool import DATABASE_FILE
+from rollups import rebuild_rollups
+from warehouse import DIMENSIONS, DIMENSIONS_BY_ALIAS, FACT_TABLE
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema.sql")
+TIME_ALIAS = "dt"  # One row per minute of the span; not configurable
+FACT_COLUMNS = ("id_visita",) + tuple(dim.key for dim in DIMENSIONS) + ("timestamp_visita",)
+
+# Keys per dimension (sessions and IPs scale with the fact count unless given)
+DEFAULT_CARDINALITY = {"dd": 1000, "dp": 20000, "du": 200000, "dn": 300, "dut": 5000, "ddi": 2000, "dg": 10000, "dr": 20000}
+SCALED_CARDINALITY = {"ds": 8, "dip": 20}  # One key per this many facts
+DEFAULT_SKEW = {"ds": 0.0, "dip": 0.3}  # Sessions and IPs are close to uniform; others use --zipf
+
+_BROWSERS = [("Chrome", "Blink"), ("Safari", "WebKit"), ("Firefox", "Gecko"), ("Edge", "Blink"), ("Opera", "Blink"), ("Samsung Internet", "Blink")]
+_SYSTEMS = ["Windows 10", "Windows 11", "macOS Sonoma", "Ubuntu 22.04", "Android 14", "iOS 17", "ChromeOS", "Fedora 39"]
+_SOURCES = [("google", "organic"), ("google", "cpc"), ("facebook", "social"), ("instagram", "social"), ("newsletter", "email"), ("bing", "cpc")]
+_DEVICES = [("Mobile", ["Apple", "Samsung", "Xiaomi", "Motorola"], ["390x844", "412x915", "360x800"]),
+            ("Desktop", ["Dell", "HP", "Lenovo", "Apple"], ["1920x1080", "2560x1440", "1366x768"]),
+            ("Tablet", ["Apple", "Samsung", "Lenovo"], ["810x1080", "800x1280"])]
+_COUNTRIES = ["Brazil", "USA", "Portugal", "Argentina", "Mexico", "Canada", "Germany", "India", "Japan", "Chile", "Spain", "France"]
+_REFERRERS = ["Organic", "Social", "Referral", "Email", "Paid"]
+_TLDS = ["com", "com.br", "org", "net", "io"]
+_SECTIONS = ["blog", "products", "docs", "news", "help", "category"]
+
+
+class Options(NamedTuple):
+    rows: int
+    seed: int
+    start: datetime.datetime
+    minutes: int
+    cardinality: Dict[str, int]  # alias -> keys
+    skew: Dict[str, float]  # alias -> Zipf exponent (0 = uniform)
+    null_fraction: float  # Share of facts with a NULL key, per left-joined dimension
+    chunk_rows: int
+
+
+def _dimension_rows(alias: str, count: int, rng: random.Random, options: Options) -> List[tuple]:
+    """Attribute tuples, in `Dimension.fields` order, for keys 1..count (all natural keys distinct)."""
+    if alias == "dd":
+        return [(f"site{i:07d}.{_TLDS[i % len(_TLDS)]}",) for i in range(count)]
+    if alias == "dp":
+        return [(f"/{_SECTIONS[i % len(_SECTIONS)]}/page-{i:08d}",) for i in range(count)]
+    if alias == "du":
+        return [(f"https://site{i % 1000:07d}.com/{_SECTIONS[i % len(_SECTIONS)]}/page-{i:09d}",) for i in range(count)]
+    if alias == "dn":
+        rows = []
+        for i in range(count):
+            name, engine = _BROWSERS[i % len(_BROWSERS)]
+            system = _SYSTEMS[(i // len(_BROWSERS)) % len(_SYSTEMS)]
+            rows.append((name, f"{90 + i // (len(_BROWSERS) * len(_SYSTEMS))}.0", engine, system))
+        return rows
+    if alias == "dut":
+        rows = []
+        for i in range(count):
+            source, medium = _SOURCES[i % len(_SOURCES)]
+            rows.append((source, medium, f"campaign-{i:06d}", f"term-{i % 97}" if i % 3 == 0 else None,
+                         f"ad-{i % 13}" if i % 4 == 0 else None))
+        return rows
+    if alias == "ds":
+        users = max(1, count // 3)
+        return [(f"user-{rng.randrange(users):08d}" if rng.random() < 0.4 else None, f"session-{i:010d}") for i in range(count)]
+    if alias == "ddi":
+        rows = []
+        for i in range(count):
+            kind, brands, resolutions = _DEVICES[i % len(_DEVICES)]
+            brand = brands[(i // len(_DEVICES)) % len(brands)]
+            rows.append((kind, brand, f"{brand} M{i:05d}", resolutions[i % len(resolutions)]))
+        return rows
+    if alias == "dip":
+        first = int(ipaddress.IPv4Address("11.0.0.0"))
+        return [(str(ipaddress.IPv4Address(first + i)),) for i in range(count)]
+    if alias == "dt":
+        rows = []
+        for i in range(count):
+            moment = options.start + datetime.timedelta(minutes=i)
+            rows.append((moment.strftime("%Y-%m-%d %H:%M:%S"), moment.year, moment.month, moment.day,
+                         moment.weekday(), moment.hour, moment.minute))
+        return rows
+    if alias == "dg":
+        return [(country, f"{country} Region {i % 27:02d}", f"City {i:06d}")
+                for i, country in zip(range(count), itertools.cycle(_COUNTRIES))]
+    if alias == "dr":
+        return [(f"https://referrer{i:06d}.example/" if i % len(_REFERRERS) != 0 else None, _REFERRERS[i % len(_REFERRERS)])
+                for i in range(count)]
+    raise ValueError(f"Unknown dimension alias: {alias}")
+
+
+def _cumulative_weights(count: int, skew: float) -> Optional[List[float]]:
+    """Zipf cumulative weights over ranks 1..count, or None for a uniform choice."""
+    if skew <= 0:
+        return None
+    return list(itertools.accumulate(1.0 / rank ** skew for rank in range(1, count + 1)))
+
+
+_worker_weights: Dict[Tuple[int, float], Optional[List[float]]] = {}
+_worker_minutes: Dict[Tuple[datetime.datetime, int], List[int]] = {}
+
+
+def _generate_chunk(path: str, chunk: int, options: Options) -> str:
+    """Writes the facts of `chunk` to a scratch database at `path` (runs in a worker process)."""
+    first = chunk * options.chunk_rows
+    count = min(options.chunk_rows, options.rows - first)
+    chunks = math.ceil(options.rows / options.chunk_rows)
+    rng = random.Random(f"{options.seed}-facts-{chunk}")
+    key = (options.start, options.minutes)
+    if key not in _worker_minutes:  # Epoch second of each minute, local time like seed_data.py
+        _worker_minutes[key] = [int(time.mktime((options.start + datetime.timedelta(minutes=i)).timetuple()))
+                                for i in range(options.minutes)]
+    minute_ts = _worker_minutes[key]
+
+    # This chunk's share of the span, so id_visita grows with timestamp_visita across chunks
+    low = options.minutes * chunk // chunks
+    high = max(options.minutes * (chunk + 1) // chunks, low + 1)
+    visits = sorted((minute_ts[m] + rng.randrange(60), m) for m in rng.choices(range(low, high), k=count))
+    columns = [range(first + 1, first + count + 1)]
+    for dim in DIMENSIONS:
+        if dim.alias == TIME_ALIAS:
+            columns.append([m + 1 for _, m in visits])
+            continue
+        cardinality, skew = options.cardinality[dim.alias], options.skew[dim.alias]
+        weights_key = (cardinality, skew)
+        if weights_key not in _worker_weights:
+            _worker_weights[weights_key] = _cumulative_weights(cardinality, skew)
+        keys = rng.choices(range(1, cardinality + 1), cum_weights=_worker_weights[weights_key], k=count)
+        if dim.left_join and options.null_fraction > 0:
+            p, draw = options.null_fraction, rng.random
+            keys = [None if draw() < p else k for k in keys]
+        columns.append(keys)
+    columns.append([timestamp for timestamp, _ in visits])
+
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute(f"CREATE TABLE {FACT_TABLE} ({', '.join(FACT_COLUMNS)})")
+        conn.executemany(
+            f"INSERT INTO {FACT_TABLE} VALUES ({', '.join('?' for _ in FACT_COLUMNS)})", zip(*columns)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return path
+
+
+def _schema_statements() -> Tuple[List[str], List[str]]:
+    """Splits schema.sql into table DDL and the (deferred) CREATE INDEX statements."""
+    scratch = sqlite3.connect(":memory:")
+    with open(SCHEMA_FILE) as f:
+        scratch.executescript(f.read())
+    rows = scratch.execute("SELECT type, sql FROM sqlite_master WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite%' ORDER BY rowid").fetchall()
+    scratch.close()
+    return [sql for kind, sql in rows if kind == "table"], [sql for kind, sql in rows if kind == "index"]
+
+
+def generate(database: str, options: Options, workers: int = 1, build_rollups: bool = True, log=print) -> None:
+    """Builds a complete database at `database` (which must not exist)."""
+    if os.path.exists(database):
+        raise FileExistsError(f"{database} already exists.")
+    building = f"{database}.building"
+    scratch_dir = f"{database}.chunks"
+    for path in (building, f"{building}-journal"):
+        if os.path.exists(path):
+            os.remove(path)
+    os.makedirs(scratch_dir, exist_ok=True)
+    tables, indexes = _schema_statements()
+    conn = sqlite3.connect(building, isolation_level=None)
+    try:
+        for pragma in ("journal_mode=OFF", "synchronous=OFF", "locking_mode=EXCLUSIVE", "temp_store=MEMORY", "cache_size=-262144"):
+            conn.execute(f"PRAGMA {pragma}")
+        for sql in tables:
+            conn.execute(sql)
+
+        started = time.monotonic()
+        conn.execute("BEGIN")
+        for dim in DIMENSIONS:
+            count = options.minutes if dim.alias == TIME_ALIAS else options.cardinality[dim.alias]
+            rows = _dimension_rows(dim.alias, count, random.Random(f"{options.seed}-{dim.table}"), options)
+            columns = (dim.key,) + tuple(dim.fields.values())
+            conn.executemany(
+                f"INSERT INTO {dim.table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                ((i,) + row for i, row in enumerate(rows, 1))
+            )
+        conn.execute("COMMIT")
+        log(f"Dimensions loaded in {time.monotonic() - started:.1f}s")
+
+        chunks = math.ceil(options.rows / options.chunk_rows)
+        paths = [os.path.join(scratch_dir, f"chunk-{chunk:06d}.db") for chunk in range(chunks)]
+        loaded = 0
+
+        def copy(path: str) -> None:
+            nonlocal loaded
+            conn.execute("ATTACH DATABASE ? AS chunk", (path,))
+            conn.execute(f"INSERT INTO main.{FACT_TABLE} ({', '.join(FACT_COLUMNS)}) SELECT * FROM chunk.{FACT_TABLE}")
+            conn.execute("DETACH DATABASE chunk")
+            os.remove(path)
+            loaded = conn.execute(f"SELECT MAX(id_visita) FROM {FACT_TABLE}").fetchone()[0] or 0
+            log(f"Facts: {loaded}/{options.rows} ({time.monotonic() - started:.1f}s)")
+
+        if workers <= 1:
+            for chunk, path in enumerate(paths):
+                copy(_generate_chunk(path, chunk, options))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                pending = deque()  # Copied in chunk order; at most 2 chunks per worker are on disk ahead of the copy
+                for chunk, path in enumerate(paths):
+                    pending.append(pool.submit(_generate_chunk, path, chunk, options))
+                    if len(pending) >= 2 * workers:
+                        copy(pending.popleft().result())
+                while pending:
+                    copy(pending.popleft().result())
+
+        for sql in indexes:
+            conn.execute(sql)
+        log(f"Indexes built ({time.monotonic() - started:.1f}s)")
+        if build_rollups:
+            rebuild_rollups(conn)
+            log(f"Rollups built ({time.monotonic() - started:.1f}s)")
+        conn.execute("ANALYZE")
+        conn.execute("PRAGMA locking_mode=NORMAL")
+        conn.execute("PRAGMA journal_mode=WAL")  # Releases the exclusive lock
+    finally:
+        conn.close()
+        for name in os.listdir(scratch_dir):  # Chunks left behind by a failed run
+            os.remove(os.path.join(scratch_dir, name))
+        os.rmdir(scratch_dir)
+    os.replace(building, database)
+
+
+def parse_options(args: argparse.Namespace) -> Options:
+    overrides = {}
+    for item in args.cardinality:
+        alias, _, value = item.partition("=")
+        if alias not in DIMENSIONS_BY_ALIAS or alias == TIME_ALIAS or not value.isdigit() or int(value) < 1:
+            raise ValueError(f"Invalid --cardinality {item!r}: use ALIAS=COUNT with a dimension alias other than {TIME_ALIAS}.")
+        overrides[alias] = int(value)
+    cardinality = {**DEFAULT_CARDINALITY, **{alias: max(1, args.rows // per) for alias, per in SCALED_CARDINALITY.items()}, **overrides}
+    skew = {dim.alias: DEFAULT_SKEW.get(dim.alias, args.zipf) for dim in DIMENSIONS if dim.alias != TIME_ALIAS}
+    for item in args.skew:
+        alias, _, value = item.partition("=")
+        if alias not in skew:
+            raise ValueError(f"Invalid --skew {item!r}: use ALIAS=EXPONENT with a dimension alias other than {TIME_ALIAS}.")
+        skew[alias] = float(value)
+    if args.rows < 1 or args.days <= 0 or args.chunk_rows < 1 or not 0 <= args.null_fraction < 1:
+        raise ValueError("--rows, --days and --chunk-rows must be positive and --null-fraction in [0, 1).")
+    return Options(
+        rows=args.rows, seed=args.seed, start=datetime.datetime.fromisoformat(args.start),
+        minutes=max(1, round(args.days * 24 * 60)), cardinality=cardinality, skew=skew,
+        null_fraction=args.null_fraction, chunk_rows=args.chunk_rows,
+    )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Generate a synthetic visits database for load testing.")
+    parser.add_argument("--database", default=DATABASE_FILE)
+    parser.add_argument("--force", action="store_true", help="Replace an existing database file.")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Number of facts (up to 100M).")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--start", default="2024-01-01T00:00:00", help="Start of the time span (local time).")
+    parser.add_argument("--days", type=float, default=90, help="Length of the time span; DimTempo has one row per minute.")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent for picking dimension keys (0 = uniform).")
+    parser.add_argument("--skew", action="append", default=[], metavar="ALIAS=EXPONENT", help="Per-dimension Zipf exponent.")
+    parser.add_argument("--cardinality", action="append", default=[], metavar="ALIAS=COUNT", help="Keys per dimension.")
+    parser.add_argument("--null-fraction", type=float, default=0.3, help="Share of NULL UTM, geography and referrer keys.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-rows", type=int, default=1_000_000, help="Facts generated per task (changes the output).")
+    parser.add_argument("--skip-rollups", action="store_true", help="Leave the rollup tables to be built by `python rollups.py`.")
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        options = parse_options(args)
+    except ValueError as e:
+        parser.error(str(e))
+    if os.path.exists(args.database):
+        if not args.force:
+            parser.error(f"{args.database} already exists (use --force to replace it).")
+        os.remove(args.database)
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(args.database + suffix):
+                os.remove(args.database + suffix)
+    generate(args.database, options, workers=args.workers, build_rollups=not args.skip_rollups,
+             log=lambda message: print(message, file=sys.stderr))
+    print(f"Database '{args.database}' generated with {options.rows} visits.")
+
+
+if __name__ == '__main__':
+    main()
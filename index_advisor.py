@@ -0,0 +1,272 @@
+"""Index advisor for the `getVisitas` statements.
+
+When `INDEX_ADVISOR_LOG` is set, the resolver records every distinct count/page statement
+it runs (one SQL text per line; values are never recorded, only placeholders). The advisor
+replays those statements through `EXPLAIN QUERY PLAN` on an in-memory clone of the schema
+(including `sqlite_stat1`), flags scans of `FatoVisitas` and temp B-tree sorts, and
+tries candidate `(foreign key, timestamp_visita)` indexes on the clone to see which ones
+remove them. `--apply` creates the recommended indexes on the real database.
+
+Usage:
+    python index_advisor.py --log statements.log [--database database.db] [--apply]
+    python index_advisor.py --ensure  # Create missing managed indexes, drop the ones they supersede
+"""
+import os
+import re
+import sqlite3
+import argparse
+import threading
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from db_pool import DATABASE_FILE
+from warehouse import FACT_ALIAS, FACT_TABLE
+
+INDEX_ADVISOR_LOG = os.environ.get("INDEX_ADVISOR_LOG", "")  # Statement log file; empty disables recording
+
+# Managed index set on the fact table (mirrors schema.sql); name -> columns
+MANAGED_INDEXES: Dict[str, Tuple[str, ...]] = {
+    "idx_fato_dominio_timestamp": ("id_dim_dominio", "timestamp_visita"),
+    "idx_fato_pagina": ("id_dim_pagina",),
+    "idx_fato_url": ("id_dim_url",),
+    "idx_fato_navegador_timestamp": ("id_dim_navegador", "timestamp_visita"),
+    "idx_fato_utm_timestamp": ("id_dim_utm", "timestamp_visita"),
+    "idx_fato_sessao": ("id_dim_sessao",),
+    "idx_fato_dispositivo_timestamp": ("id_dim_dispositivo", "timestamp_visita"),
+    "idx_fato_ip": ("id_dim_ip",),
+    "idx_fato_tempo": ("id_dim_tempo",),
+    "idx_fato_geografia_timestamp": ("id_dim_geografia", "timestamp_visita"),
+    "idx_fato_referencia_timestamp": ("id_dim_referencia", "timestamp_visita"),
+    "idx_fato_timestamp": ("timestamp_visita",),
+}
+
+# Indexes of earlier schema.sql versions that a managed `<name>_timestamp` index replaced
+SUPERSEDED_INDEXES: Dict[str, Tuple[str, ...]] = {
+    f"idx_fato_{dim}": (f"id_dim_{dim}",)
+    for dim in ("dominio", "navegador", "utm", "dispositivo", "geografia", "referencia")
+}
+
+_FACT_KEY_PREDICATE = re.compile(rf"\b{FACT_ALIAS}\.(id_dim_\w+) (?:IN|=)")
+
+
+# --- Recording ---
+class StatementRecorder:
+    """Appends each distinct SQL text to a log file once per process."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._seen = set()
+        self._lock = threading.Lock()
+
+    def record(self, sql: str) -> None:
+        statement = " ".join(sql.split())
+        if statement in self._seen:
+            return
+        with self._lock:
+            if statement in self._seen:
+                return
+            self._seen.add(statement)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(statement + "\n")
+
+
+_recorder: Optional[StatementRecorder] = StatementRecorder(INDEX_ADVISOR_LOG) if INDEX_ADVISOR_LOG else None
+
+
+def record_statement(sql: str) -> None:
+    """Records `sql` for the advisor when `INDEX_ADVISOR_LOG` is set."""
+    if _recorder is not None:
+        _recorder.record(sql)
+
+
+def load_statements(path: str) -> List[str]:
+    """Reads the distinct statements of a log file, in first-seen order."""
+    with open(path, encoding="utf-8") as f:
+        return list(dict.fromkeys(line.strip() for line in f if line.strip()))
+
+
+# --- Plan analysis ---
+class PlanIssues(NamedTuple):
+    full_scans: int  # SCAN of the fact table (of a whole index, if the statement has a WHERE)
+    temp_sorts: int  # USE TEMP B-TREE FOR ORDER BY / GROUP BY / DISTINCT
+
+    @property
+    def total(self) -> int:
+        return self.full_scans + self.temp_sorts
+
+
+class Advice(NamedTuple):
+    statement: str
+    plan: List[str]
+    issues: PlanIssues
+    recommended: Optional[Tuple[str, Tuple[str, ...]]]  # (index name, columns) or None
+    issues_after: Optional[PlanIssues]
+
+
+def explain(conn: sqlite3.Connection, sql: str, params: Optional[Sequence[Any]] = None) -> Tuple[List[str], PlanIssues]:
+    """Returns the `EXPLAIN QUERY PLAN` lines of `sql` and their issues.
+
+    Placeholders are bound to `params`, or to NULL when only the statement text is known.
+    """
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", [None] * sql.count("?") if params is None else params).fetchall()
+    plan = [row[3] for row in rows]
+    # Walking a whole index counts too when the statement filters rows (it should SEARCH instead)
+    filtered = " WHERE " in sql
+    full_scans = sum(
+        1 for line in plan
+        if line.split()[:2] in (["SCAN", FACT_ALIAS], ["SCAN", FACT_TABLE]) and (filtered or "USING" not in line)
+    )
+    temp_sorts = sum(1 for line in plan if "USE TEMP B-TREE" in line)
+    return plan, PlanIssues(full_scans, temp_sorts)
+
+
+def clone_schema(conn: sqlite3.Connection) -> sqlite3.Connection:
+    """Copies the schema and planner statistics (no rows) into an in-memory database."""
+    clone = sqlite3.connect(":memory:")
+    for (sql,) in conn.execute(
+        "SELECT sql FROM sqlite_master WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%' ORDER BY type = 'index'"
+    ):
+        clone.execute(sql)
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone():
+        clone.execute("ANALYZE")  # Creates an empty sqlite_stat1
+        clone.executemany("INSERT INTO sqlite_stat1 VALUES (?, ?, ?)", conn.execute("SELECT tbl, idx, stat FROM sqlite_stat1"))
+        clone.execute("ANALYZE sqlite_master")  # Reloads the copied statistics
+    clone.commit()
+    return clone
+
+
+def existing_indexes(conn: sqlite3.Connection, table: str = FACT_TABLE) -> Dict[str, Tuple[str, ...]]:
+    """Returns the indexes of `table` as name -> columns."""
+    indexes = {}
+    for row in conn.execute(f"PRAGMA index_list({table})").fetchall():
+        name = row[1]
+        indexes[name] = tuple(info[2] for info in conn.execute(f"PRAGMA index_info({name})"))
+    return indexes
+
+
+def index_name(columns: Iterable[str]) -> str:
+    return "idx_fato_" + "_".join(column.replace("id_dim_", "").replace("_visita", "") for column in columns)
+
+
+def candidate_indexes(sql: str) -> List[Tuple[str, ...]]:
+    """Candidate indexes for a statement: each filtered foreign key followed by the sort key."""
+    keys = dict.fromkeys(_FACT_KEY_PREDICATE.findall(sql))
+    return [(key, "timestamp_visita") for key in keys] + [("timestamp_visita",)]
+
+
+def advise(conn: sqlite3.Connection, statements: Iterable[str]) -> List[Advice]:
+    """Explains each statement on a schema clone and tries the candidate indexes for flagged ones."""
+    clone = clone_schema(conn)
+    advice = []
+    for sql in statements:
+        try:
+            plan, issues = explain(clone, sql)
+        except sqlite3.Error as e:
+            print(f"Skipping statement that no longer compiles ({e}): {sql}")
+            continue
+        best = None
+        if issues.total:
+            present = set(existing_indexes(clone).values())
+            for columns in candidate_indexes(sql):
+                if columns in present:
+                    continue
+                clone.execute(f"CREATE INDEX advisor_candidate ON {FACT_TABLE} ({', '.join(columns)})")
+                try:
+                    _, after = explain(clone, sql)
+                finally:
+                    clone.execute("DROP INDEX advisor_candidate")
+                if after.total < issues.total and (best is None or after.total < best[1].total):
+                    best = (columns, after)
+        advice.append(Advice(
+            sql, plan, issues,
+            (index_name(best[0]), best[0]) if best else None,
+            best[1] if best else None,
+        ))
+    clone.close()
+    return advice
+
+
+def create_indexes(conn: sqlite3.Connection, indexes: Iterable[Tuple[str, Tuple[str, ...]]]) -> List[str]:
+    """Creates the given indexes if missing, refreshes statistics and returns the names created."""
+    present = existing_indexes(conn)
+    created = []
+    for name, columns in indexes:
+        if name in present or columns in present.values():
+            continue
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {FACT_TABLE} ({', '.join(columns)})")
+        created.append(name)
+    if created:
+        conn.execute("ANALYZE")
+    conn.commit()
+    return created
+
+
+def ensure_managed_indexes(conn: sqlite3.Connection) -> List[str]:
+    """Creates any index of `MANAGED_INDEXES` missing from a database built from an older schema."""
+    return create_indexes(conn, MANAGED_INDEXES.items())
+
+
+def drop_superseded_indexes(conn: sqlite3.Connection) -> List[str]:
+    """Drops the single-column foreign-key indexes of older schemas, and returns their names.
+
+    `(id_dim_x, timestamp_visita)` serves the same lookups, so the old index only costs
+    writes and space. Only names from `SUPERSEDED_INDEXES` are dropped, and only while they
+    still have their original definition: an index an operator changed (partial, collated
+    or on other columns) is kept. Run after `ensure_managed_indexes`, so the covering index
+    exists before the old one goes.
+    """
+    present = existing_indexes(conn)
+    plain = {row[1] for row in conn.execute(f"PRAGMA index_list({FACT_TABLE})") if row[3] == "c" and not row[2] and not row[4]}
+    dropped = []
+    for name, columns in SUPERSEDED_INDEXES.items():
+        if present.get(name) != columns or name not in plain:
+            continue
+        covering = f"{name}_timestamp"
+        if present.get(covering) != MANAGED_INDEXES[covering]:
+            continue  # Keep the old index until its replacement exists
+        collations = {info[4] for info in conn.execute(f"PRAGMA index_xinfo({name})") if info[5]}
+        if collations == {"BINARY"}:
+            conn.execute(f"DROP INDEX {name}")
+            dropped.append(name)
+    conn.commit()
+    return dropped
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Suggest indexes for recorded getVisitas statements.")
+    parser.add_argument("--database", default=DATABASE_FILE)
+    parser.add_argument("--log", default=INDEX_ADVISOR_LOG, help="Statement log written with INDEX_ADVISOR_LOG.")
+    parser.add_argument("--apply", action="store_true", help="Create the recommended indexes.")
+    parser.add_argument("--ensure", action="store_true", help="Create missing managed indexes and drop superseded ones.")
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.database)
+    try:
+        if args.ensure:
+            created = ensure_managed_indexes(conn)
+            print(f"Created managed indexes: {', '.join(created)}" if created else "All managed indexes exist.")
+            dropped = drop_superseded_indexes(conn)
+            if dropped:
+                print(f"Dropped superseded indexes: {', '.join(dropped)}")
+        if not args.log:
+            if not args.ensure:
+                parser.error("--log (or INDEX_ADVISOR_LOG) is required to advise.")
+            return
+        recommended = {}
+        for item in advise(conn, load_statements(args.log)):
+            status = "ok" if not item.issues.total else f"{item.issues.full_scans} full scan(s), {item.issues.temp_sorts} temp sort(s)"
+            print(f"[{status}] {item.statement}")
+            for line in item.plan:
+                print(f"    {line}")
+            if item.recommended:
+                name, columns = item.recommended
+                print(f"    -> CREATE INDEX {name} ON {FACT_TABLE} ({', '.join(columns)}) leaves {item.issues_after.total} issue(s)")
+                recommended[name] = columns
+        if args.apply and recommended:
+            created = create_indexes(conn, recommended.items())
+            print(f"Created indexes: {', '.join(created)}" if created else "Recommended indexes already exist.")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,427 @@
+"""Batch ingestion of raw visit events.
+
+Events are resolved into surrogate keys and appended to `FatoVisitas` by one writer thread
+per process, which owns its own read-write connection:
+
+- Dimension keys come from an in-memory map of natural key -> surrogate key per dimension.
+  A miss is inserted with `INSERT ... ON CONFLICT DO NOTHING RETURNING`, and looked up when
+  the row already exists (or first, when the natural key holds NULLs, which a UNIQUE
+  constraint never treats as equal). A conflicting insert still consumes an AUTOINCREMENT
+  value, so dimension keys may have gaps.
+- Batches submitted while a transaction is being written wait in a queue; the writer then
+  commits everything waiting (up to `INGEST_MAX_BATCH` events) in one transaction, with all
+  facts written by a single `executemany`, so concurrent requests share each commit.
+
+Natural keys and required attributes are read from the schema (UNIQUE constraints and NOT
+NULL columns). `DimTempo` is derived from the visit timestamp at minute grain, in local time
+like seed_data.py, and a left-joined dimension whose attributes are all missing is stored as
+a NULL foreign key. `DimSessao` is keyed by `id_sessao_navegador` alone, so the first
+`id_usuario_sessao` seen for a session is kept.
+"""
+import os
+import json
+import time
+import queue
+import asyncio
+import datetime
+import operator
+import sqlite3
+import threading
+import functools
+from concurrent.futures import Future
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from strawberry.utils.str_converters import to_camel_case
+
+from db_pool import POOL_CACHE_SIZE_KIB, _file_identity, get_pool
+from rollups import ROLLUPS_ENABLED, refresh_rollups
+from warehouse import DIMENSIONS, FACT_TABLE, Dimension
+
+INGEST_MAX_BATCH = int(os.environ.get("INGEST_MAX_BATCH", "50000"))  # Events per transaction (and per request)
+INGEST_MAX_PENDING = int(os.environ.get("INGEST_MAX_PENDING", "200000"))  # Events allowed to wait for the writer
+INGEST_COMMIT_DELAY = float(os.environ.get("INGEST_COMMIT_DELAY_MS", "0")) / 1000  # Wait for more batches before committing
+INGEST_KEY_CACHE_SIZE = int(os.environ.get("INGEST_KEY_CACHE_SIZE", "200000"))  # Natural keys cached per dimension
+INGEST_REFRESH_ROLLUPS = os.environ.get("INGEST_REFRESH_ROLLUPS", "1") == "1"
+
+TIME_TABLE = "DimTempo"  # Derived from timestamp_visita instead of being sent
+EVENT_FIELDS: Tuple[str, ...] = ("timestamp_visita",) + tuple(
+    field for dim in DIMENSIONS if dim.table != TIME_TABLE for field in dim.fields
+)
+_EVENT_FIELD_SET = frozenset(EVENT_FIELDS)
+_TEXT_TYPES = frozenset((str, type(None)))
+_FIELDS_BY_GRAPHQL_NAME = {to_camel_case(field): field for field in EVENT_FIELDS}
+_FACT_INSERT = (
+    f"INSERT INTO {FACT_TABLE} ({', '.join(dim.key for dim in DIMENSIONS)}, timestamp_visita)"
+    f" VALUES ({', '.join('?' for _ in DIMENSIONS)}, ?)"
+)
+
+
+class IngestUnavailableError(RuntimeError):
+    """Raised when this process cannot ingest: a read-only pool or a closed writer."""
+
+
+class IngestQueueFullError(RuntimeError):
+    """Raised when accepting a batch would exceed `max_pending` events waiting for the writer."""
+
+
+class IngestResult(NamedTuple):
+    accepted: int
+    first_id: Optional[int]  # Visits of one batch get consecutive ids
+    last_id: Optional[int]
+
+
+class _DimensionSpec(NamedTuple):
+    dim: Dimension
+    fields: Tuple[str, ...]  # Event fields, in `Dimension.fields` order
+    natural_key: Tuple[int, ...]  # Positions of the UNIQUE columns among the attributes
+    natural: Any  # Extracts the cache key from an attribute tuple (None: the whole tuple)
+    required: Tuple[int, ...]  # Positions of the NOT NULL columns
+    empty: Tuple[None, ...]  # Attributes of an event that sent none of the fields
+    upsert_sql: str
+    insert_sql: str
+    select_sql: str
+
+
+def _load_specs(conn: sqlite3.Connection) -> Tuple[_DimensionSpec, ...]:
+    """Reads each dimension's natural key and NOT NULL columns from the schema."""
+    specs = []
+    for dim in DIMENSIONS:
+        columns = tuple(dim.fields.values())
+        not_null = {row[1] for row in conn.execute(f"PRAGMA table_info({dim.table})") if row[3]}
+        unique = columns
+        for index in conn.execute(f"PRAGMA index_list({dim.table})").fetchall():
+            if index[2] and index[3] == "u":  # The table's UNIQUE constraint
+                unique = tuple(row[2] for row in conn.execute(f"PRAGMA index_info({index[1]})"))
+                break
+        positions = tuple(columns.index(column) for column in unique)
+        insert = f"INSERT INTO {dim.table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+        specs.append(_DimensionSpec(
+            dim=dim,
+            fields=tuple(dim.fields),
+            natural_key=positions,
+            natural=None if len(positions) == len(columns) else operator.itemgetter(*positions),
+            required=tuple(i for i, column in enumerate(columns) if column in not_null),
+            empty=(None,) * len(columns),
+            upsert_sql=f"{insert} ON CONFLICT DO NOTHING RETURNING {dim.key}",
+            insert_sql=f"{insert} RETURNING {dim.key}",
+            select_sql=f"SELECT {dim.key} FROM {dim.table} WHERE {' AND '.join(f'{column} IS ?' for column in unique)}",
+        ))
+    return tuple(specs)
+
+
+@functools.lru_cache(maxsize=65536)
+def _time_attributes(minute: int) -> tuple:
+    """`DimTempo` attributes of the minute starting at epoch second `minute` (local time)."""
+    moment = datetime.datetime.fromtimestamp(minute)
+    return (moment.strftime("%Y-%m-%d %H:%M:%S"), moment.year, moment.month, moment.day,
+            moment.weekday(), moment.hour, moment.minute)
+
+
+def _timestamp(value: Any) -> int:
+    if isinstance(value, datetime.datetime):
+        return int(value.timestamp())
+    if isinstance(value, str):
+        try:
+            return int(datetime.datetime.fromisoformat(value).timestamp())
+        except ValueError:
+            raise ValueError(f"`timestamp_visita` is not an ISO 8601 datetime: {value!r}.") from None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(value)
+    raise ValueError("`timestamp_visita` is required (epoch seconds or an ISO 8601 datetime).")
+
+
+def parse_events(body: bytes, ndjson: bool = False) -> List[Dict[str, Any]]:
+    """Decodes a JSON array (or NDJSON lines) of events keyed by GraphQL field names."""
+    try:
+        if ndjson:
+            events = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            events = json.loads(body)
+    except ValueError as e:
+        raise ValueError(f"Malformed JSON: {e}") from None
+    if not isinstance(events, list):
+        raise ValueError("The request body must be a JSON array of events.")
+    parsed = []
+    for i, event in enumerate(events):
+        if not isinstance(event, dict):
+            raise ValueError(f"Event {i} must be a JSON object.")
+        unknown = [name for name in event if name not in _FIELDS_BY_GRAPHQL_NAME]
+        if unknown:
+            raise ValueError(f"Event {i}: unknown fields: {', '.join(unknown)}.")
+        parsed.append({_FIELDS_BY_GRAPHQL_NAME[name]: value for name, value in event.items()})
+    return parsed
+
+
+class _Batch(NamedTuple):
+    rows: List[tuple]
+    future: Future
+
+
+class IngestWriter:
+    """Validates event batches and writes them from a single, group-committing writer thread."""
+
+    def __init__(
+        self,
+        database_file: Optional[str] = None,
+        max_batch: int = INGEST_MAX_BATCH,
+        max_pending: int = INGEST_MAX_PENDING,
+        commit_delay: float = INGEST_COMMIT_DELAY,
+        key_cache_size: int = INGEST_KEY_CACHE_SIZE,
+        refresh_rollups: bool = INGEST_REFRESH_ROLLUPS and ROLLUPS_ENABLED,
+    ):
+        if max_batch < 1:
+            raise ValueError("Ingest `max_batch` must be at least 1.")
+        self.database_file = database_file or get_pool().database_file
+        self.max_batch = max_batch
+        self.max_pending = max(max_pending, max_batch)
+        self.commit_delay = commit_delay
+        self.key_cache_size = key_cache_size
+        self.refresh_rollups = refresh_rollups
+        self.pid = os.getpid()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._file_id = None
+        self._open()
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._closed = False
+        self._counters = {
+            "batches": 0, "commits": 0, "events": 0, "failed_commits": 0, "rejected": 0,
+            "keys_inserted": 0, "key_cache_misses": 0, "rollup_refresh_failures": 0,
+        }
+        self._queue: "queue.SimpleQueue[Optional[_Batch]]" = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+        self._thread.start()
+
+    def _open(self) -> None:
+        """(Re)opens the writer connection; the key maps only hold for the file they were read from."""
+        if self._conn is not None:
+            self._conn.close()
+        conn = sqlite3.connect(self.database_file, timeout=30.0, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{int(POOL_CACHE_SIZE_KIB)}")  # Fact indexes take random inserts
+        self._conn = conn
+        self._file_id = _file_identity(self.database_file)
+        self._specs = _load_specs(conn)
+        self._time_index = next(i for i, spec in enumerate(self._specs) if spec.dim.table == TIME_TABLE)
+        self._keys: List[Dict[Any, int]] = [{} for _ in self._specs]
+
+    # --- Validation (caller's thread) ---
+    def _prepare(self, events: Sequence[Any], typed: bool = False) -> List[tuple]:
+        """Turns events into rows of per-dimension attribute tuples plus the timestamp.
+
+        Events are dicts keyed by field name. With `typed`, they are `VisitaEventInput`
+        objects already checked by GraphQL, so field names and value types are not checked
+        again. Required attributes always are: an optional dimension (e.g. the referrer) may
+        be omitted as a whole, but not partially, and a batch violating NOT NULL would fail
+        the whole group commit.
+        """
+        rows = []
+        specs, time_index = self._specs, self._time_index
+        for i, event in enumerate(events):
+            if typed:
+                get = vars(event).get
+            else:
+                unknown = event.keys() - _EVENT_FIELD_SET
+                if unknown:
+                    raise ValueError(f"Event {i}: unknown fields: {', '.join(sorted(unknown))}.")
+                get = event.get
+            try:
+                timestamp = _timestamp(get("timestamp_visita"))
+            except ValueError as e:
+                raise ValueError(f"Event {i}: {e}") from None
+            row = []
+            for j, spec in enumerate(specs):
+                if j == time_index:
+                    row.append(_time_attributes(timestamp - timestamp % 60))
+                    continue
+                values = tuple(map(get, spec.fields))
+                if values == spec.empty and spec.dim.left_join:
+                    row.append(None)  # Unknown / direct traffic
+                    continue
+                for k in spec.required:  # GraphQL cannot express "required once the dimension is given"
+                    if values[k] is None:
+                        raise ValueError(f"Event {i}: `{spec.fields[k]}` is required.")
+                if not typed and not _TEXT_TYPES.issuperset(map(type, values)):
+                    raise ValueError(f"Event {i}: {spec.dim.table} attributes must be strings.")
+                row.append(values)
+            row.append(timestamp)
+            rows.append(tuple(row))
+        return rows
+
+    def submit(self, events: Sequence[Any], typed: bool = False) -> "Future[IngestResult]":
+        """Validates `events` (raising ValueError) and queues them; the future resolves once they are committed.
+
+        Validation is CPU-bound: async callers should submit from a worker thread (see `ingest_async`).
+        """
+        if len(events) > self.max_batch:
+            raise ValueError(f"At most {self.max_batch} events can be ingested per batch.")
+        rows = self._prepare(events, typed)
+        future: "Future[IngestResult]" = Future()
+        if not rows:
+            future.set_result(IngestResult(0, None, None))
+            return future
+        with self._lock:
+            if self._closed:
+                raise IngestUnavailableError("The ingest writer is closed.")
+            if self._pending + len(rows) > self.max_pending:
+                self._counters["rejected"] += 1
+                raise IngestQueueFullError("Ingestion queue is full, please retry later.")
+            self._pending += len(rows)
+        self._queue.put(_Batch(rows, future))
+        return future
+
+    def ingest(self, events: Sequence[Dict[str, Any]], timeout: Optional[float] = None) -> IngestResult:
+        """Writes `events` and waits for their commit."""
+        return self.submit(events).result(timeout)
+
+    async def ingest_async(self, events: Sequence[Any], typed: bool = False) -> IngestResult:
+        """Like `ingest`, validating in a worker thread and awaiting the commit without blocking the event loop."""
+        future = await asyncio.to_thread(self.submit, events, typed)
+        return await asyncio.wrap_future(future)
+
+    # --- Writer thread ---
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            batch = self._queue.get()
+            if batch is None:
+                break
+            group, count = [batch], len(batch.rows)
+            deadline = time.monotonic() + self.commit_delay
+            while count < self.max_batch:
+                wait = deadline - time.monotonic()
+                try:
+                    batch = self._queue.get(timeout=wait) if wait > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if batch is None:
+                    stop = True
+                    break
+                group.append(batch)
+                count += len(batch.rows)
+            self._commit(group, count)
+
+    def _key(self, cursor: sqlite3.Cursor, spec: _DimensionSpec, values: tuple) -> int:
+        """Inserts (or finds) the dimension row for `values` and returns its surrogate key."""
+        key_values = tuple(values[i] for i in spec.natural_key)
+        if None in key_values:  # UNIQUE never matches NULLs: look the row up null-safely first
+            row = cursor.execute(spec.select_sql, key_values).fetchone()
+            if row is None:
+                row = cursor.execute(spec.insert_sql, values).fetchone()
+                self._counters["keys_inserted"] += 1
+        else:
+            row = cursor.execute(spec.upsert_sql, values).fetchone()
+            if row is None:
+                row = cursor.execute(spec.select_sql, key_values).fetchone()
+            else:
+                self._counters["keys_inserted"] += 1
+        self._counters["key_cache_misses"] += 1
+        return row[0]
+
+    def _resolve(self, cursor: sqlite3.Cursor, rows: List[tuple]) -> List[list]:
+        """Returns one column of surrogate keys per dimension."""
+        columns = []
+        for i, spec in enumerate(self._specs):
+            keys, natural = self._keys[i], spec.natural
+            column = []
+            for row in rows:
+                values = row[i]
+                if values is None:
+                    column.append(None)
+                    continue
+                key = values if natural is None else natural(values)
+                key_id = keys.get(key)
+                if key_id is None:
+                    key_id = self._key(cursor, spec, values)
+                    if len(keys) >= self.key_cache_size:
+                        keys.clear()
+                    keys[key] = key_id
+                column.append(key_id)
+            columns.append(column)
+        return columns
+
+    def _commit(self, group: List[_Batch], count: int) -> None:
+        rows = [row for batch in group for row in batch.rows]
+        conn = self._conn
+        try:
+            if _file_identity(self.database_file) != self._file_id:
+                self._open()  # The database file was replaced
+                conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = conn.cursor()
+                columns = self._resolve(cursor, rows)
+                columns.append([row[-1] for row in rows])
+                cursor.executemany(_FACT_INSERT, zip(*columns))
+                last_id = cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                for keys in self._keys:  # Keys inserted by the rolled-back transaction are gone
+                    keys.clear()
+                raise
+        except Exception as e:
+            self._counters["failed_commits"] += 1
+            self._release(count)
+            for batch in group:
+                batch.future.set_exception(e)
+            return
+        self._counters["commits"] += 1
+        self._counters["batches"] += len(group)
+        self._counters["events"] += count
+        self._release(count)
+        next_id = last_id - count + 1  # The write lock was held: the ids are consecutive
+        for batch in group:
+            batch.future.set_result(IngestResult(len(batch.rows), next_id, next_id + len(batch.rows) - 1))
+            next_id += len(batch.rows)
+        if self.refresh_rollups:
+            try:
+                refresh_rollups(conn)
+            except Exception:  # Never let a refresh stop the writer: queued batches would wait forever
+                self._counters["rollup_refresh_failures"] += 1  # Reads fall back to fresh SQL until the next refresh
+
+    def _release(self, count: int) -> None:
+        with self._lock:
+            self._pending -= count
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._counters, "pending": self._pending, "max_batch": self.max_batch}
+
+    def close(self) -> None:
+        """Writes the batches already queued, then stops the writer thread."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        self._conn.close()
+
+
+_writer: Optional[IngestWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_ingest_writer() -> IngestWriter:
+    """Returns this worker process's writer, starting it on first use (or after a fork)."""
+    global _writer
+    writer = _writer
+    if writer is not None and writer.pid == os.getpid():
+        return writer
+    with _writer_lock:
+        if _writer is None or _writer.pid != os.getpid():
+            if get_pool().read_only:
+                raise IngestUnavailableError("Ingestion is unavailable on a read-only database pool.")
+            _writer = IngestWriter()
+        return _writer
+
+
+def close_ingest_writer() -> None:
+    """Flushes and stops the process writer; the next `get_ingest_writer()` call starts a new one."""
+    global _writer
+    with _writer_lock:
+        if _writer is not None and _writer.pid == os.getpid():
+            _writer.close()
+        _writer = None
@@ -1,11 +1,27 @@
-import strawberry
-from fastapi import FastAPI
-from strawberry.fastapi import GraphQLRouter
+import os
+import hmac
+import json
+import asyncio
+from typing import Optional
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 
+from count_cache import get_count_cache
+from db_executor import ExecutorSaturatedError, get_executor
+from db_pool import get_pool
+from export import ExportSaturatedError, VisitaExport
+from filter_inputs import parse_fields, parse_filter
+from ingest import IngestQueueFullError, IngestUnavailableError, get_ingest_writer, parse_events
+from metrics import get_registry, render_samples
+from persisted_queries import PersistedQueryRouter, document_cache_stats, get_persisted_query_store
+from response_cache import get_response_cache
+from slow_query import get_slow_query_log
 from schema import schema
 
-# Create the GraphQL router
-graphql_router = GraphQLRouter(schema)
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")  # Sent as `X-Admin-Token`; empty disables the /admin routes
+
+# Create the GraphQL router (accepts automatic persisted queries)
+graphql_router = PersistedQueryRouter(schema)
 
 # Create the FastAPI application
 app = FastAPI()
@@ -17,6 +33,107 @@ app.include_router(graphql_router, prefix="/graphql")
 async def read_root():
     return {"message": "GraphQL Filter Demo API is running. Go to /graphql for the GraphQL playground."}
 
+@app.get("/health")
+async def health():
+    """Reports database connectivity, connection pool, executor and cache statistics."""
+    result = await asyncio.to_thread(get_pool().health_check) # May wait up to DB_POOL_TIMEOUT for a connection
+    result["executor"] = get_executor().stats()
+    response_cache = get_response_cache()
+    if response_cache is not None:
+        result["response_cache"] = response_cache.stats()
+    count_cache = get_count_cache()
+    if count_cache is not None:
+        result["count_cache"] = count_cache.stats()
+    document_cache = document_cache_stats()
+    if document_cache is not None:
+        result["document_cache"] = document_cache
+    persisted_queries = get_persisted_query_store()
+    if persisted_queries is not None:
+        result["persisted_queries"] = persisted_queries.stats()
+    return JSONResponse(result, status_code=200 if result["healthy"] else 503)
+
+@app.get("/metrics")
+async def metrics():
+    """Operation, phase and row-count histograms (and cache counters) in the Prometheus text format."""
+    text = get_registry().render()
+    response_cache = get_response_cache()
+    if response_cache is not None:
+        stats = response_cache.stats()
+        text += render_samples(
+            "response_cache_events_total", "getVisitas response cache events.", "counter", "event",
+            {event: stats[event] for event in ("hits", "misses", "stores", "evictions", "expirations", "invalidations")}
+        )
+        text += render_samples(
+            "response_cache_size", "getVisitas response cache size.", "gauge", "unit",
+            {"entries": stats["entries"], "bytes": stats["bytes"]}
+        )
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+def _admin_denied(request: Request) -> Optional[JSONResponse]:
+    """The response refusing an /admin request, or None when it carries the admin token."""
+    if not ADMIN_TOKEN:
+        return JSONResponse({"error": "Not Found"}, status_code=404) # Not configured: the routes do not exist
+    if not hmac.compare_digest(request.headers.get("X-Admin-Token", "").encode(), ADMIN_TOKEN.encode()):
+        return JSONResponse({"error": "Forbidden"}, status_code=403)
+    return None
+
+@app.get("/admin/slow-queries")
+async def slow_queries(request: Request, limit: Optional[int] = None, kind: Optional[str] = None):
+    """The slowest statement shapes seen by this process (`kind`: count, page or aggregate)."""
+    denied = _admin_denied(request)
+    if denied is not None:
+        return denied
+    log = get_slow_query_log()
+    return {"stats": log.stats(), "queries": log.top(limit, kind)}
+
+@app.delete("/admin/slow-queries")
+async def reset_slow_queries(request: Request):
+    denied = _admin_denied(request)
+    if denied is not None:
+        return denied
+    get_slow_query_log().reset()
+    return {"reset": True}
+
+@app.post("/export/visitas")
+async def export_visitas(request: Request, format: str = "ndjson"):
+    """Streams every visit matching `filter` as NDJSON (one object per line) or CSV.
+
+    The JSON body is optional: `{"filter": VisitaFilterInput, "fields": [VisitaType field names]}`.
+    """
+    try:
+        body = await request.body()
+        payload = json.loads(body) if body.strip() else {}
+        if not isinstance(payload, dict):
+            raise ValueError("The request body must be a JSON object.")
+        export = VisitaExport(parse_filter(payload.get("filter")), parse_fields(payload.get("fields")), format)
+    except ValueError as e: # Includes malformed JSON
+        return JSONResponse({"error": str(e)}, status_code=400)
+    try:
+        await export.open()
+    except (ExecutorSaturatedError, ExportSaturatedError) as e:
+        return JSONResponse({"error": str(e)}, status_code=503, headers={"Retry-After": "1"})
+    return StreamingResponse(export.stream(), media_type=export.media_type)
+
+@app.post("/ingest/visitas")
+async def ingest_visitas(request: Request):
+    """Writes a batch of raw visit events (VisitaEventInput field names).
+
+    The body is a JSON array, or one event per line with `Content-Type: application/x-ndjson`.
+    `timestampVisita` is epoch seconds or an ISO 8601 datetime.
+    """
+    body = await request.body()
+    ndjson = request.headers.get("content-type", "").startswith("application/x-ndjson")
+    try: # Decoding and validating a large batch is CPU-bound: keep it off the event loop
+        future = await asyncio.to_thread(lambda: get_ingest_writer().submit(parse_events(body, ndjson)))
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    except IngestQueueFullError as e:
+        return JSONResponse({"error": str(e)}, status_code=503, headers={"Retry-After": "1"})
+    except IngestUnavailableError as e: # Read-only pool: retrying will not help
+        return JSONResponse({"error": str(e)}, status_code=503)
+    result = await asyncio.wrap_future(future)
+    return {"accepted": result.accepted, "firstIdVisita": result.first_id, "lastIdVisita": result.last_id}
+
 # To run this application, you would typically use a command like:
 # uvicorn main:app --reload
 # inside the devcontainer.
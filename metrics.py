@@ -0,0 +1,268 @@
+"""Per-request phase timings and Prometheus histograms.
+
+`RequestTimingExtension` (a strawberry schema extension) starts a `RequestTimings` for
+every GraphQL operation and keeps it in a context variable, which also reaches the
+database executor's worker threads. Parse and validation are timed by the extension.
+Resolvers time their own phases with `phase_laps()`, one monotonic lap per phase.
+`getVisitas` reports these phases: filter compilation and planning, the `COUNT`, the page
+query, `fetchall` and node construction. It also records the rows it scanned and returned,
+and a hash of its SQL shape. `serialize` is the time from the resolvers returning to the
+end of execution, which is graphql-core turning the result objects into JSON-ready data.
+
+When a request sends `X-Request-Timings: 1` (or the context has `"request_timings": True`),
+the timings are returned in the response under `extensions.timings`. Every operation is
+aggregated into the process registry (`get_registry()`), which `/metrics` renders in the
+Prometheus text format. Histogram buckets are fixed, so the registry stays small.
+"""
+import os
+import time
+import zlib
+import threading
+import contextvars
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from strawberry.extensions import SchemaExtension
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+TIMINGS_HEADER = "x-request-timings"  # Request header asking for `extensions.timings`
+
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # Seconds
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000, 10000000)
+
+
+class RequestTimings:
+    """Phase durations and row counts collected while one GraphQL operation runs."""
+
+    __slots__ = ("operation", "phases", "rows_scanned", "rows_returned", "statements", "resolved_at", "_lock")
+
+    def __init__(self, operation: str = "query"):
+        self.operation = operation
+        self.phases: Dict[Tuple[str, str], float] = {}  # (field, phase) -> seconds
+        self.rows_scanned: Dict[str, int] = {}
+        self.rows_returned: Dict[str, int] = {}
+        self.statements: List[str] = []
+        self.resolved_at: Optional[float] = None  # perf_counter() when the last resolver returned
+        self._lock = threading.Lock()  # Root fields of one operation can resolve concurrently
+
+    def add(self, field: str, phase: str, seconds: float) -> None:
+        with self._lock:
+            self.phases[(field, phase)] = self.phases.get((field, phase), 0.0) + seconds
+
+    def add_rows(self, field: str, scanned: int, returned: int) -> None:
+        with self._lock:
+            self.rows_scanned[field] = self.rows_scanned.get(field, 0) + scanned
+            self.rows_returned[field] = self.rows_returned.get(field, 0) + returned
+
+    def add_statement(self, sql: str) -> None:
+        with self._lock:
+            self.statements.append(" ".join(sql.split()))
+
+    def sql_shape(self) -> Optional[str]:
+        """A short hash of the SQL texts run (parameters excluded), equal for requests of the same shape."""
+        if not self.statements:
+            return None
+        return f"{zlib.crc32(chr(10).join(self.statements).encode()):08x}"
+
+    def as_dict(self) -> dict:
+        return {
+            "phasesMs": {
+                (phase if field == "operation" else f"{field}.{phase}"): round(seconds * 1000, 3)
+                for (field, phase), seconds in self.phases.items()
+            },
+            "rowsScanned": dict(self.rows_scanned),
+            "rowsReturned": dict(self.rows_returned),
+            "sqlShape": self.sql_shape(),
+        }
+
+
+_current: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar("request_timings", default=None)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    return _current.get()
+
+
+class PhaseLaps:
+    """Times consecutive phases of one resolver: each `lap(name)` records the time since the previous lap."""
+
+    __slots__ = ("timings", "field", "_last")
+
+    def __init__(self, timings: Optional[RequestTimings], field: str):
+        self.timings = timings
+        self.field = field
+        self._last = time.perf_counter()
+
+    def lap(self, phase: str) -> None:
+        if self.timings is None:
+            return
+        now = time.perf_counter()
+        self.timings.add(self.field, phase, now - self._last)
+        self._last = now
+
+    def rows(self, scanned: int, returned: int) -> None:
+        if self.timings is not None:
+            self.timings.add_rows(self.field, scanned, returned)
+
+    def statement(self, sql: str) -> None:
+        if self.timings is not None:
+            self.timings.add_statement(sql)
+
+
+def phase_laps(field: str) -> PhaseLaps:
+    """Returns a lap timer for `field`; it records nothing outside an instrumented operation."""
+    return PhaseLaps(_current.get(), field)
+
+
+def mark_resolved() -> None:
+    """Records that a root resolver has returned; execution after this point counts as `serialize`."""
+    timings = _current.get()
+    if timings is not None:
+        timings.resolved_at = time.perf_counter()
+
+
+# --- Aggregation ---
+class Histogram:
+    """Cumulative-bucket histogram per label set, rendered in the Prometheus text format."""
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], list] = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, labels: Tuple[str, ...], value: float) -> None:
+        """Callers hold the registry lock."""
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            label_text = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels))
+            prefix = label_text + "," if label_text else ""
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{prefix}le="{_format(bound)}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {series[-1]}')
+            braces = f"{{{label_text}}}" if label_text else ""
+            lines.append(f"{self.name}_sum{braces} {_format(series[-2])}")
+            lines.append(f"{self.name}_count{braces} {series[-1]}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render_samples(name: str, help: str, type: str, label: str, values: Dict[str, float]) -> str:
+    """Renders one counter or gauge family, one sample per `label` value, in the Prometheus text format."""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {type}"]
+    lines.extend(f'{name}{{{label}="{_escape(key)}"}} {_format(value)}' for key, value in values.items())
+    return "\n".join(lines) + "\n"
+
+
+class MetricsRegistry:
+    """Process-wide histograms of operation durations, resolver phases and row counts."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.operation_seconds = Histogram(
+            "graphql_operation_duration_seconds", "Duration of GraphQL operations.", ("operation",), DURATION_BUCKETS
+        )
+        self.phase_seconds = Histogram(
+            "graphql_phase_duration_seconds", "Duration of each phase of a GraphQL operation.", ("field", "phase"), DURATION_BUCKETS
+        )
+        self.rows_scanned = Histogram(
+            "graphql_rows_scanned", "Rows read from SQLite per resolver call.", ("field",), ROW_BUCKETS
+        )
+        self.rows_returned = Histogram(
+            "graphql_rows_returned", "Rows returned to the client per resolver call.", ("field",), ROW_BUCKETS
+        )
+
+    def observe(self, timings: RequestTimings, seconds: float) -> None:
+        with self._lock:
+            self.operation_seconds.observe((timings.operation,), seconds)
+            for labels, value in timings.phases.items():
+                self.phase_seconds.observe(labels, value)
+            for field, value in timings.rows_scanned.items():
+                self.rows_scanned.observe((field,), value)
+            for field, value in timings.rows_returned.items():
+                self.rows_returned.observe((field,), value)
+
+    def render(self) -> str:
+        """Returns every histogram in the Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            lines = []
+            for histogram in (self.operation_seconds, self.phase_seconds, self.rows_scanned, self.rows_returned):
+                lines.extend(histogram.render())
+        return "\n".join(lines) + "\n"
+
+
+_registry = MetricsRegistry()
+
+
+def get_registry() -> MetricsRegistry:
+    return _registry
+
+
+# --- Schema extension ---
+def _timings_requested(context) -> bool:
+    if not isinstance(context, dict):
+        return False
+    if context.get("request_timings"):
+        return True
+    request = context.get("request")
+    return request is not None and request.headers.get(TIMINGS_HEADER) == "1"
+
+
+class RequestTimingExtension(SchemaExtension):
+    """Times each GraphQL operation and its phases (see the module docstring)."""
+
+    timings: Optional[RequestTimings] = None
+
+    def on_operation(self):
+        self.timings = timings = RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            _current.reset(token)
+            try:
+                timings.operation = self.execution_context.operation_type.value
+            except RuntimeError:  # The document did not parse
+                timings.operation = "invalid"
+            get_registry().observe(timings, time.perf_counter() - start)
+
+    def on_parse(self):
+        start = time.perf_counter()
+        yield
+        self.timings.add("operation", "parse", time.perf_counter() - start)
+
+    def on_validate(self):
+        start = time.perf_counter()
+        yield
+        self.timings.add("operation", "validate", time.perf_counter() - start)
+
+    def on_execute(self):
+        start = time.perf_counter()
+        yield
+        end = time.perf_counter()
+        self.timings.add("operation", "execute", end - start)
+        if self.timings.resolved_at is not None:
+            self.timings.add("operation", "serialize", end - self.timings.resolved_at)
+
+    def get_results(self) -> dict:
+        if self.timings is None or not _timings_requested(self.execution_context.context):
+            return {}
+        return {"timings": self.timings.as_dict()}
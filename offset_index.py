@@ -0,0 +1,133 @@
+"""Sparse checkpoints that turn deep OFFSET pagination into a keyset seek.
+
+Offset pages are ordered by `(timestamp_visita, id_visita)`, a unique key. For each filter
+the index remembers the key of every `interval`-th matching row, so `OFFSET n` can start
+at the checkpoint just before row `n` (`key >= checkpoint`) and skip only the remainder.
+The result is the same page plain `LIMIT/OFFSET` returns, as long as the checkpoints were
+built on the same data: they are dropped whenever the data-version token changes.
+
+Checkpoints are found by stepping `LIMIT 1 OFFSET interval` from the previous one over the
+fact keys only, so the first deep request pays roughly one plain offset scan and later
+requests for that filter skip at most `interval` rows.
+"""
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, List, Optional, Tuple
+
+OFFSET_CHECKPOINT_INTERVAL = int(os.environ.get("OFFSET_CHECKPOINT_INTERVAL", "1000"))  # Rows between checkpoints; 0 disables
+OFFSET_CHECKPOINT_FILTERS = int(os.environ.get("OFFSET_CHECKPOINT_FILTERS", "256"))  # Filters whose checkpoints are kept
+
+SEEK_CONDITION = "(fv.timestamp_visita, fv.id_visita) >= (?, ?)"  # Row value, so SQLite seeks the index range
+_ORDER_BY = " ORDER BY fv.timestamp_visita ASC, fv.id_visita ASC"
+
+
+class _Checkpoints:
+    __slots__ = ("keys", "exhausted")
+
+    def __init__(self):
+        self.keys: List[Tuple[int, int]] = []  # keys[j] is the key of the row at offset (j + 1) * interval
+        self.exhausted = False  # No row exists at the next checkpoint
+
+
+class OffsetCheckpoints:
+    """Per-filter checkpoint lists, kept for the most recently used filters."""
+
+    def __init__(self, interval: int = OFFSET_CHECKPOINT_INTERVAL, max_filters: int = OFFSET_CHECKPOINT_FILTERS):
+        if interval < 1:
+            raise ValueError("Checkpoint `interval` must be at least 1.")
+        self.interval = interval
+        self.max_filters = max_filters
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, _Checkpoints]" = OrderedDict()
+        self._token: Optional[Hashable] = None
+        self._counters = {"seeks": 0, "checkpoints_built": 0, "invalidations": 0}
+
+    def _entry(self, filter_key: Hashable, token: Hashable) -> _Checkpoints:
+        with self._lock:
+            if token != self._token:
+                if self._entries:
+                    self._counters["invalidations"] += 1
+                self._entries.clear()
+                self._token = token
+            entry = self._entries.get(filter_key)
+            if entry is None:
+                entry = self._entries[filter_key] = _Checkpoints()
+                if len(self._entries) > self.max_filters:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.move_to_end(filter_key)
+            return entry
+
+    def _next_key(self, conn: sqlite3.Connection, from_clause: str, condition: str, params: List[Any],
+                  start: Optional[Tuple[int, int]]) -> Optional[Tuple[int, int]]:
+        conditions = [condition] if condition else []
+        step_params = list(params)
+        if start is not None:
+            conditions.append(SEEK_CONDITION)
+            step_params.extend(start)
+        where_clause = " WHERE " + " AND ".join(conditions) if conditions else ""
+        row = conn.execute(
+            f"SELECT fv.timestamp_visita, fv.id_visita{from_clause}{where_clause}{_ORDER_BY} LIMIT 1 OFFSET ?",
+            step_params + [self.interval],
+        ).fetchone()
+        return (row[0], row[1]) if row is not None else None
+
+    def seek(self, conn: sqlite3.Connection, filter_key: Hashable, token: Hashable, from_clause: str,
+             condition: str, params: List[Any], offset: int) -> Tuple[List[str], List[Any], int]:
+        """Plans `OFFSET offset` for a filter as a seek to the nearest checkpoint at or before it.
+
+        `from_clause`, `condition` (the filter's, without WHERE) and `params` must select exactly
+        the rows the page query pages over. Returns the extra WHERE conditions, their parameters and the residual offset.
+        """
+        target = offset // self.interval
+        if target == 0:
+            return [], [], offset
+        entry = self._entry(filter_key, token)
+        # Racing builders compute the same keys; appends happen under the lock
+        while len(entry.keys) < target and not entry.exhausted:
+            start = entry.keys[-1] if entry.keys else None
+            key = self._next_key(conn, from_clause, condition, params, start)
+            with self._lock:
+                if entry.keys[-1:] != ([start] if start else []):
+                    continue  # Another thread extended this list meanwhile
+                if key is None:
+                    entry.exhausted = True
+                else:
+                    entry.keys.append(key)
+                    self._counters["checkpoints_built"] += 1
+        with self._lock:
+            self._counters["seeks"] += 1
+            reached = min(target, len(entry.keys))
+            if reached == 0:
+                return [], [], offset
+            timestamp, id_visita = entry.keys[reached - 1]
+        return [SEEK_CONDITION], [timestamp, id_visita], offset - reached * self.interval
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"interval": self.interval, "filters": len(self._entries), **self._counters}
+
+
+# --- Per-process index ---
+_checkpoints: Optional[OffsetCheckpoints] = None
+_checkpoints_lock = threading.Lock()
+
+
+def get_offset_checkpoints() -> Optional[OffsetCheckpoints]:
+    """Returns the process checkpoint index, or None when `OFFSET_CHECKPOINT_INTERVAL` is 0."""
+    global _checkpoints
+    if _checkpoints is None and OFFSET_CHECKPOINT_INTERVAL > 0:
+        with _checkpoints_lock:
+            if _checkpoints is None:
+                _checkpoints = OffsetCheckpoints()
+    return _checkpoints
+
+
+def configure_offset_checkpoints(**options) -> OffsetCheckpoints:
+    """Replaces the process checkpoint index with one built from `options` (see `OffsetCheckpoints`)."""
+    global _checkpoints
+    with _checkpoints_lock:
+        _checkpoints = OffsetCheckpoints(**options)
+        return _checkpoints
@@ -0,0 +1,199 @@
+"""Automatic persisted queries and the parse/validation caches for GraphQL documents.
+
+Clients send the same few documents over and over. Two mechanisms keep that from costing a
+parse and a validation per request:
+
+- `document_cache_extensions()` returns strawberry's `ParserCache` and `ValidationCache`
+  schema extensions, which keep LRUs of parsed documents (by query text) and of their
+  validation errors. Documents are never mutated by execution, so one `DocumentNode` can be
+  shared by concurrent requests.
+- `PersistedQueryStore` implements Apollo's automatic persisted queries. A client sends
+  `extensions: {"persistedQuery": {"version": 1, "sha256Hash": "<hex>"}}` without `query`.
+  If the hash is unknown, the response is a `PersistedQueryNotFound` error and the client
+  retries with both the hash and the query, which registers the pair. The hash must be
+  the SHA-256 of the query text. `PersistedQueryRouter` (the `GraphQLRouter` in `main.py`)
+  resolves the hash before strawberry sees the request, for JSON POST and for GET.
+
+All caches are bounded LRUs. An evicted persisted query is simply registered again by the
+client's retry.
+"""
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from graphql import GraphQLError
+from strawberry.extensions import ParserCache, SchemaExtension, ValidationCache
+from strawberry.fastapi import GraphQLRouter
+from strawberry.http.exceptions import HTTPException
+from strawberry.types import ExecutionResult
+
+DOCUMENT_CACHE_ENABLED = os.environ.get("DOCUMENT_CACHE_ENABLED", "1") == "1"
+DOCUMENT_CACHE_SIZE = int(os.environ.get("DOCUMENT_CACHE_SIZE", "1024"))  # Distinct query texts kept
+PERSISTED_QUERIES_ENABLED = os.environ.get("PERSISTED_QUERIES_ENABLED", "1") == "1"
+PERSISTED_QUERY_STORE_SIZE = int(os.environ.get("PERSISTED_QUERY_STORE_SIZE", "10000"))  # Registered hashes kept
+
+
+def query_hash(query: str) -> str:
+    """The APQ identifier of a query: the hex SHA-256 of its UTF-8 text."""
+    return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+
+class PersistedQueryStore:
+    """LRU of SHA-256 hash -> query text, filled by clients registering their queries."""
+
+    def __init__(self, max_size: int = PERSISTED_QUERY_STORE_SIZE):
+        if max_size < 1:
+            raise ValueError("Persisted query store `max_size` must be at least 1.")
+        self.max_size = max_size
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._queries: "OrderedDict[str, str]" = OrderedDict()
+        self._counters = {"hits": 0, "misses": 0, "registrations": 0}
+
+    def get(self, sha256_hash: str) -> Optional[str]:
+        with self._lock:
+            query = self._queries.get(sha256_hash)
+            if query is None:
+                self._counters["misses"] += 1
+                return None
+            self._queries.move_to_end(sha256_hash)
+            self._counters["hits"] += 1
+            return query
+
+    def register(self, sha256_hash: str, query: str) -> None:
+        """Stores `query` under its hash; raises ValueError if `sha256_hash` is not its SHA-256."""
+        sha256_hash = sha256_hash.lower()
+        if query_hash(query) != sha256_hash:
+            raise ValueError("provided sha does not match query")
+        with self._lock:
+            if sha256_hash not in self._queries:
+                self._counters["registrations"] += 1
+            self._queries[sha256_hash] = query
+            self._queries.move_to_end(sha256_hash)
+            if len(self._queries) > self.max_size:
+                self._queries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._queries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._queries), "max_size": self.max_size, **self._counters}
+
+
+class PersistedQueryError(Exception):
+    """An APQ request the server cannot answer; returned to the client as a GraphQL error."""
+
+    def __init__(self, message: str, code: str):
+        super().__init__(message)
+        self.code = code
+
+
+def resolve_persisted_query(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Fills in `data["query"]` from `extensions.persistedQuery`, registering a sent query.
+
+    Raises `PersistedQueryError` for an unknown hash (or when APQ is disabled) and
+    ValueError for a malformed extension or a hash that does not match the query.
+    """
+    extensions = data.get("extensions")
+    persisted = extensions.get("persistedQuery") if isinstance(extensions, dict) else None
+    if persisted is None:
+        return data
+    if not isinstance(persisted, dict) or persisted.get("version") != 1:
+        raise ValueError("Unsupported persisted query version.")
+    store = get_persisted_query_store()
+    if store is None:
+        raise PersistedQueryError("PersistedQueryNotSupported", "PERSISTED_QUERY_NOT_SUPPORTED")
+    sha256_hash = persisted.get("sha256Hash")
+    if not isinstance(sha256_hash, str):
+        raise ValueError("`persistedQuery.sha256Hash` must be a string.")
+    query = data.get("query")
+    if query:
+        store.register(sha256_hash, query)
+    else:
+        query = store.get(sha256_hash.lower())
+        if query is None:
+            raise PersistedQueryError("PersistedQueryNotFound", "PERSISTED_QUERY_NOT_FOUND")
+        data["query"] = query
+    return data
+
+
+class PersistedQueryRouter(GraphQLRouter):
+    """`GraphQLRouter` that accepts APQ requests (`extensions.persistedQuery`)."""
+
+    def should_render_graphql_ide(self, request: Any) -> bool:
+        # A GET carrying only a persisted query hash is an operation, not a browser visit
+        return "extensions" not in request.query_params and super().should_render_graphql_ide(request)
+
+    def parse_json(self, data: Any) -> Any:
+        # POST bodies and multipart `operations`; GET variables are decoded by parse_query_params
+        return self._resolve(super().parse_json(data))
+
+    def parse_query_params(self, params: Any) -> Dict[str, Any]:
+        params = dict(params)
+        for key in ("variables", "extensions"):
+            if params.get(key):
+                params[key] = super().parse_json(params[key])
+        return self._resolve(params)
+
+    @staticmethod
+    def _resolve(data: Any) -> Any:
+        if not isinstance(data, dict):
+            return data
+        try:
+            return resolve_persisted_query(data)
+        except ValueError as e:
+            raise HTTPException(400, str(e)) from e
+
+    async def execute_operation(self, request: Any, context: Any, root_value: Any) -> Any:
+        try:
+            return await super().execute_operation(request, context, root_value)
+        except PersistedQueryError as e:
+            return ExecutionResult(data=None, errors=[GraphQLError(str(e), extensions={"code": e.code})])
+
+
+_parser_cache = ParserCache(maxsize=DOCUMENT_CACHE_SIZE)
+_validation_cache = ValidationCache(maxsize=DOCUMENT_CACHE_SIZE)
+_store: Optional[PersistedQueryStore] = None
+_lock = threading.Lock()
+
+
+def document_cache_extensions() -> List[SchemaExtension]:
+    """The schema extensions caching parse and validation, or none when `DOCUMENT_CACHE_ENABLED=0`."""
+    return [_parser_cache, _validation_cache] if DOCUMENT_CACHE_ENABLED else []
+
+
+def document_cache_stats() -> Optional[dict]:
+    """Hit/miss counters of the parse and validation LRUs, or None when they are disabled."""
+    if not DOCUMENT_CACHE_ENABLED:
+        return None
+    return {
+        name: cached._asdict()
+        for name, cached in (
+            ("parse", _parser_cache.cached_parse_document.cache_info()),
+            ("validation", _validation_cache.cached_validate_document.cache_info()),
+        )
+    }
+
+
+def get_persisted_query_store() -> Optional[PersistedQueryStore]:
+    """Returns this process's persisted query store, or None when `PERSISTED_QUERIES_ENABLED=0`."""
+    global _store
+    if not PERSISTED_QUERIES_ENABLED:
+        return None
+    store = _store
+    if store is not None and store.pid == os.getpid():
+        return store
+    with _lock:
+        if _store is None or _store.pid != os.getpid():
+            _store = PersistedQueryStore()
+        return _store
+
+
+def close_persisted_queries() -> None:
+    global _store
+    with _lock:
+        _store = None
@@ -0,0 +1,140 @@
+"""SQL planning for `getVisitas`: decides which dimension tables a query must join.
+
+Every inner-joined dimension is referenced through a NOT NULL foreign key, so dropping a
+JOIN that neither the selection nor the filter needs does not change which fact rows
+match (the loader always resolves dimension rows before inserting facts).
+"""
+import re
+from typing import Any, Iterable, NamedTuple, Optional, Set, FrozenSet, Tuple
+
+from strawberry.types.nodes import SelectedField
+
+from warehouse import DIMENSIONS, FACT_ALIAS, FACT_FIELDS, FACT_TABLE, FIELD_MAPPING, VISITA_FIELDS, join_clause
+
+_CAMEL_BOUNDARY = re.compile(r'(?<!^)(?=[A-Z])')
+
+
+def _to_python_name(graphql_name: str) -> str:
+    return _CAMEL_BOUNDARY.sub('_', graphql_name).lower()
+
+
+def _flatten_selections(selections: Iterable[Any]) -> Iterable[Any]:
+    """Yields selected fields, expanding fragment spreads and inline fragments."""
+    for selection in selections:
+        if isinstance(selection, SelectedField):
+            yield selection
+        else:  # FragmentSpread / InlineFragment
+            yield from _flatten_selections(selection.selections)
+
+
+def _child(selection: Any, name: str) -> list:
+    return [s for s in _flatten_selections(selection.selections) if s.name == name]
+
+
+class VisitaSelection(NamedTuple):
+    """What a `getVisitas` request selects on `VisitaConnection`."""
+    node_fields: FrozenSet[str]  # VisitaType fields under edges { node { ... } }
+    edges: bool
+    cursors: bool  # Edge cursors or pageInfo cursors are needed
+    page_info: bool
+    total_count: bool
+    page_count: bool
+
+    @property
+    def needs_rows(self) -> bool:
+        """Whether the page query has to run at all."""
+        return self.edges or self.page_info or self.page_count
+
+
+FULL_SELECTION = VisitaSelection(frozenset(VISITA_FIELDS), True, True, True, True, True)
+
+
+def visita_selection(info: Optional[Any]) -> VisitaSelection:
+    """Reads the `VisitaConnection` selection from resolver info.
+
+    Without resolver info (e.g. direct calls) everything is considered selected.
+    """
+    if info is None:
+        return FULL_SELECTION
+    node_fields: Set[str] = set()
+    selected: Set[str] = set()
+    for connection in _flatten_selections(info.selected_fields):
+        for field in _flatten_selections(connection.selections):
+            selected.add(field.name)
+        for edges in _child(connection, "edges"):
+            if _child(edges, "cursor"):
+                selected.add("cursor")
+            for node in _child(edges, "node"):
+                for field in _flatten_selections(node.selections):
+                    python_name = _to_python_name(field.name)
+                    if python_name in FIELD_MAPPING:
+                        node_fields.add(python_name)
+    return VisitaSelection(
+        node_fields=frozenset(node_fields),
+        edges="edges" in selected,
+        cursors="cursor" in selected or "pageInfo" in selected,
+        page_info="pageInfo" in selected,
+        total_count="totalCount" in selected or "totalCountEstimate" in selected,
+        page_count="pageCount" in selected,
+    )
+
+
+def required_aliases(fields: Iterable[str]) -> FrozenSet[str]:
+    """Returns the dimension aliases needed to read `fields`."""
+    return frozenset(FIELD_MAPPING[field][0] for field in fields) - {FACT_ALIAS}
+
+
+def build_from_clause(aliases: Iterable[str], leading: str = "") -> str:
+    """Builds `FROM FatoVisitas fv` plus only the JOINs for `aliases`, in schema order.
+
+    A `leading` source (e.g. `"sample_blocks sb"`) is cross-joined before the fact table.
+    """
+    aliases = set(aliases)
+    joins = "".join(join_clause(dim) for dim in DIMENSIONS if dim.alias in aliases)
+    source = f"{leading} CROSS JOIN " if leading else ""
+    return f" FROM {source}{FACT_TABLE} {FACT_ALIAS}{joins}"
+
+
+def select_column(field: str) -> str:
+    """Returns the SELECT expression for a VisitaType field, aliased to the field name."""
+    alias, column = FIELD_MAPPING[field]
+    return f"{alias}.{column}" if column == field else f"{alias}.{column} AS {field}"
+
+
+class PageProjection(NamedTuple):
+    """The page query's SELECT list and how to map its rows back onto node fields."""
+    columns: Tuple[str, ...]  # SELECT expressions
+    aliases: FrozenSet[str]  # Dimensions that must be joined to read `columns`
+    direct: Tuple[Tuple[str, int], ...]  # (node field, row index) read from the query itself
+    cached: Tuple[Tuple[str, int, Tuple[Tuple[str, int], ...]], ...]  # (alias, foreign key row index, ((node field, cached position), ...))
+    timestamp_index: Optional[int]  # Row indexes of the cursor keys, when cursors are needed
+    id_index: Optional[int]
+
+
+def plan_projection(node_fields: Iterable[str], cursors: bool, cached_aliases: Iterable[str] = frozenset()) -> PageProjection:
+    """Plans the page query's columns.
+
+    Fields of dimensions in `cached_aliases` are not joined: the fact table's foreign key is
+    selected instead and the values come from the dimension cache.
+    """
+    node_fields = frozenset(node_fields)
+    cached_aliases = frozenset(cached_aliases)
+    fields = [f for f in VISITA_FIELDS if f in node_fields or (cursors and f in FACT_FIELDS)]
+    direct_fields = [f for f in fields if FIELD_MAPPING[f][0] not in cached_aliases]
+    cached_dims = [dim for dim in DIMENSIONS if dim.alias in cached_aliases and any(f in node_fields for f in dim.fields)]
+    if not direct_fields and not cached_dims:
+        direct_fields = ['id_visita']
+    columns = [select_column(f) for f in direct_fields]
+    cached = []
+    for dim in cached_dims:
+        positions = tuple((f, position) for position, f in enumerate(dim.fields) if f in node_fields)
+        cached.append((dim.alias, len(columns), positions))
+        columns.append(f"{FACT_ALIAS}.{dim.key}")
+    return PageProjection(
+        columns=tuple(columns),
+        aliases=required_aliases(direct_fields),
+        direct=tuple((f, i) for i, f in enumerate(direct_fields) if f in node_fields),
+        cached=tuple(cached),
+        timestamp_index=direct_fields.index('timestamp_visita') if cursors else None,
+        id_index=direct_fields.index('id_visita') if cursors else None,
+    )
@@ -0,0 +1,152 @@
+"""Full-result cache for `getVisitas`.
+
+Dashboards repeat the same `getVisitas` request (same filter, same page, same fields) many
+times a minute. The resolver looks each request up here before it queues any SQL; a hit
+returns the `VisitaConnection` built for an earlier identical request.
+
+- Key: the canonical filter key from `filter_compiler` (shape plus values, so filters that
+  differ only in spelling share an entry), the pagination arguments and the
+  `VisitaSelection`.
+- Invalidation: every entry belongs to the pool's data-version token. The token moves on
+  any commit, including the ingest writer's group commits and a replaced database file, and
+  then the whole cache is dropped. Results stored under an older token are discarded.
+- Eviction: least recently used entries are evicted once the estimated size of all entries
+  exceeds `RESPONSE_CACHE_MAX_BYTES`, and entries expire `RESPONSE_CACHE_TTL` seconds
+  after they were stored.
+
+Cached connections are shared between requests and must not be mutated.
+"""
+import os
+import sys
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE_ENABLED", "1") == "1"
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", "300"))  # Seconds; 0 disables expiry
+
+_ENTRY_OVERHEAD = 512  # Key, connection, page info and bookkeeping
+
+
+def estimate_size(connection: Any) -> int:
+    """Approximate memory held by a `VisitaConnection` (its rows dominate).
+
+    Edges are `VisitaRow` tuples. Tuple values are dimension rows owned by the dimension
+    cache and are not counted.
+    """
+    size = _ENTRY_OVERHEAD
+    for row in connection.edges:
+        size += sys.getsizeof(row)
+        for value in row:
+            if not isinstance(value, tuple):
+                size += sys.getsizeof(value)
+    return size
+
+
+class ResponseCache:
+    """LRU/TTL map of request key -> `VisitaConnection`, bounded by estimated bytes."""
+
+    def __init__(self, max_bytes: int = RESPONSE_CACHE_MAX_BYTES, ttl: float = RESPONSE_CACHE_TTL):
+        if max_bytes < 1:
+            raise ValueError("Response cache `max_bytes` must be positive.")
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, tuple[Any, int, float]]" = OrderedDict()  # key -> (connection, size, expires)
+        self._bytes = 0
+        self._token: Optional[Hashable] = None
+        self._counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    @staticmethod
+    def key(filter_key: Hashable, cursor_args: Any, offset_args: Any, selection: Hashable, approximate: Any = None) -> Hashable:
+        """Identity of a `getVisitas` request: filter, pagination, selected fields and sampling."""
+        cursor = (cursor_args.first, cursor_args.last, cursor_args.after, cursor_args.before) if cursor_args else None
+        offset = (offset_args.limit, offset_args.offset) if offset_args else None
+        sample = (approximate.sample_rows, approximate.confidence) if approximate else None
+        return filter_key, cursor, offset, selection, sample
+
+    def _sync_token(self, token: Hashable) -> None:
+        """Drops every entry when the data changed. Callers hold the lock."""
+        if token != self._token:
+            if self._entries:
+                self._counters["invalidations"] += 1
+            self._entries.clear()
+            self._bytes = 0
+            self._token = token
+
+    def get(self, key: Hashable, token: Hashable) -> Optional[Any]:
+        with self._lock:
+            self._sync_token(token)
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl and entry[2] <= time.monotonic():
+                self._discard(key)
+                self._counters["expirations"] += 1
+                entry = None
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return entry[0]
+
+    def put(self, key: Hashable, token: Hashable, connection: Any) -> None:
+        """Stores a result computed at `token`; results of an older data version are dropped."""
+        size = estimate_size(connection)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if self._token is not None and token < self._token:
+                return
+            self._sync_token(token)
+            if key in self._entries:
+                self._discard(key)
+            self._entries[key] = (connection, size, time.monotonic() + self.ttl)
+            self._bytes += size
+            self._counters["stores"] += 1
+            while self._bytes > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+                self._counters["evictions"] += 1
+
+    def _discard(self, key: Hashable) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._token = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                "ttl": self.ttl, **self._counters,
+            }
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Returns this process's response cache, or None when `RESPONSE_CACHE_ENABLED=0`."""
+    global _cache
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    cache = _cache
+    if cache is not None and cache.pid == os.getpid():
+        return cache
+    with _cache_lock:
+        if _cache is None or _cache.pid != os.getpid():
+            _cache = ResponseCache()
+        return _cache
+
+
+def close_response_cache() -> None:
+    global _cache
+    with _cache_lock:
+        _cache = None
@@ -0,0 +1,219 @@
+"""Pre-aggregated visit counts next to `FatoVisitas`, maintained from an `id_visita` watermark.
+
+Each rollup stores `visits` per combination of its grain fields: the calendar fields of
+`DimTempo` (daily or hourly) plus domain, page, browser, device type, country and referrer
+type. Keys hold the dimension *values*, NULLs included, so any filter or grouping on grain
+fields evaluates on a rollup row exactly as on each of the visits it counts.
+
+Facts are assumed to be append-only: a refresh folds the facts above the watermark into
+the rollups, matching existing rows null-safely (`IS`), and advances the watermark in the
+same transaction. Deleting or rewriting facts requires `rebuild_rollups()`.
+
+Usage:
+    python rollups.py [--database database.db] [--rebuild]
+"""
+import os
+import sqlite3
+import argparse
+import threading
+from typing import Any, Dict, FrozenSet, Hashable, Iterable, List, NamedTuple, Optional, Tuple
+
+from db_pool import DATABASE_FILE, get_pool
+from filter_compiler import CompiledFilter, INT_FIELDS, render_group, render_leaf
+from query_planner import build_from_clause, required_aliases
+from warehouse import FACT_ALIAS, FIELD_MAPPING
+
+ROLLUPS_ENABLED = os.environ.get("ROLLUPS_ENABLED", "1") == "1"
+ROLLUP_AUTO_REFRESH = os.environ.get("ROLLUP_AUTO_REFRESH", "0") == "1"  # Let reads fold new facts in (takes the write lock)
+
+ROLLUP_DIMENSION_FIELDS = ("nome_dominio", "caminho_pagina", "nome_navegador", "tipo_dispositivo", "pais_geografia", "tipo_referencia")
+WATERMARK_TABLE = "RollupWatermark"
+ROLLUP_ALIAS = "r"
+
+
+class Rollup(NamedTuple):
+    table: str
+    fields: Tuple[str, ...]  # VisitaType fields forming the grain, in column order
+
+    @property
+    def field_set(self) -> FrozenSet[str]:
+        return frozenset(self.fields)
+
+
+# Coarsest first: routing picks the first rollup whose grain covers a request
+ROLLUPS: Tuple[Rollup, ...] = (
+    Rollup("RollupVisitasDia", ("ano", "mes", "dia", "dia_semana") + ROLLUP_DIMENSION_FIELDS),
+    Rollup("RollupVisitasHora", ("ano", "mes", "dia", "dia_semana", "hora") + ROLLUP_DIMENSION_FIELDS),
+)
+
+
+def _ddl(rollup: Rollup) -> List[str]:
+    columns = ", ".join(f"{field} {'INTEGER' if field in INT_FIELDS else 'TEXT'}" for field in rollup.fields)
+    return [
+        f"CREATE TABLE IF NOT EXISTS {rollup.table} ({columns}, visits INTEGER NOT NULL)",
+        f"CREATE INDEX IF NOT EXISTS idx_{rollup.table.lower()}_grain ON {rollup.table} ({', '.join(rollup.fields)})",
+    ]
+
+
+def ensure_rollup_tables(conn: sqlite3.Connection) -> None:
+    """Creates the rollup and watermark tables if missing."""
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {WATERMARK_TABLE} (rollup TEXT PRIMARY KEY, id_visita INTEGER NOT NULL)")
+    for rollup in ROLLUPS:
+        for statement in _ddl(rollup):
+            conn.execute(statement)
+
+
+def _watermarks(conn: sqlite3.Connection) -> Dict[str, int]:
+    try:
+        return dict(conn.execute(f"SELECT rollup, id_visita FROM {WATERMARK_TABLE}").fetchall())
+    except sqlite3.OperationalError:  # Tables not created yet
+        return {}
+
+
+def _fold(conn: sqlite3.Connection, rollup: Rollup, low: int, high: int) -> int:
+    """Adds the facts with `low < id_visita <= high` to `rollup`; returns the number of groups touched."""
+    keys = [f"{FIELD_MAPPING[field][0]}.{FIELD_MAPPING[field][1]}" for field in rollup.fields]
+    select_list = ", ".join(f"{key} AS {field}" for key, field in zip(keys, rollup.fields))
+    names = ", ".join(rollup.fields)
+    matches = " AND ".join(f"{ROLLUP_ALIAS}.{field} IS d.{field}" for field in rollup.fields)
+    conn.execute("DROP TABLE IF EXISTS temp.rollup_delta")
+    conn.execute(
+        f"CREATE TEMP TABLE rollup_delta AS SELECT {select_list}, COUNT(*) AS visits"
+        f"{build_from_clause(required_aliases(rollup.fields))}"
+        f" WHERE {FACT_ALIAS}.id_visita > ? AND {FACT_ALIAS}.id_visita <= ? GROUP BY {', '.join(keys)}",
+        (low, high),
+    )
+    conn.execute(
+        f"UPDATE {rollup.table} AS {ROLLUP_ALIAS} SET visits = {ROLLUP_ALIAS}.visits + d.visits FROM temp.rollup_delta d WHERE {matches}"
+    )
+    conn.execute(
+        f"INSERT INTO {rollup.table} ({names}, visits) SELECT {names}, visits FROM temp.rollup_delta d"
+        f" WHERE NOT EXISTS (SELECT 1 FROM {rollup.table} {ROLLUP_ALIAS} WHERE {matches})"
+    )
+    touched = conn.execute("SELECT COUNT(*) FROM temp.rollup_delta").fetchone()[0]
+    conn.execute("DROP TABLE temp.rollup_delta")
+    return touched
+
+
+def refresh_rollups(conn: sqlite3.Connection) -> Dict[str, int]:
+    """Folds facts above each rollup's watermark into it. Returns the groups touched per rollup."""
+    ensure_rollup_tables(conn)
+    conn.commit()
+    conn.execute("BEGIN IMMEDIATE")  # Read the watermarks under the write lock: concurrent refreshes serialize
+    try:
+        high = conn.execute("SELECT COALESCE(MAX(id_visita), 0) FROM FatoVisitas").fetchone()[0]
+        watermarks = _watermarks(conn)
+        touched = {}
+        for rollup in ROLLUPS:
+            low = watermarks.get(rollup.table)
+            if low is not None and low >= high:
+                continue
+            if high > (low or 0):
+                touched[rollup.table] = _fold(conn, rollup, low or 0, high)
+            conn.execute(
+                f"INSERT INTO {WATERMARK_TABLE} (rollup, id_visita) VALUES (?, ?)"
+                f" ON CONFLICT (rollup) DO UPDATE SET id_visita = excluded.id_visita",
+                (rollup.table, high),
+            )
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return touched
+
+
+def rebuild_rollups(conn: sqlite3.Connection) -> Dict[str, int]:
+    """Empties the rollups and folds in every fact again (after facts were deleted or changed)."""
+    ensure_rollup_tables(conn)
+    for rollup in ROLLUPS:
+        conn.execute(f"DELETE FROM {rollup.table}")
+    conn.execute(f"DELETE FROM {WATERMARK_TABLE}")
+    conn.commit()
+    return refresh_rollups(conn)
+
+
+def choose_rollup(fields: Iterable[str]) -> Optional[Rollup]:
+    """Returns the coarsest rollup whose grain contains all `fields` (filter and group-by)."""
+    fields = frozenset(fields)
+    for rollup in ROLLUPS:
+        if fields <= rollup.field_set:
+            return rollup
+    return None
+
+
+def fresh_rollups(conn: sqlite3.Connection, auto_refresh: bool = ROLLUP_AUTO_REFRESH) -> FrozenSet[str]:
+    """Returns the tables of the rollups that cover every fact, refreshing them first if allowed.
+
+    Refreshing holds the write lock while it folds the new facts, and its commit moves the
+    data version, so reads only do it with `ROLLUP_AUTO_REFRESH=1`.
+    """
+    high = conn.execute("SELECT COALESCE(MAX(id_visita), 0) FROM FatoVisitas").fetchone()[0]
+    watermarks = _watermarks(conn)
+    if auto_refresh and any(watermarks.get(rollup.table, -1) < high for rollup in ROLLUPS):
+        refresh_rollups(conn)
+        watermarks = _watermarks(conn)
+    return frozenset(rollup.table for rollup in ROLLUPS if watermarks.get(rollup.table, -1) >= high)
+
+
+# --- Routing ---
+_fresh_lock = threading.Lock()
+_fresh: Tuple[Optional[Hashable], FrozenSet[str]] = (None, frozenset())
+
+
+def route_rollup(conn: sqlite3.Connection, fields: Iterable[str], token: Hashable) -> Optional[Rollup]:
+    """Returns the rollup that can answer a count over `fields`, or None to use the fact table.
+
+    Freshness is checked once per data-version `token` by comparing watermarks. A rollup
+    that is behind is skipped until the ingest writer or `python rollups.py` catches it up
+    (or, with `ROLLUP_AUTO_REFRESH=1` and a writable pool, until this call refreshes it).
+    """
+    global _fresh
+    if not ROLLUPS_ENABLED:
+        return None
+    rollup = choose_rollup(fields)
+    if rollup is None:
+        return None
+    fresh_token, fresh = _fresh
+    if fresh_token != token:
+        with _fresh_lock:
+            fresh_token, fresh = _fresh
+            if fresh_token != token:
+                fresh = fresh_rollups(conn, ROLLUP_AUTO_REFRESH and not get_pool().read_only)
+                _fresh = (token, fresh)
+    return rollup if rollup.table in fresh else None
+
+
+def rollup_where(rollup: Rollup, compiled_filter: CompiledFilter) -> str:
+    """Renders a compiled filter against the rollup's columns (same parameters)."""
+    if compiled_filter.shape is None:
+        return ""
+    return " WHERE " + render_group(
+        compiled_filter.shape,
+        lambda field_name, operators: render_leaf(field_name, operators, f"{ROLLUP_ALIAS}.{field_name}"),
+    )
+
+
+def rollup_count_query(rollup: Rollup, compiled_filter: CompiledFilter) -> Tuple[str, List[Any]]:
+    """Builds the `totalCount` statement answered from `rollup`."""
+    query = f"SELECT COALESCE(SUM({ROLLUP_ALIAS}.visits), 0) FROM {rollup.table} {ROLLUP_ALIAS}{rollup_where(rollup, compiled_filter)}"
+    return query, list(compiled_filter.params)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Refresh the visit rollup tables.")
+    parser.add_argument("--database", default=DATABASE_FILE)
+    parser.add_argument("--rebuild", action="store_true", help="Recompute the rollups from scratch.")
+    args = parser.parse_args(argv)
+    conn = sqlite3.connect(args.database)
+    try:
+        touched = rebuild_rollups(conn) if args.rebuild else refresh_rollups(conn)
+        for table, groups in touched.items():
+            print(f"{table}: {groups} group(s) updated")
+        if not touched:
+            print("Rollups are up to date.")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Approximate counts from a deterministic `id_visita`-range sample of the fact table.
+
+`getVisitas(approximate: {...})` estimates `totalCount` without reading every matching
+fact. The id space `[MIN(id_visita), MAX(id_visita)]` is split into `APPROXIMATE_SAMPLE_BLOCKS`
+strata. The first ids of each stratum form one block, and together the blocks hold about
+`sampleRows` ids. Because ids ascend with time, every period of the table contributes to
+the sample. One statement reads the blocks through rowid range seeks and counts the
+matching facts per block:
+
+    WITH sample_blocks(lo, hi) AS (VALUES (?, ?), ...)
+    SELECT sb.lo, COUNT(fv.id_visita), SUM(CASE WHEN <filter> THEN 1 ELSE 0 END)
+    FROM sample_blocks sb CROSS JOIN FatoVisitas fv ... WHERE fv.id_visita BETWEEN sb.lo AND sb.hi GROUP BY sb.lo
+
+The estimate is the matching rate per id times the id span. The confidence interval comes
+from the variance between blocks, as in stratified sampling with one cluster per stratum,
+with the finite-population correction. When nothing matches, the upper bound uses the
+"rule of three" generalisation, `-ln(1 - confidence)` matches over the sampled ids. Blocks
+are fixed by the id span, so the same data always yields the same estimate. The cost is
+bounded by `sampleRows` whatever the table size. When the blocks would cover the whole
+span, the count is exact.
+"""
+import os
+import math
+import sqlite3
+from statistics import NormalDist
+from typing import Callable, Iterable, List, NamedTuple, Sequence, Tuple
+
+from filter_compiler import CompiledFilter
+from query_planner import build_from_clause
+from warehouse import FACT_ALIAS, FACT_TABLE
+
+APPROXIMATE_SAMPLE_ROWS = int(os.environ.get("APPROXIMATE_SAMPLE_ROWS", "100000"))  # Default sample size (ids)
+APPROXIMATE_MAX_SAMPLE_ROWS = int(os.environ.get("APPROXIMATE_MAX_SAMPLE_ROWS", "5000000"))
+APPROXIMATE_SAMPLE_BLOCKS = int(os.environ.get("APPROXIMATE_SAMPLE_BLOCKS", "64"))
+
+
+class CountEstimate(NamedTuple):
+    value: int
+    lower: int
+    upper: int
+    confidence: float
+    sample_fraction: float  # Sampled ids / id span
+    sampled_rows: int  # Facts read
+    exact: bool
+
+
+def sample_blocks(min_id: int, max_id: int, sample_rows: int, blocks: int = APPROXIMATE_SAMPLE_BLOCKS) -> List[Tuple[int, int]]:
+    """The `(lo, hi)` id ranges to read: one at the start of each of `blocks` equal strata."""
+    span = max_id - min_id + 1
+    width = max(1, math.ceil(sample_rows / blocks))
+    if width * blocks >= span:
+        return [(min_id, max_id)]
+    stride = span / blocks
+    return [(min_id + int(i * stride), min_id + int(i * stride) + width - 1) for i in range(blocks)]
+
+
+def estimate_count(conn: sqlite3.Connection, aliases: Iterable[str], compiled_filter: CompiledFilter, sample_rows: int,
+                   confidence: float, run: Callable[[str, Sequence], List[tuple]]) -> CountEstimate:
+    """Estimates the number of facts matching `compiled_filter` (see the module docstring).
+
+    `aliases` are the dimensions the filter needs joined and `run(sql, params)` returns all rows.
+    """
+    min_id, max_id = conn.execute(  # Separate subqueries: each one is a single rowid seek
+        f"SELECT (SELECT MIN(id_visita) FROM {FACT_TABLE}), (SELECT MAX(id_visita) FROM {FACT_TABLE})"
+    ).fetchone()
+    if min_id is None:
+        return CountEstimate(0, 0, 0, confidence, 1.0, 0, True)
+    blocks = sample_blocks(min_id, max_id, sample_rows)
+    condition = compiled_filter.condition or "1"
+    values = ", ".join("(?, ?)" for _ in blocks)
+    from_blocks = build_from_clause(aliases, leading="sample_blocks sb")
+    query = (
+        f"WITH sample_blocks(lo, hi) AS (VALUES {values}) "
+        f"SELECT sb.lo, COUNT({FACT_ALIAS}.id_visita), SUM(CASE WHEN {condition} THEN 1 ELSE 0 END)"
+        f"{from_blocks} WHERE {FACT_ALIAS}.id_visita BETWEEN sb.lo AND sb.hi GROUP BY sb.lo"
+    )
+    params = [bound for block in blocks for bound in block] + list(compiled_filter.params)
+    per_block = {lo: (read, matched) for lo, read, matched in run(query, params)}
+    sampled_rows = sum(read for read, _ in per_block.values())
+    matches = sum(matched for _, matched in per_block.values())
+    span = max_id - min_id + 1
+    sampled_ids = sum(hi - lo + 1 for lo, hi in blocks)
+    if len(blocks) == 1 and sampled_ids == span:
+        return CountEstimate(matches, matches, matches, confidence, 1.0, sampled_rows, True)
+
+    # Per-block matching rate per id; the estimate is the mean rate times the id span
+    rates = [per_block.get(lo, (0, 0))[1] / (hi - lo + 1) for lo, hi in blocks]
+    fraction = sampled_ids / span
+    estimate = span * matches / sampled_ids
+    if matches:
+        mean = sum(rates) / len(rates)
+        variance = sum((rate - mean) ** 2 for rate in rates) / max(1, len(rates) - 1) / len(rates) * (1 - fraction)
+        margin = NormalDist().inv_cdf((1 + confidence) / 2) * span * math.sqrt(variance)
+        lower, upper = max(matches, estimate - margin), estimate + margin
+    else:
+        lower, upper = 0, span * -math.log(1 - confidence) / sampled_ids
+    return CountEstimate(
+        round(estimate), math.floor(lower), math.ceil(upper), confidence, fraction, sampled_rows, False,
+    )
@@ -2,18 +2,40 @@ import strawberry
 import datetime
 import sqlite3
 import os
+import time
 import base64
-from typing import List, Optional, Any, Tuple
+from enum import Enum
+from functools import lru_cache
+from operator import itemgetter
+from typing import Hashable, List, Optional, Any, Tuple
+
+from aggregates import AGGREGATE_MAX_LIMIT, GROUPABLE_FIELDS, METRICS, ROLLUP_METRICS, build_aggregate_query
+
+from bitmap_index import BITMAP_PAGE_MAX_IDS, get_bitmap_index, id_set_filter
+from columnar import get_columnar_store
+from count_cache import get_count_cache
+from db_executor import ExecutorSaturatedError, get_executor
+from db_pool import DATABASE_FILE, get_pool
+from dimension_cache import DIMENSION_CACHE_ENABLED, get_dimension_cache
+from filter_compiler import compile_filter
+from filter_inputs import DateTimeFilterInput, IntFilterInput, StringFilterInput, VisitaFilterInput
+from index_advisor import record_statement
+from ingest import IngestQueueFullError, get_ingest_writer
+from metrics import METRICS_ENABLED, RequestTimingExtension, mark_resolved, phase_laps
+from offset_index import get_offset_checkpoints
+from persisted_queries import document_cache_extensions
+from rollups import ROLLUPS_ENABLED, rollup_count_query, route_rollup
+from semi_join import SEMI_JOIN_ENABLED, rewrite_semi_joins
+from slow_query import check_statement
+from response_cache import get_response_cache
+from sampling import APPROXIMATE_MAX_SAMPLE_ROWS, APPROXIMATE_SAMPLE_ROWS, CountEstimate, estimate_count
+from query_planner import (
+    FULL_SELECTION, PageProjection, VisitaSelection, build_from_clause, plan_projection, required_aliases, visita_selection,
+)
+from warehouse import VISITA_FIELDS
 
-DATABASE_FILE = 'database.db'
 DEFAULT_PAGE_SIZE = 20 # Default number of items per page
 
-def get_db_connection():
-    """Establishes a connection to the SQLite database."""
-    conn = sqlite3.connect(DATABASE_FILE)
-    conn.row_factory = sqlite3.Row  # Allows accessing columns by name
-    return conn
-
 # --- Cursor Encoding/Decoding ---
 def encode_cursor(timestamp: int, id_visita: int) -> str:
     """Encodes timestamp and id into a base64 cursor."""
@@ -31,138 +53,15 @@ def decode_cursor(cursor: str) -> Tuple[int, int]:
 
 # --- Filter Clause Builder ---
 def build_where_clause(filter: Any) -> tuple[str, list]:
-    """Builds the SQL WHERE clause and parameters from the VisitaFilterInput."""
-    local_params = [] # Use local params list for this specific build instance
-
-    # Mapping (remains the same)
-    field_mapping = {
-        "nome_dominio": ("dd", "nome_dominio"), "caminho_pagina": ("dp", "caminho_pagina"),
-        "url_completa": ("du", "url_completa"), "nome_navegador": ("dn", "nome_navegador"),
-        "versao_navegador": ("dn", "versao_navegador"), "motor_renderizacao_navegador": ("dn", "motor_renderizacao"),
-        "so_usuario_navegador": ("dn", "sistema_operacional_usuario"), "utm_source": ("dut", "utm_source"),
-        "utm_medium": ("dut", "utm_medium"), "utm_campaign": ("dut", "utm_campaign"),
-        "utm_term": ("dut", "utm_term"), "utm_content": ("dut", "utm_content"),
-        "id_usuario_sessao": ("ds", "id_usuario_sessao"), "id_sessao_navegador": ("ds", "id_sessao_navegador"),
-        "tipo_dispositivo": ("ddi", "tipo_dispositivo"), "marca_dispositivo": ("ddi", "marca_dispositivo"),
-        "modelo_dispositivo": ("ddi", "modelo_dispositivo"), "resolucao_tela": ("ddi", "resolucao_tela"),
-        "endereco_ip": ("dip", "endereco_ip"), "data_completa": ("dt", "data_completa"),
-        "ano": ("dt", "ano"), "mes": ("dt", "mes"), "dia": ("dt", "dia"), "dia_semana": ("dt", "dia_semana"),
-        "hora": ("dt", "hora"), "minuto": ("dt", "minuto"), "pais_geografia": ("dg", "pais"),
-        "regiao_geografia": ("dg", "regiao"), "cidade_geografia": ("dg", "cidade"),
-        "url_referencia": ("dr", "url_referencia"), "tipo_referencia": ("dr", "tipo_referencia"),
-        "id_visita": ("fv", "id_visita"), "timestamp_visita": ("fv", "timestamp_visita")
-    }
-
-    # Condition builders (modify to use local_params)
-    def build_string_condition(field_name, filter_input):
-        alias, column = field_mapping[field_name]
-        field_conditions = []
-        if filter_input.equals is not None:
-            field_conditions.append(f"{alias}.{column} = ?")
-            local_params.append(filter_input.equals)
-        # ... (other string conditions appending to local_params) ...
-        if filter_input.notEquals is not None: field_conditions.append(f"{alias}.{column} != ?"); local_params.append(filter_input.notEquals)
-        if filter_input.contains is not None: field_conditions.append(f"{alias}.{column} LIKE ?"); local_params.append(f"%{filter_input.contains}%")
-        if filter_input.startsWith is not None: field_conditions.append(f"{alias}.{column} LIKE ?"); local_params.append(f"{filter_input.startsWith}%")
-        if filter_input.endsWith is not None: field_conditions.append(f"{alias}.{column} LIKE ?"); local_params.append(f"%{filter_input.endsWith}")
-        if filter_input.In is not None:
-            placeholders = ', '.join('?' for _ in filter_input.In); field_conditions.append(f"{alias}.{column} IN ({placeholders})"); local_params.extend(filter_input.In)
-        if filter_input.notIn is not None:
-            placeholders = ', '.join('?' for _ in filter_input.notIn); field_conditions.append(f"{alias}.{column} NOT IN ({placeholders})"); local_params.extend(filter_input.notIn)
-        return " AND ".join(field_conditions) if field_conditions else ""
-
-    def build_int_condition(field_name, filter_input):
-        alias, column = field_mapping[field_name]
-        field_conditions = []
-        if filter_input.equals is not None: field_conditions.append(f"{alias}.{column} = ?"); local_params.append(filter_input.equals)
-        if filter_input.notEquals is not None: field_conditions.append(f"{alias}.{column} != ?"); local_params.append(filter_input.notEquals)
-        if filter_input.greaterThan is not None: field_conditions.append(f"{alias}.{column} > ?"); local_params.append(filter_input.greaterThan)
-        if filter_input.greaterThanOrEqual is not None: field_conditions.append(f"{alias}.{column} >= ?"); local_params.append(filter_input.greaterThanOrEqual)
-        if filter_input.lessThan is not None: field_conditions.append(f"{alias}.{column} < ?"); local_params.append(filter_input.lessThan)
-        if filter_input.lessThanOrEqual is not None: field_conditions.append(f"{alias}.{column} <= ?"); local_params.append(filter_input.lessThanOrEqual)
-        if filter_input.In is not None:
-            placeholders = ', '.join('?' for _ in filter_input.In); field_conditions.append(f"{alias}.{column} IN ({placeholders})"); local_params.extend(filter_input.In)
-        if filter_input.notIn is not None:
-            placeholders = ', '.join('?' for _ in filter_input.notIn); field_conditions.append(f"{alias}.{column} NOT IN ({placeholders})"); local_params.extend(filter_input.notIn)
-        if filter_input.between is not None and len(filter_input.between) == 2:
-            field_conditions.append(f"{alias}.{column} BETWEEN ? AND ?"); local_params.extend(filter_input.between)
-        if filter_input.notBetween is not None and len(filter_input.notBetween) == 2:
-            field_conditions.append(f"{alias}.{column} NOT BETWEEN ? AND ?"); local_params.extend(filter_input.notBetween)
-        return " AND ".join(field_conditions) if field_conditions else ""
-
-    def build_datetime_condition(field_name, filter_input):
-        alias, column = field_mapping[field_name]
-        field_conditions = []
-        if filter_input.equals is not None: field_conditions.append(f"{alias}.{column} = ?"); local_params.append(int(filter_input.equals.timestamp()))
-        if filter_input.notEquals is not None: field_conditions.append(f"{alias}.{column} != ?"); local_params.append(int(filter_input.notEquals.timestamp()))
-        if filter_input.greaterThan is not None: field_conditions.append(f"{alias}.{column} > ?"); local_params.append(int(filter_input.greaterThan.timestamp()))
-        if filter_input.greaterThanOrEqual is not None: field_conditions.append(f"{alias}.{column} >= ?"); local_params.append(int(filter_input.greaterThanOrEqual.timestamp()))
-        if filter_input.lessThan is not None: field_conditions.append(f"{alias}.{column} < ?"); local_params.append(int(filter_input.lessThan.timestamp()))
-        if filter_input.lessThanOrEqual is not None: field_conditions.append(f"{alias}.{column} <= ?"); local_params.append(int(filter_input.lessThanOrEqual.timestamp()))
-        if filter_input.In is not None:
-            timestamps = [int(dt.timestamp()) for dt in filter_input.In]; placeholders = ', '.join('?'*len(timestamps)); field_conditions.append(f"{alias}.{column} IN ({placeholders})"); local_params.extend(timestamps)
-        if filter_input.notIn is not None:
-            timestamps = [int(dt.timestamp()) for dt in filter_input.notIn]; placeholders = ', '.join('?'*len(timestamps)); field_conditions.append(f"{alias}.{column} NOT IN ({placeholders})"); local_params.extend(timestamps)
-        if filter_input.between is not None and len(filter_input.between) == 2:
-            timestamps = [int(dt.timestamp()) for dt in filter_input.between]; field_conditions.append(f"{alias}.{column} BETWEEN ? AND ?"); local_params.extend(timestamps)
-        if filter_input.notBetween is not None and len(filter_input.notBetween) == 2:
-            timestamps = [int(dt.timestamp()) for dt in filter_input.notBetween]; field_conditions.append(f"{alias}.{column} NOT BETWEEN ? AND ?"); local_params.extend(timestamps)
-        return " AND ".join(field_conditions) if field_conditions else ""
-
-    # Recursive helper (uses local_params via condition builders)
-    def _build_clause_recursively(current_filter_obj):
-        parts = []
-        direct_field_strings = []
-        for field_name, f_input_val in current_filter_obj.__dict__.items():
-            if field_name in ["AND", "OR"] or f_input_val is None: continue
-            cond_str = ""
-            if isinstance(f_input_val, StringFilterInput): cond_str = build_string_condition(field_name, f_input_val)
-            elif isinstance(f_input_val, IntFilterInput): cond_str = build_int_condition(field_name, f_input_val)
-            elif isinstance(f_input_val, DateTimeFilterInput) and field_name == "timestamp_visita": cond_str = build_datetime_condition(field_name, f_input_val)
-            if cond_str: direct_field_strings.append(f"({cond_str})" if " AND " in cond_str else cond_str)
-        if direct_field_strings: parts.append(f"({' AND '.join(direct_field_strings)})" if len(direct_field_strings) > 1 else direct_field_strings[0])
-        if current_filter_obj.AND:
-            sub_clauses = [_build_clause_recursively(sub) for sub in current_filter_obj.AND if sub]
-            if sub_clauses: parts.append(f"({' AND '.join(s for s in sub_clauses if s)})")
-        if current_filter_obj.OR:
-            sub_clauses = [_build_clause_recursively(sub) for sub in current_filter_obj.OR if sub]
-            if sub_clauses: parts.append(f"({' OR '.join(s for s in sub_clauses if s)})")
-        return " AND ".join(p for p in parts if p)
-
-    # Main part
-    if filter:
-        final_clause_str = _build_clause_recursively(filter)
-        if final_clause_str:
-            where_clause = " WHERE " + final_clause_str
-            return where_clause, local_params
-    return "", local_params
-
-
-# --- GraphQL Types ---
+    """Builds the SQL WHERE clause and parameters from the VisitaFilterInput.
 
-# Define generic InputFilter types
-@strawberry.input
-class StringFilterInput:
-    equals: Optional[str] = None; notEquals: Optional[str] = None; contains: Optional[str] = None
-    startsWith: Optional[str] = None; endsWith: Optional[str] = None
-    In: Optional[List[str]] = None; notIn: Optional[List[str]] = None
+    The SQL text is cached per filter shape by `filter_compiler`; only the parameters are rebuilt.
+    """
+    compiled = compile_filter(filter)
+    return compiled.where, compiled.params
 
-@strawberry.input
-class IntFilterInput:
-    equals: Optional[int] = None; notEquals: Optional[int] = None
-    greaterThan: Optional[int] = None; greaterThanOrEqual: Optional[int] = None
-    lessThan: Optional[int] = None; lessThanOrEqual: Optional[int] = None
-    In: Optional[List[int]] = None; notIn: Optional[List[int]] = None
-    between: Optional[tuple[int, int]] = None; notBetween: Optional[tuple[int, int]] = None
 
-@strawberry.input
-class DateTimeFilterInput:
-    equals: Optional[datetime.datetime] = None; notEquals: Optional[datetime.datetime] = None
-    greaterThan: Optional[datetime.datetime] = None; greaterThanOrEqual: Optional[datetime.datetime] = None
-    lessThan: Optional[datetime.datetime] = None; lessThanOrEqual: Optional[datetime.datetime] = None
-    In: Optional[List[datetime.datetime]] = None; notIn: Optional[List[datetime.datetime]] = None
-    between: Optional[tuple[datetime.datetime, datetime.datetime]] = None
-    notBetween: Optional[tuple[datetime.datetime, datetime.datetime]] = None
+# --- GraphQL Types ---
 
 # Define generic InputFilter types
 @strawberry.input
@@ -177,6 +76,12 @@ class PaginationModeInput:
     limit: Optional[int] = None
     offset: Optional[int] = None
 
+@strawberry.input
+class ApproximateInput:
+    """Estimates `totalCount` from an `id_visita`-range sample of about `sampleRows` facts."""
+    sample_rows: Optional[int] = None # Defaults to APPROXIMATE_SAMPLE_ROWS
+    confidence: float = 0.95
+
 # Define the consolidated VisitaType
 @strawberry.type
 class VisitaType:
@@ -201,40 +106,516 @@ class PageInfo:
 class VisitaEdge:
     node: VisitaType; cursor: str
 
+@strawberry.type
+class TotalCountEstimate:
+    value: int; lower: int; upper: int; confidence: float
+    sample_fraction: float; sampled_rows: int; exact: bool
+
 @strawberry.type
 class VisitaConnection:
     edges: List[VisitaEdge]; pageInfo: PageInfo; totalCount: int; pageSize: int; pageCount: int
+    totalCountEstimate: Optional[TotalCountEstimate] = None # Only with `approximate`
+
+# --- Aggregation Types ---
+# One enum value per groupable VisitaType field (NOME_DOMINIO -> nome_dominio, ...)
+VisitaGroupBy = strawberry.enum(Enum("VisitaGroupBy", {field.upper(): field for field in GROUPABLE_FIELDS}))
+VisitaMetric = strawberry.enum(Enum("VisitaMetric", {metric.upper(): metric for metric in METRICS}))
+
+@strawberry.enum
+class SortDirection(Enum):
+    ASC = "asc"
+    DESC = "desc"
 
-# Define the VisitaFilterInput
+@strawberry.type
+class VisitaGroup:
+    """Values of the grouped fields; fields not in `groupBy` are null."""
+    nome_dominio: Optional[str] = None; caminho_pagina: Optional[str] = None
+    url_completa: Optional[str] = None; nome_navegador: Optional[str] = None; versao_navegador: Optional[str] = None
+    motor_renderizacao_navegador: Optional[str] = None; so_usuario_navegador: Optional[str] = None
+    utm_source: Optional[str] = None; utm_medium: Optional[str] = None; utm_campaign: Optional[str] = None
+    utm_term: Optional[str] = None; utm_content: Optional[str] = None; id_usuario_sessao: Optional[str] = None
+    id_sessao_navegador: Optional[str] = None; tipo_dispositivo: Optional[str] = None; marca_dispositivo: Optional[str] = None
+    modelo_dispositivo: Optional[str] = None; resolucao_tela: Optional[str] = None; endereco_ip: Optional[str] = None
+    data_completa: Optional[str] = None; ano: Optional[int] = None; mes: Optional[int] = None; dia: Optional[int] = None
+    dia_semana: Optional[int] = None; hora: Optional[int] = None; minuto: Optional[int] = None
+    pais_geografia: Optional[str] = None; regiao_geografia: Optional[str] = None; cidade_geografia: Optional[str] = None
+    url_referencia: Optional[str] = None; tipo_referencia: Optional[str] = None
+
+@strawberry.type
+class VisitaAggregate:
+    """One group; metrics that were not requested are null."""
+    group: VisitaGroup
+    visits: Optional[int] = None; distinct_sessions: Optional[int] = None; distinct_ips: Optional[int] = None
+
+# --- Ingestion Types ---
 @strawberry.input
-class VisitaFilterInput:
-    id_visita: Optional[IntFilterInput] = None; timestamp_visita: Optional[DateTimeFilterInput] = None
-    nome_dominio: Optional[StringFilterInput] = None; caminho_pagina: Optional[StringFilterInput] = None
-    url_completa: Optional[StringFilterInput] = None; nome_navegador: Optional[StringFilterInput] = None
-    versao_navegador: Optional[StringFilterInput] = None; motor_renderizacao_navegador: Optional[StringFilterInput] = None
-    so_usuario_navegador: Optional[StringFilterInput] = None; utm_source: Optional[StringFilterInput] = None
-    utm_medium: Optional[StringFilterInput] = None; utm_campaign: Optional[StringFilterInput] = None
-    utm_term: Optional[StringFilterInput] = None; utm_content: Optional[StringFilterInput] = None
-    id_usuario_sessao: Optional[StringFilterInput] = None; id_sessao_navegador: Optional[StringFilterInput] = None
-    tipo_dispositivo: Optional[StringFilterInput] = None; marca_dispositivo: Optional[StringFilterInput] = None
-    modelo_dispositivo: Optional[StringFilterInput] = None; resolucao_tela: Optional[StringFilterInput] = None
-    endereco_ip: Optional[StringFilterInput] = None; data_completa: Optional[StringFilterInput] = None
-    ano: Optional[IntFilterInput] = None; mes: Optional[IntFilterInput] = None; dia: Optional[IntFilterInput] = None
-    dia_semana: Optional[IntFilterInput] = None; hora: Optional[IntFilterInput] = None; minuto: Optional[IntFilterInput] = None
-    pais_geografia: Optional[StringFilterInput] = None; regiao_geografia: Optional[StringFilterInput] = None
-    cidade_geografia: Optional[StringFilterInput] = None; url_referencia: Optional[StringFilterInput] = None
-    tipo_referencia: Optional[StringFilterInput] = None
-    AND: Optional[List['VisitaFilterInput']] = None; OR: Optional[List['VisitaFilterInput']] = None
+class VisitaEventInput:
+    """A raw visit; the DimTempo attributes are derived from `timestampVisita`."""
+    timestamp_visita: datetime.datetime; nome_dominio: str; caminho_pagina: str; url_completa: str
+    nome_navegador: str; so_usuario_navegador: str; id_sessao_navegador: str; tipo_dispositivo: str; endereco_ip: str
+    versao_navegador: Optional[str] = None; motor_renderizacao_navegador: Optional[str] = None
+    utm_source: Optional[str] = None; utm_medium: Optional[str] = None; utm_campaign: Optional[str] = None
+    utm_term: Optional[str] = None; utm_content: Optional[str] = None; id_usuario_sessao: Optional[str] = None
+    marca_dispositivo: Optional[str] = None; modelo_dispositivo: Optional[str] = None; resolucao_tela: Optional[str] = None
+    pais_geografia: Optional[str] = None; regiao_geografia: Optional[str] = None; cidade_geografia: Optional[str] = None
+    url_referencia: Optional[str] = None; tipo_referencia: Optional[str] = None
+
+@strawberry.type
+class VisitaIngestResult:
+    """Visits written by one batch; they get consecutive ids."""
+    accepted: int; first_id_visita: Optional[int] = None; last_id_visita: Optional[int] = None
+
+# --- Resolver Data Access (runs on a database executor thread) ---
+class VisitaRow(tuple):
+    """A page row served as both its `VisitaEdge` and its `VisitaType` node.
+
+    The tuple is the page query's row followed by the cached dimension rows. `_row_class`
+    derives one subclass per `PageProjection` whose selected fields are properties over
+    those positions, so a row costs one allocation and no per-field attributes. Strawberry
+    resolves fields with `getattr`, which calls the properties. `timestamp_visita` becomes
+    a datetime and `cursor` is encoded only when they are resolved. Rows are immutable,
+    so the response cache can share them between requests.
+    """
+    __slots__ = ()
+    _fields: Tuple[str, ...] = ()
+    _cursor_keys: Optional[Tuple[int, int]] = None  # Row indexes of (timestamp_visita, id_visita)
+
+    @property
+    def node(self) -> "VisitaRow":
+        return self
+
+    @property
+    def cursor(self) -> Optional[str]:
+        keys = self._cursor_keys
+        return encode_cursor(self[keys[0]], self[keys[1]]) if keys else None
+
+def _timestamp_property(index: int) -> property:
+    return property(lambda row: datetime.datetime.fromtimestamp(row[index]))
+
+def _cached_property(index: int, position: int) -> property:
+    return property(lambda row: row[index][position] if row[index] is not None else None)
+
+@lru_cache(maxsize=256)
+def _row_class(projection: PageProjection, cursors: bool) -> type:
+    """The `VisitaRow` subclass reading `projection`'s rows (see VisitaRow)."""
+    attributes: dict = {"__slots__": ()}
+    for field, index in projection.direct:
+        attributes[field] = _timestamp_property(index) if field == 'timestamp_visita' else property(itemgetter(index))
+    for offset, (_, _, positions) in enumerate(projection.cached):
+        for field, position in positions:
+            attributes[field] = _cached_property(len(projection.columns) + offset, position)
+    attributes["_fields"] = tuple(f for f in VISITA_FIELDS if f in attributes)
+    if cursors:
+        attributes["_cursor_keys"] = (projection.timestamp_index, projection.id_index)
+    return type("VisitaRow", (VisitaRow,), attributes)
+
+def _run_count(conn: sqlite3.Connection, laps, count_query: str, params: list) -> List[tuple]:
+    """Runs a COUNT statement over the facts and returns its rows."""
+    record_statement(count_query)
+    laps.statement(count_query)
+    started = time.perf_counter()
+    rows = conn.execute(count_query, params).fetchall()
+    check_statement(conn, "count", count_query, params, started)
+    return rows
+
+def _fetch_visitas(
+    conn: sqlite3.Connection,
+    filter: Optional[VisitaFilterInput],
+    cursor_args: Optional[CursorModeInput],
+    offset_args: Optional[PaginationModeInput],
+    selection: VisitaSelection = FULL_SELECTION,
+    approximate: Optional[ApproximateInput] = None,
+    cache_key: Optional[Hashable] = None,
+    cache_token: Optional[Hashable] = None
+) -> VisitaConnection:
+    """Runs the count and page queries for `getVisitas` on a pooled connection.
+
+    Each statement runs only if the `selection` needs it: the count for `totalCount`, the
+    page query for `edges`, `pageInfo` or `pageCount`. Only the dimensions referenced by the
+    filter are joined for the count, and only those referenced by the filter or by the
+    selected node fields are joined for the page, which reads just the selected columns.
+    Fields of cached dimensions are read as fact foreign keys and filled in from memory, and
+    dimension predicates are resolved to foreign-key sets first (see `semi_join`); a filter
+    that can match nothing skips both statements. Deep offsets start from a keyset
+    checkpoint (see `offset_index`) instead of scanning every skipped row, and counts
+    within a rollup's grain are summed from it (see `rollups`). With the bitmap index enabled,
+    filters on indexed dimensions are evaluated as bitmap operations (see `bitmap_index`):
+    the set size answers `totalCount` and small sets are fetched by rowid. Other counts use
+    the in-memory fact columns when the columnar engine is enabled (see `columnar`). The
+    remaining SQL counts are shared per filter and, after writes, only count the new facts
+    (see `count_cache`). With `approximate`, a count that would need that SQL is estimated
+    from a bounded sample instead (see `sampling`), unless the count cache already holds it.
+    With a `cache_key`, the result is stored in the response cache under `cache_token`
+    (see `response_cache`); failed queries are never cached.
+    """
+    # --- Determine Pagination Mode & Variables ---
+    pagination_mode = "default"
+    requested_page_size = DEFAULT_PAGE_SIZE # Initialize with default
+    sql_limit = DEFAULT_PAGE_SIZE # This will be adjusted, potentially +1 for cursor
+    sql_offset = 0
+    order_by_clause = " ORDER BY fv.timestamp_visita ASC, fv.id_visita ASC "
+    pagination_conditions = []
+    pagination_params = []
+    fetch_extra_for_page_info = False
+
+    if cursor_args:
+        pagination_mode = "cursor"
+        fetch_extra_for_page_info = True
+        after_timestamp, after_id = decode_cursor(cursor_args.after) if cursor_args.after else (None, None)
+        before_timestamp, before_id = decode_cursor(cursor_args.before) if cursor_args.before else (None, None)
+
+        if cursor_args.first is not None:
+            requested_page_size = cursor_args.first
+            sql_limit = cursor_args.first + 1
+            if after_timestamp is not None:
+                pagination_conditions.append("(fv.timestamp_visita, fv.id_visita) > (?, ?)") # Row value: index range seek
+                pagination_params.extend([after_timestamp, after_id])
+        elif cursor_args.last is not None:
+            requested_page_size = cursor_args.last
+            sql_limit = cursor_args.last + 1
+            order_by_clause = " ORDER BY fv.timestamp_visita DESC, fv.id_visita DESC "
+            if before_timestamp is not None:
+                pagination_conditions.append("(fv.timestamp_visita, fv.id_visita) < (?, ?)")
+                pagination_params.extend([before_timestamp, before_id])
+        else: # cursor_args provided, but no first/last (e.g. only after/before, which is invalid by earlier checks, or empty object)
+              # In this case, sql_limit for query will be DEFAULT_PAGE_SIZE + 1, requested_page_size remains DEFAULT_PAGE_SIZE
+             sql_limit = DEFAULT_PAGE_SIZE + 1
+
+
+    elif offset_args:
+        pagination_mode = "offset"
+        if offset_args.limit is not None:
+            requested_page_size = offset_args.limit
+            sql_limit = offset_args.limit
+        else: # limit is None, use default
+            requested_page_size = DEFAULT_PAGE_SIZE
+            sql_limit = DEFAULT_PAGE_SIZE
+        sql_offset = offset_args.offset if offset_args.offset is not None else 0
+    else: # Default mode (no pagination args provided)
+        pagination_mode = "offset" # Treat default as offset
+        requested_page_size = DEFAULT_PAGE_SIZE
+        sql_limit = DEFAULT_PAGE_SIZE
+        sql_offset = 0
+
+    try:
+        laps = phase_laps("getVisitas") # Phase timings, when the operation is instrumented (see `metrics`)
+        node_fields = selection.node_fields
+        total_count = None # Only computed when `totalCount` is selected
+        count_estimate = None # Set when `approximate` sampled the count
+        rows_scanned = 0
+
+        # --- Compile the filter once (count and page share it) ---
+        compiled_filter = compile_filter(filter)
+        laps.lap("compile_filter")
+        dimension_cache = get_dimension_cache() if DIMENSION_CACHE_ENABLED and selection.needs_rows else None
+        cached_aliases = dimension_cache.aliases & required_aliases(node_fields) if dimension_cache else frozenset()
+        rewrite_filter = SEMI_JOIN_ENABLED and compiled_filter.shape is not None
+        filter_key = compiled_filter.key
+        offset_checkpoints = get_offset_checkpoints() if pagination_mode == "offset" and selection.needs_rows else None
+        deep_offset = offset_checkpoints is not None and sql_offset >= offset_checkpoints.interval
+        columnar_store = get_columnar_store() if selection.total_count else None
+        count_cache = get_count_cache() if selection.total_count else None
+        bitmap_index = get_bitmap_index()
+        count_from_rollup = ROLLUPS_ENABLED and selection.total_count
+        data_token = (
+            get_pool().data_version()
+            if rewrite_filter or cached_aliases or deep_offset or count_from_rollup or columnar_store or bitmap_index or count_cache
+            else None
+        )
+        # Counts whose filter fits a rollup's grain sum pre-aggregated rows instead of facts
+        count_rollup = route_rollup(conn, compiled_filter.fields, data_token) if count_from_rollup else None
+        value_filter = compiled_filter # Rollups, bitmaps and the columnar store need the filter on dimension values, before rewriting
+
+        # --- Evaluate the filter on the bitmap index, when it covers the filter's fields ---
+        matches_nothing = False
+        bitmap_rows = None
+        if bitmap_index is not None and (selection.needs_rows or (selection.total_count and count_rollup is None)):
+            bitmap_rows = bitmap_index.rows(conn, compiled_filter, data_token)
+        bitmap_count = len(bitmap_rows) if bitmap_rows is not None else None
+        if bitmap_count == 0:
+            matches_nothing = True
+        elif bitmap_count is not None and selection.needs_rows and bitmap_count <= BITMAP_PAGE_MAX_IDS:
+            compiled_filter = id_set_filter(bitmap_rows) # The page query fetches the matching rows by rowid
+            rewrite_filter = False
+
+        # --- Resolve dimension predicates to foreign-key sets (no JOIN needed to filter) ---
+        if rewrite_filter and not matches_nothing:
+            rewritten_filter = rewrite_semi_joins(compiled_filter, conn, data_token)
+            if rewritten_filter is None:
+                matches_nothing = True # Some required dimension value does not exist
+            else:
+                compiled_filter = rewritten_filter
+
+        # --- Plan JOINs from the filter and the selection ---
+        filter_aliases = required_aliases(compiled_filter.fields)
+        projection = plan_projection(node_fields, selection.cursors, cached_aliases)
+        page_aliases = filter_aliases | projection.aliases
+        laps.lap("plan")
+
+        # --- Calculate Total Count (with filter), only if requested ---
+        if selection.total_count and matches_nothing:
+            total_count = 0
+        elif selection.total_count and count_rollup is not None:
+            count_query, count_params = rollup_count_query(count_rollup, value_filter)
+            record_statement(count_query)
+            laps.statement(count_query)
+            started = time.perf_counter()
+            total_count = conn.execute(count_query, count_params).fetchone()[0]
+            check_statement(conn, "count", count_query, count_params, started)
+        elif selection.total_count and bitmap_count is not None:
+            total_count = bitmap_count
+        elif selection.total_count and columnar_store is not None:
+            total_count = columnar_store.count(conn, value_filter, data_token)
+        elif selection.total_count and approximate is not None:
+            # A count already cached for this data version is exact: no reason to sample
+            total_count = count_cache.cached(filter_key, data_token) if count_cache is not None else None
+            if total_count is None:
+                count_estimate = estimate_count(
+                    conn, filter_aliases, compiled_filter,
+                    approximate.sample_rows or APPROXIMATE_SAMPLE_ROWS, approximate.confidence,
+                    lambda query, params: _run_count(conn, laps, query, params)
+                )
+                total_count = count_estimate.value
+                rows_scanned += count_estimate.sampled_rows
+        elif selection.total_count and count_cache is not None:
+            # Shared across pages and pagination modes; only facts above the cached high-water mark are counted
+            total_count, counted = count_cache.count(
+                filter_key, data_token, build_from_clause(filter_aliases), compiled_filter,
+                lambda query, params: _run_count(conn, laps, query, params)[0]
+            )
+            rows_scanned += counted
+        elif selection.total_count:
+            count_query_from_join = build_from_clause(filter_aliases)
+            count_query = f"SELECT COUNT(fv.id_visita) {count_query_from_join} {compiled_filter.where}"
+            total_count = _run_count(conn, laps, count_query, compiled_filter.params)[0][0]
+            rows_scanned += total_count # COUNT visits every matching fact
+        if selection.total_count:
+            laps.lap("count")
+        if approximate is not None and total_count is not None and count_estimate is None:
+            count_estimate = CountEstimate(total_count, total_count, total_count, approximate.confidence, 1.0, 0, True)
+
+        # Offset mode without a count probes one extra row to know whether a next page exists
+        probe_next_page = pagination_mode == "offset" and (total_count is None or count_estimate is not None)
+        if probe_next_page:
+            sql_limit += 1
+
+        # --- Build and Execute Main Data Query, only if edges/pageInfo/pageCount are requested ---
+        rows = []
+        if selection.needs_rows and not matches_nothing:
+            if cached_aliases:
+                dimension_cache.refresh(conn, data_token)
+            # Deep offsets seek to the nearest checkpoint and skip only the remainder
+            scan_offset = sql_offset
+            if deep_offset:
+                seek_conditions, seek_params, scan_offset = offset_checkpoints.seek(
+                    conn, filter_key, data_token, build_from_clause(filter_aliases),
+                    compiled_filter.condition, compiled_filter.params, sql_offset
+                )
+                pagination_conditions.extend(seek_conditions)
+                pagination_params.extend(seek_params)
+            cursor = conn.cursor()
+            # Only the selected columns are read, plus the fact keys that cursors are built from
+            select_part = " SELECT " + ", ".join(projection.columns) + " "
+            from_join_part = build_from_clause(page_aliases)
+
+            # Combine filter and pagination conditions
+            all_conditions = []
+            if compiled_filter.condition: all_conditions.append(compiled_filter.condition)
+            if pagination_conditions: all_conditions.extend(pagination_conditions)
+            final_where_clause = " WHERE " + " AND ".join(all_conditions) if all_conditions else ""
+
+            all_params = compiled_filter.params + pagination_params # Combine params
+
+            # Add LIMIT/OFFSET based on mode
+            limit_offset_clause = ""
+            if pagination_mode == "cursor":
+                limit_offset_clause = f" LIMIT ?"
+                all_params.append(sql_limit) # Use limit potentially increased by 1
+            elif pagination_mode == "offset":
+                limit_offset_clause = f" LIMIT ? OFFSET ?"
+                all_params.append(sql_limit)
+                all_params.append(scan_offset)
+
+            final_query = select_part + from_join_part + final_where_clause + order_by_clause + limit_offset_clause
+
+            record_statement(final_query)
+            laps.statement(final_query)
+            started = time.perf_counter()
+            cursor.execute(final_query, all_params)
+            laps.lap("page_query")
+            rows = cursor.fetchall()
+            laps.lap("fetchall")
+            check_statement(conn, "page", final_query, all_params, started)
+            rows_scanned += scan_offset + len(rows) # OFFSET steps over the skipped rows
+
+        # --- Process results for Connection ---
+        has_next = False
+        has_previous = False
+        
+        # Cursor mode page info logic
+        if pagination_mode == "cursor" and fetch_extra_for_page_info and len(rows) == sql_limit:
+            if cursor_args and cursor_args.last is not None: # Backward pagination
+                has_previous = True
+                rows = rows[:-1] # Remove extra item fetched for check
+            else: # Forward pagination (or if cursor_args is None but somehow in cursor_mode)
+                has_next = True
+                rows = rows[:-1] # Remove extra item fetched for check
+        
+        # Offset mode page info logic
+        elif pagination_mode == "offset":
+             has_previous = sql_offset > 0
+             if probe_next_page:
+                 has_next = len(rows) == sql_limit
+                 rows = rows[:sql_limit - 1] # Remove extra item fetched for check
+             else:
+                 has_next = (sql_offset + len(rows)) < total_count
+
+        # Reverse results if backward pagination was used (cursor mode only)
+        if pagination_mode == "cursor" and cursor_args and cursor_args.last is not None:
+            rows.reverse()
+
+        # Build Edges (one tuple-backed VisitaRow per row, exposing only the selected fields)
+        row_class = _row_class(projection, selection.cursors)
+        if projection.cached:
+            lookups = [(alias, key_index) for alias, key_index, _ in projection.cached]
+            dimension_row = dimension_cache.row
+            edges = [row_class((*row, *[dimension_row(conn, alias, row[key_index]) for alias, key_index in lookups])) for row in rows]
+        else:
+            edges = list(map(row_class, rows))
+        laps.lap("build_nodes")
+        laps.rows(rows_scanned, len(edges))
+
+        # Build PageInfo
+        page_info = PageInfo(
+            has_next_page=has_next,
+            has_previous_page=has_previous,
+            start_cursor=edges[0].cursor if edges else None,
+            end_cursor=edges[-1].cursor if edges else None
+        )
+
+        # Return Connection
+        connection = VisitaConnection(edges=edges, pageInfo=page_info, totalCount=total_count, pageSize=requested_page_size, pageCount=len(edges))
+        if approximate is not None and count_estimate is not None:
+            connection.totalCountEstimate = TotalCountEstimate(**count_estimate._asdict())
+        if cache_key is not None:
+            get_response_cache().put(cache_key, cache_token, connection)
+        return connection
+
+    except ValueError as e: # Catch specific validation/cursor errors
+         print(f"Input error: {e}")
+         raise e # Re-raise for Strawberry to handle
+    except sqlite3.Error as e:
+        print(f"Database error in resolver: {e}")
+        # In a real API, you might want to return a more specific GraphQL error
+        # For now, return an empty connection on DB errors
+        return VisitaConnection(edges=[], pageInfo=PageInfo(has_next_page=False, has_previous_page=False), totalCount=0, pageSize=0, pageCount=0) # pageCount 0 for error
+
+def _fetch_aggregates(
+    conn: sqlite3.Connection,
+    filter: Optional[VisitaFilterInput],
+    group_by: List[str],
+    metrics: List[str],
+    order_by: Optional[str],
+    descending: bool,
+    limit: Optional[int]
+) -> List[VisitaAggregate]:
+    """Runs the `aggregateVisitas` GROUP BY statement on a pooled connection."""
+    laps = phase_laps("aggregateVisitas")
+    compiled_filter = compile_filter(filter)
+    laps.lap("compile_filter")
+    rollup = None
+    if ROLLUPS_ENABLED and set(metrics) <= set(ROLLUP_METRICS):
+        rollup = route_rollup(conn, compiled_filter.fields | set(group_by), get_pool().data_version())
+    columnar_store = get_columnar_store() if rollup is None else None
+    if columnar_store is not None:
+        rows = columnar_store.aggregate(
+            conn, compiled_filter, group_by, metrics, order_by, descending, limit, get_pool().data_version()
+        )
+        if rows is not None:
+            return _aggregate_rows(rows, group_by, metrics)
+    if rollup is None and SEMI_JOIN_ENABLED and compiled_filter.shape is not None:
+        compiled_filter = rewrite_semi_joins(compiled_filter, conn, get_pool().data_version())
+        if compiled_filter is None: # Nothing matches: no groups, or a single all-zero total
+            return [] if group_by else [VisitaAggregate(group=VisitaGroup(), **{metric: 0 for metric in metrics})]
+    query, params = build_aggregate_query(compiled_filter, group_by, metrics, order_by, descending, limit, rollup)
+    record_statement(query)
+    laps.statement(query)
+    try:
+        started = time.perf_counter()
+        rows = conn.execute(query, params).fetchall()
+    except sqlite3.Error as e:
+        print(f"Database error in resolver: {e}")
+        return []
+    laps.lap("query")
+    check_statement(conn, "aggregate", query, params, started)
+    aggregates = _aggregate_rows(rows, group_by, metrics)
+    laps.lap("build_nodes")
+    laps.rows(len(rows), len(aggregates))
+    return aggregates
+
+def _aggregate_rows(rows, group_by: List[str], metrics: List[str]) -> List[VisitaAggregate]:
+    """Builds `VisitaAggregate` objects from rows of group values followed by metric values."""
+    key_count = len(group_by)
+    return [
+        VisitaAggregate(
+            group=VisitaGroup(**dict(zip(group_by, row[:key_count]))),
+            **dict(zip(metrics, row[key_count:]))
+        )
+        for row in rows
+    ]
+
+def _retry_later(info: strawberry.Info) -> None:
+    """Marks the HTTP response 503 so load balancers/clients back off."""
+    response = info.context.get("response") if isinstance(info.context, dict) else None
+    if response is not None:
+        response.status_code = 503
+        response.headers["Retry-After"] = "1"
+
+def _cached_fetch_visitas(
+    conn: sqlite3.Connection,
+    filter: Optional[VisitaFilterInput],
+    cursor_args: Optional[CursorModeInput],
+    offset_args: Optional[PaginationModeInput],
+    selection: VisitaSelection,
+    approximate: Optional[ApproximateInput]
+) -> VisitaConnection:
+    """`_fetch_visitas` behind the response cache, when it is enabled.
+
+    Runs on the database executor: reading the data version is a PRAGMA on the pool's
+    watcher connection and must not block the event loop.
+    """
+    response_cache = get_response_cache()
+    if response_cache is None:
+        return _fetch_visitas(conn, filter, cursor_args, offset_args, selection, approximate)
+    laps = phase_laps("getVisitas")
+    cache_key = response_cache.key(compile_filter(filter).key, cursor_args, offset_args, selection, approximate)
+    cache_token = get_pool().data_version()
+    connection = response_cache.get(cache_key, cache_token)
+    laps.lap("response_cache")
+    if connection is not None:
+        laps.rows(0, len(connection.edges))
+        return connection
+    return _fetch_visitas(conn, filter, cursor_args, offset_args, selection, approximate, cache_key, cache_token)
+
+async def _run_on_executor(info: strawberry.Info, fn, *args):
+    """Runs `fn(conn, *args)` on the database executor, answering 503 when it is saturated."""
+    try:
+        return await get_executor().run_with_connection(fn, *args)
+    except ExecutorSaturatedError:
+        _retry_later(info) # Fail fast instead of queueing behind slow queries
+        raise
 
 # Define the Query type
 @strawberry.type
 class Query:
     @strawberry.field
-    def get_visitas(
+    async def get_visitas(
         self,
+        info: strawberry.Info,
         filter: Optional[VisitaFilterInput] = None,
         cursor_args: Optional[CursorModeInput] = None,
-        offset_args: Optional[PaginationModeInput] = None
+        offset_args: Optional[PaginationModeInput] = None,
+        approximate: Optional[ApproximateInput] = None
     ) -> VisitaConnection:
         # --- Argument Validation ---
         if cursor_args and offset_args:
@@ -260,183 +641,83 @@ class Query:
             if offset_args.offset is not None and offset_args.offset < 0:
                 raise ValueError("`offset` argument in `offsetArgs` must be non-negative.")
 
-        # --- Determine Pagination Mode & Variables ---
-        pagination_mode = "default"
-        requested_page_size = DEFAULT_PAGE_SIZE # Initialize with default
-        sql_limit = DEFAULT_PAGE_SIZE # This will be adjusted, potentially +1 for cursor
-        sql_offset = 0
-        order_by_clause = " ORDER BY fv.timestamp_visita ASC, fv.id_visita ASC "
-        pagination_conditions = []
-        pagination_params = []
-        fetch_extra_for_page_info = False
+        # Validate approximate
+        if approximate:
+            if approximate.sample_rows is not None and not 0 < approximate.sample_rows <= APPROXIMATE_MAX_SAMPLE_ROWS:
+                raise ValueError(f"`sampleRows` in `approximate` must be between 1 and {APPROXIMATE_MAX_SAMPLE_ROWS}.")
+            if not 0 < approximate.confidence < 1:
+                raise ValueError("`confidence` in `approximate` must be between 0 and 1 (exclusive).")
+
+        # --- Run the SQL off the event loop (repeated requests are answered from the response cache) ---
+        selection = visita_selection(info)
+        connection = await _run_on_executor(
+            info, _cached_fetch_visitas, filter, cursor_args, offset_args, selection, approximate
+        )
+        mark_resolved()
+        return connection
 
-        if cursor_args:
-            pagination_mode = "cursor"
-            fetch_extra_for_page_info = True
-            after_timestamp, after_id = decode_cursor(cursor_args.after) if cursor_args.after else (None, None)
-            before_timestamp, before_id = decode_cursor(cursor_args.before) if cursor_args.before else (None, None)
-
-            if cursor_args.first is not None:
-                requested_page_size = cursor_args.first
-                sql_limit = cursor_args.first + 1
-                if after_timestamp is not None:
-                    pagination_conditions.append("(fv.timestamp_visita > ? OR (fv.timestamp_visita = ? AND fv.id_visita > ?))")
-                    pagination_params.extend([after_timestamp, after_timestamp, after_id])
-            elif cursor_args.last is not None:
-                requested_page_size = cursor_args.last
-                sql_limit = cursor_args.last + 1
-                order_by_clause = " ORDER BY fv.timestamp_visita DESC, fv.id_visita DESC "
-                if before_timestamp is not None:
-                    pagination_conditions.append("(fv.timestamp_visita < ? OR (fv.timestamp_visita = ? AND fv.id_visita < ?))")
-                    pagination_params.extend([before_timestamp, before_timestamp, before_id])
-            else: # cursor_args provided, but no first/last (e.g. only after/before, which is invalid by earlier checks, or empty object)
-                  # In this case, sql_limit for query will be DEFAULT_PAGE_SIZE + 1, requested_page_size remains DEFAULT_PAGE_SIZE
-                 sql_limit = DEFAULT_PAGE_SIZE + 1
-
-
-        elif offset_args:
-            pagination_mode = "offset"
-            if offset_args.limit is not None:
-                requested_page_size = offset_args.limit
-                sql_limit = offset_args.limit
-            else: # limit is None, use default
-                requested_page_size = DEFAULT_PAGE_SIZE
-                sql_limit = DEFAULT_PAGE_SIZE
-            sql_offset = offset_args.offset if offset_args.offset is not None else 0
-        else: # Default mode (no pagination args provided)
-            pagination_mode = "offset" # Treat default as offset
-            requested_page_size = DEFAULT_PAGE_SIZE
-            sql_limit = DEFAULT_PAGE_SIZE
-            sql_offset = 0
-
-        conn = None
+    @strawberry.field
+    async def aggregate_visitas(
+        self,
+        info: strawberry.Info,
+        filter: Optional[VisitaFilterInput] = None,
+        group_by: Optional[List[VisitaGroupBy]] = None,
+        metrics: Optional[List[VisitaMetric]] = None,
+        order_by: Optional[VisitaMetric] = None,
+        order_direction: SortDirection = SortDirection.DESC,
+        limit: Optional[int] = None
+    ) -> List[VisitaAggregate]:
+        """Counts visits per group of the `groupBy` fields (top-N with `orderBy` and `limit`)."""
+        group_fields = list(dict.fromkeys(field.value for field in group_by or []))
+        metric_names = list(dict.fromkeys(metric.value for metric in metrics or [])) or ["visits"]
+        if limit is not None and not 0 <= limit <= AGGREGATE_MAX_LIMIT:
+            raise ValueError(f"`limit` must be between 0 and {AGGREGATE_MAX_LIMIT}.")
+        if order_by is not None and order_by.value not in metric_names:
+            raise ValueError("`orderBy` must be one of the requested `metrics`.")
+        aggregates = await _run_on_executor(
+            info, _fetch_aggregates, filter, group_fields, metric_names,
+            order_by.value if order_by else None, order_direction == SortDirection.DESC,
+            AGGREGATE_MAX_LIMIT if limit is None else limit
+        )
+        mark_resolved()
+        return aggregates
+
+# Define the Mutation type
+@strawberry.type
+class Mutation:
+    @strawberry.mutation
+    async def ingest_visitas(self, info: strawberry.Info, events: List[VisitaEventInput]) -> VisitaIngestResult:
+        """Writes a batch of visits; concurrent batches are committed together by the ingest writer."""
         try:
-            conn = get_db_connection()
-
-            # --- Calculate Total Count (with filter) ---
-            count_query_from_join = """
-            FROM FatoVisitas fv
-            JOIN DimDominio dd ON fv.id_dim_dominio = dd.id_dim_dominio
-            JOIN DimPagina dp ON fv.id_dim_pagina = dp.id_dim_pagina
-            JOIN DimUrl du ON fv.id_dim_url = du.id_dim_url
-            JOIN DimNavegador dn ON fv.id_dim_navegador = dn.id_dim_navegador
-            LEFT JOIN DimUtm dut ON fv.id_dim_utm = dut.id_dim_utm
-            JOIN DimSessao ds ON fv.id_dim_sessao = ds.id_dim_sessao
-            JOIN DimDispositivo ddi ON fv.id_dim_dispositivo = ddi.id_dim_dispositivo
-            JOIN DimIp dip ON fv.id_dim_ip = dip.id_dim_ip
-            JOIN DimTempo dt ON fv.id_dim_tempo = dt.id_dim_tempo
-            LEFT JOIN DimGeografia dg ON fv.id_dim_geografia = dg.id_dim_geografia
-            LEFT JOIN DimReferencia dr ON fv.id_dim_referencia = dr.id_dim_referencia
-            """
-            filter_where_clause_for_count, filter_params_for_count = build_where_clause(filter)
-            count_query = f"SELECT COUNT(fv.id_visita) {count_query_from_join} {filter_where_clause_for_count}"
-            count_cursor = conn.cursor()
-            count_cursor.execute(count_query, filter_params_for_count)
-            total_count = count_cursor.fetchone()[0]
-            count_cursor.close()
-
-            # --- Build and Execute Main Data Query ---
-            cursor = conn.cursor()
-            select_part = """ SELECT fv.id_visita, fv.timestamp_visita, dd.nome_dominio, dp.caminho_pagina, du.url_completa, dn.nome_navegador, dn.versao_navegador, dn.motor_renderizacao, dn.sistema_operacional_usuario, dut.utm_source, dut.utm_medium, dut.utm_campaign, dut.utm_term, dut.utm_content, ds.id_usuario_sessao, ds.id_sessao_navegador, ddi.tipo_dispositivo, ddi.marca_dispositivo, ddi.modelo_dispositivo, ddi.resolucao_tela, dip.endereco_ip, dt.data_completa, dt.ano, dt.mes, dt.dia, dt.dia_semana, dt.hora, dt.minuto, dg.pais AS pais_geografia, dg.regiao AS regiao_geografia, dg.cidade AS cidade_geografia, dr.url_referencia, dr.tipo_referencia """
-            from_join_part = count_query_from_join # Reuse from count query
-
-            # Build filter clause again for main query (params list is managed locally by build_where_clause)
-            filter_where_clause, filter_params = build_where_clause(filter)
-
-            # Combine filter and pagination conditions
-            all_conditions = []
-            if filter_where_clause: all_conditions.append(filter_where_clause[7:]) # Strip " WHERE "
-            if pagination_conditions: all_conditions.extend(pagination_conditions)
-            final_where_clause = " WHERE " + " AND ".join(all_conditions) if all_conditions else ""
-
-            all_params = filter_params + pagination_params # Combine params
-
-            # Add LIMIT/OFFSET based on mode
-            limit_offset_clause = ""
-            if pagination_mode == "cursor":
-                limit_offset_clause = f" LIMIT ?"
-                all_params.append(sql_limit) # Use limit potentially increased by 1
-            elif pagination_mode == "offset":
-                limit_offset_clause = f" LIMIT ? OFFSET ?"
-                all_params.append(sql_limit)
-                all_params.append(sql_offset)
-
-            final_query = select_part + from_join_part + final_where_clause + order_by_clause + limit_offset_clause
-
-            # print(f"Executing SQL: {final_query}") # Debug
-            # print(f"With params: {all_params}") # Debug
-            cursor.execute(final_query, all_params)
-            rows = cursor.fetchall()
-
-            # --- Process results for Connection ---
-            has_next = False
-            has_previous = False
-            
-            # Cursor mode page info logic
-            if pagination_mode == "cursor" and fetch_extra_for_page_info and len(rows) == sql_limit:
-                if cursor_args and cursor_args.last is not None: # Backward pagination
-                    has_previous = True
-                    rows = rows[:-1] # Remove extra item fetched for check
-                else: # Forward pagination (or if cursor_args is None but somehow in cursor_mode)
-                    has_next = True
-                    rows = rows[:-1] # Remove extra item fetched for check
-            
-            # Offset mode page info logic
-            elif pagination_mode == "offset":
-                 has_previous = sql_offset > 0
-                 has_next = (sql_offset + len(rows)) < total_count
-
-            # Reverse results if backward pagination was used (cursor mode only)
-            if pagination_mode == "cursor" and cursor_args and cursor_args.last is not None:
-                rows.reverse()
-
-            # Build Edges
-            edges = []
-            for row in rows:
-                node = VisitaType(
-                    id_visita=row['id_visita'], timestamp_visita=datetime.datetime.fromtimestamp(row['timestamp_visita']),
-                    nome_dominio=row['nome_dominio'], caminho_pagina=row['caminho_pagina'], url_completa=row['url_completa'],
-                    nome_navegador=row['nome_navegador'], versao_navegador=row['versao_navegador'], motor_renderizacao_navegador=row['motor_renderizacao'],
-                    so_usuario_navegador=row['sistema_operacional_usuario'], utm_source=row['utm_source'], utm_medium=row['utm_medium'],
-                    utm_campaign=row['utm_campaign'], utm_term=row['utm_term'], utm_content=row['utm_content'],
-                    id_usuario_sessao=row['id_usuario_sessao'], id_sessao_navegador=row['id_sessao_navegador'],
-                    tipo_dispositivo=row['tipo_dispositivo'], marca_dispositivo=row['marca_dispositivo'], modelo_dispositivo=row['modelo_dispositivo'],
-                    resolucao_tela=row['resolucao_tela'], endereco_ip=row['endereco_ip'], data_completa=row['data_completa'],
-                    ano=row['ano'], mes=row['mes'], dia=row['dia'], dia_semana=row['dia_semana'], hora=row['hora'], minuto=row['minuto'],
-                    pais_geografia=row['pais_geografia'], regiao_geografia=row['regiao_geografia'], cidade_geografia=row['cidade_geografia'],
-                    url_referencia=row['url_referencia'], tipo_referencia=row['tipo_referencia']
-                )
-                cursor_str = encode_cursor(row['timestamp_visita'], row['id_visita'])
-                edges.append(VisitaEdge(node=node, cursor=cursor_str))
-
-            # Build PageInfo
-            page_info = PageInfo(
-                has_next_page=has_next,
-                has_previous_page=has_previous,
-                start_cursor=edges[0].cursor if edges else None,
-                end_cursor=edges[-1].cursor if edges else None
-            )
-
-            # Return Connection
-            return VisitaConnection(edges=edges, pageInfo=page_info, totalCount=total_count, pageSize=requested_page_size, pageCount=len(edges))
-
-        except ValueError as e: # Catch specific validation/cursor errors
-             print(f"Input error: {e}")
-             raise e # Re-raise for Strawberry to handle
-        except sqlite3.Error as e:
-            print(f"Database error in resolver: {e}")
-            # In a real API, you might want to return a more specific GraphQL error
-            # For now, return an empty connection on DB errors
-            return VisitaConnection(edges=[], pageInfo=PageInfo(has_next_page=False, has_previous_page=False), totalCount=0, pageSize=0, pageCount=0) # pageCount 0 for error
-        finally:
-            if conn:
-                conn.close()
+            result = await get_ingest_writer().ingest_async(events, typed=True) # Validated off the event loop
+        except IngestQueueFullError:
+            _retry_later(info)
+            raise
+        return VisitaIngestResult(accepted=result.accepted, first_id_visita=result.first_id, last_id_visita=result.last_id)
 
 # Create the schema
-schema = strawberry.Schema(query=Query)
+schema = strawberry.Schema(
+    query=Query, mutation=Mutation,
+    extensions=([RequestTimingExtension] if METRICS_ENABLED else []) + document_cache_extensions(),
+)
 
 # Notes:
-# - build_where_clause now uses a local params list to avoid side effects between count and data queries.
+# - Filters are compiled once per request by filter_compiler; the SQL text is cached per filter shape.
+# - Small dimensions are served from dimension_cache instead of being joined for the page query.
+# - Dimension predicates become foreign-key IN lists (semi_join), so filters rarely need a JOIN.
+# - Deep offsets are answered by a keyset seek to a checkpoint plus a small residual offset (offset_index).
 # - totalCount is calculated based only on the filter.
+# - aggregateVisitas shares the filter compilation and pushes GROUP BY/COUNT/ORDER BY/LIMIT into SQL.
+# - Visit counts whose filter and grouping fit a rollup's grain are summed from the rollups tables.
+# - With BITMAP_INDEX_ENABLED=1, filters on indexed dimensions are evaluated as bitmap AND/OR operations.
+# - With COLUMNAR_ENABLED=1 (and NumPy), other counts and aggregates are evaluated over in-memory fact columns.
+# - Each operation is timed per phase (metrics); `X-Request-Timings: 1` returns the timings in `extensions`.
+# - Count, page and aggregate statements slower than SLOW_QUERY_THRESHOLD_MS are explained and logged (slow_query).
+# - totalCount is cached per filter and only counts facts above its high-water mark after writes (count_cache).
+# - With `approximate`, totalCount is estimated from a deterministic id_visita-range sample (sampling).
+# - Repeated getVisitas requests are answered from response_cache until the data version moves.
+# - Page rows are tuple-backed VisitaRow objects; datetimes and cursors are built only when resolved.
+# - Parsed and validated documents are cached per query text, and clients may send only its sha256 (persisted_queries).
+# - ingestVisitas resolves dimension keys from an in-memory map and group-commits facts (ingest).
 # - Pagination logic (cursor or offset) is applied conditionally.
 # - PageInfo calculation differs slightly between cursor and offset modes.
@@ -113,17 +113,21 @@ CREATE TABLE FatoVisitas (
 );
 
 -- Indexes for performance on foreign keys in the fact table
-CREATE INDEX idx_fato_dominio ON FatoVisitas (id_dim_dominio);
+-- Every index entry ends with the rowid (id_visita), so an index on (..., timestamp_visita)
+-- already yields rows in the canonical (timestamp_visita, id_visita) pagination order.
+-- Hot, low-cardinality dimensions get (id_dim_x, timestamp_visita): "filter on dimension +
+-- ordered range" without a temp B-tree sort. Keep in sync with index_advisor.MANAGED_INDEXES.
+CREATE INDEX idx_fato_dominio_timestamp ON FatoVisitas (id_dim_dominio, timestamp_visita);
 CREATE INDEX idx_fato_pagina ON FatoVisitas (id_dim_pagina);
 CREATE INDEX idx_fato_url ON FatoVisitas (id_dim_url);
-CREATE INDEX idx_fato_navegador ON FatoVisitas (id_dim_navegador);
-CREATE INDEX idx_fato_utm ON FatoVisitas (id_dim_utm);
+CREATE INDEX idx_fato_navegador_timestamp ON FatoVisitas (id_dim_navegador, timestamp_visita);
+CREATE INDEX idx_fato_utm_timestamp ON FatoVisitas (id_dim_utm, timestamp_visita);
 CREATE INDEX idx_fato_sessao ON FatoVisitas (id_dim_sessao);
-CREATE INDEX idx_fato_dispositivo ON FatoVisitas (id_dim_dispositivo);
+CREATE INDEX idx_fato_dispositivo_timestamp ON FatoVisitas (id_dim_dispositivo, timestamp_visita);
 CREATE INDEX idx_fato_ip ON FatoVisitas (id_dim_ip);
 CREATE INDEX idx_fato_tempo ON FatoVisitas (id_dim_tempo);
-CREATE INDEX idx_fato_geografia ON FatoVisitas (id_dim_geografia);
-CREATE INDEX idx_fato_referencia ON FatoVisitas (id_dim_referencia);
+CREATE INDEX idx_fato_geografia_timestamp ON FatoVisitas (id_dim_geografia, timestamp_visita);
+CREATE INDEX idx_fato_referencia_timestamp ON FatoVisitas (id_dim_referencia, timestamp_visita);
 CREATE INDEX idx_fato_timestamp ON FatoVisitas (timestamp_visita);
 
 -- Indexes for frequently queried dimension attributes
@@ -3,6 +3,8 @@ import datetime
 import time
 import random
 
+from rollups import refresh_rollups
+
 DATABASE_FILE = 'database.db'
 
 def get_db_connection():
@@ -247,6 +249,7 @@ def seed_data():
         """, fact_data)
 
         conn.commit()
+        refresh_rollups(conn) # Reads never refresh rollups themselves
         print(f"Database '{DATABASE_FILE}' populated with example data.")
 
     except sqlite3.Error as e:
@@ -0,0 +1,197 @@
+"""Rewrites dimension predicates of a compiled filter into foreign-key semi-joins.
+
+`dn.nome_navegador = ?` forces the dimension into the join and lets SQLite drive the plan
+from the fact table. Each dimension leaf is instead resolved against its (small) dimension
+table first, and the fact table is filtered on the foreign key, `fv.id_dim_navegador IN
+(?, ...)`, which can use the `idx_fato_*` indexes. Leaves matching more than
+`SEMI_JOIN_MAX_IDS` keys keep the lookup as a subquery, `fv.id_dim_x IN (SELECT ...)`.
+
+Filters only combine leaves with AND/OR, so a leaf that matches no dimension row is simply
+FALSE: it falsifies its AND group and drops out of its OR group. A filter that simplifies
+to FALSE cannot match any fact row, and the caller skips the fact table entirely.
+"""
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Hashable, List, Optional, Tuple
+
+from filter_compiler import FILTER_CACHE_SIZE, CompiledFilter, render_group, render_leaf, shape_fields
+from warehouse import DIMENSIONS_BY_ALIAS, FACT_ALIAS, FIELD_MAPPING
+
+SEMI_JOIN_ENABLED = os.environ.get("SEMI_JOIN_ENABLED", "1") == "1"
+SEMI_JOIN_MAX_IDS = int(os.environ.get("SEMI_JOIN_MAX_IDS", "1000"))  # Larger key sets stay subqueries
+SEMI_JOIN_CACHE_SIZE = int(os.environ.get("SEMI_JOIN_CACHE_SIZE", "4096"))  # Resolved leaves kept per data version
+
+# Rewritten leaves keep the (field, operators) form with a single pseudo-operator:
+# ("semiJoinIds", key_count) or ("semiJoinSubquery", original_operators)
+_IDS = "semiJoinIds"
+_SUBQUERY = "semiJoinSubquery"
+_FALSE = None  # A group that can match no row
+
+
+class _ResolutionCache:
+    """LRU of resolved dimension leaves, emptied whenever the data-version token changes."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Optional[Tuple[int, ...]]]" = OrderedDict()
+        self._token: Optional[Hashable] = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: Hashable, key: Hashable) -> Tuple[bool, Optional[Tuple[int, ...]]]:
+        with self._lock:
+            if token != self._token:
+                self._entries.clear()
+                self._token = token
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, token: Hashable, key: Hashable, ids: Optional[Tuple[int, ...]]) -> None:
+        with self._lock:
+            if token != self._token:
+                return
+            self._entries[key] = ids
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._token = None
+
+    def info(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+_resolutions = _ResolutionCache(SEMI_JOIN_CACHE_SIZE)
+
+
+def _resolve_leaf(conn: sqlite3.Connection, field_name: str, operators: tuple, params: List[Any],
+                  token: Optional[Hashable], max_ids: int) -> Optional[Tuple[int, ...]]:
+    """Returns the dimension keys matching one leaf, or None if there are more than `max_ids`."""
+    key = (field_name, operators, tuple(params), max_ids)
+    if token is not None:
+        found, ids = _resolutions.get(token, key)
+        if found:
+            return ids
+    dim = DIMENSIONS_BY_ALIAS[FIELD_MAPPING[field_name][0]]
+    rows = conn.execute(
+        f"SELECT {dim.key} FROM {dim.table} {dim.alias} WHERE {render_leaf(field_name, operators)} LIMIT ?",
+        [*params, max_ids + 1],
+    ).fetchall()
+    ids = tuple(row[0] for row in rows) if len(rows) <= max_ids else None
+    if token is not None:
+        _resolutions.put(token, key, ids)
+    return ids
+
+
+def _leaf_param_count(operators: tuple) -> int:
+    return sum(count for _, count in operators)
+
+
+def _group_param_count(group: tuple) -> int:
+    leaves, and_groups, or_groups = group
+    return sum(_leaf_param_count(operators) for _, operators in leaves) + sum(_group_param_count(g) for g in and_groups + or_groups)
+
+
+def _rewrite_group(group: tuple, params: List[Any], position: List[int], new_params: List[Any], resolve) -> Optional[tuple]:
+    """Rewrites one group, consuming its parameters in the order `filter_compiler` emitted them."""
+    leaves, and_groups, or_groups = group
+    new_leaves = []
+    is_false = False
+    for field_name, operators in leaves:
+        count = _leaf_param_count(operators)
+        leaf_params = params[position[0]:position[0] + count]
+        position[0] += count
+        if is_false:
+            continue  # Still consume the parameters of the remaining leaves
+        if FIELD_MAPPING[field_name][0] == FACT_ALIAS:
+            new_leaves.append((field_name, operators))
+            new_params.extend(leaf_params)
+            continue
+        ids = resolve(field_name, operators, leaf_params)
+        if ids is None:
+            new_leaves.append((field_name, ((_SUBQUERY, operators),)))
+            new_params.extend(leaf_params)
+        elif ids:
+            new_leaves.append((field_name, ((_IDS, len(ids)),)))
+            new_params.extend(ids)
+        else:
+            is_false = True
+    new_and_groups = []
+    for sub_group in and_groups:
+        if is_false:
+            position[0] += _group_param_count(sub_group)
+            continue
+        sub_params: List[Any] = []
+        rewritten = _rewrite_group(sub_group, params, position, sub_params, resolve)
+        if rewritten is _FALSE:
+            is_false = True
+        else:
+            new_and_groups.append(rewritten)
+            new_params.extend(sub_params)
+    new_or_groups = []
+    for sub_group in or_groups:
+        if is_false:
+            position[0] += _group_param_count(sub_group)
+            continue
+        sub_params = []
+        rewritten = _rewrite_group(sub_group, params, position, sub_params, resolve)
+        if rewritten is not _FALSE:  # A FALSE branch drops out of the OR, parameters included
+            new_or_groups.append(rewritten)
+            new_params.extend(sub_params)
+    if is_false or (or_groups and not new_or_groups):
+        return _FALSE
+    return (tuple(new_leaves), tuple(new_and_groups), tuple(new_or_groups))
+
+
+def _render_semi_join_leaf(field_name: str, operators: tuple) -> str:
+    alias = FIELD_MAPPING[field_name][0]
+    if alias == FACT_ALIAS:
+        return render_leaf(field_name, operators)
+    dim = DIMENSIONS_BY_ALIAS[alias]
+    (kind, argument), = operators
+    if kind == _IDS:
+        return f"{FACT_ALIAS}.{dim.key} IN ({', '.join('?' * argument)})"
+    return f"{FACT_ALIAS}.{dim.key} IN (SELECT {dim.key} FROM {dim.table} {dim.alias} WHERE {render_leaf(field_name, argument)})"
+
+
+@lru_cache(maxsize=FILTER_CACHE_SIZE)
+def _render_rewritten_shape(shape: tuple) -> str:
+    return render_group(shape, _render_semi_join_leaf)
+
+
+def rewrite_semi_joins(compiled: CompiledFilter, conn: sqlite3.Connection, token: Optional[Hashable] = None,
+                       max_ids: int = SEMI_JOIN_MAX_IDS) -> Optional[CompiledFilter]:
+    """Rewrites the dimension leaves of `compiled` into predicates on fact foreign keys.
+
+    Returns None when the filter cannot match any row. The result references only fact
+    columns, so its `fields` need no JOINs. Resolved leaves are cached until `token` (the
+    pool's data-version token) changes; without a token nothing is cached.
+    """
+    if compiled.shape is None:
+        return compiled
+
+    def resolve(field_name, operators, leaf_params):
+        return _resolve_leaf(conn, field_name, operators, leaf_params, token, max_ids)
+
+    params: List[Any] = []
+    shape = _rewrite_group(compiled.shape, compiled.params, [0], params, resolve)
+    if shape is _FALSE:
+        return None
+    fields = frozenset(f for f in shape_fields(shape) if FIELD_MAPPING[f][0] == FACT_ALIAS)
+    return CompiledFilter(_render_rewritten_shape(shape), params, fields, shape)
+
+
+def semi_join_cache_info() -> dict:
+    """Returns hit/miss counters of the leaf resolution cache."""
+    return _resolutions.info()
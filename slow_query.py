@@ -0,0 +1,168 @@
+"""Slow-query log for the statements run by `getVisitas` and `aggregateVisitas`.
+
+A count, page or aggregate statement that takes longer than `SLOW_QUERY_THRESHOLD_MS` is
+explained right away, on the same connection and with the same parameters, and recorded
+with its normalized SQL, parameter shape (types only; values are never kept), duration
+and `EXPLAIN QUERY PLAN` lines. The plan is flagged for:
+
+- `full_scan`: a SCAN of the fact table (of a whole index, when the statement filters);
+- `temp_btree_order_by`: `USE TEMP B-TREE FOR ORDER BY`;
+- `temp_btree`: other temp B-trees (GROUP BY, DISTINCT);
+- `auto_index`: an automatic index SQLite builds for the statement and then throws away.
+
+Each entry is appended as one JSON line to `SLOW_QUERY_LOG` (rotated at
+`SLOW_QUERY_LOG_MAX_BYTES`; `{pid}` in the path gives each worker process its own file),
+and aggregated per statement shape into an in-memory top-N by worst duration, which
+`GET /admin/slow-queries` returns.
+"""
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from logging.handlers import RotatingFileHandler
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from index_advisor import explain
+
+SLOW_QUERY_ENABLED = os.environ.get("SLOW_QUERY_ENABLED", "1") == "1"
+SLOW_QUERY_THRESHOLD_MS = int(os.environ.get("SLOW_QUERY_THRESHOLD_MS", "200"))
+SLOW_QUERY_TOP_N = int(os.environ.get("SLOW_QUERY_TOP_N", "50"))  # Statement shapes kept in memory
+SLOW_QUERY_LOG = os.environ.get("SLOW_QUERY_LOG", "")  # JSON-lines file; empty keeps entries in memory only
+SLOW_QUERY_LOG_MAX_BYTES = int(os.environ.get("SLOW_QUERY_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+SLOW_QUERY_LOG_BACKUPS = int(os.environ.get("SLOW_QUERY_LOG_BACKUPS", "5"))
+
+
+def parameter_shape(params: Sequence[Any]) -> List[str]:
+    """Describes parameters by type, with runs collapsed: `[1, 2, 'a']` -> `['int*2', 'str']`."""
+    shape: List[List[Any]] = []
+    for value in params:
+        name = type(value).__name__
+        if shape and shape[-1][0] == name:
+            shape[-1][1] += 1
+        else:
+            shape.append([name, 1])
+    return [name if count == 1 else f"{name}*{count}" for name, count in shape]
+
+
+def plan_flags(plan: List[str], full_scans: int) -> List[str]:
+    flags = []
+    if full_scans:
+        flags.append("full_scan")
+    if any("USE TEMP B-TREE FOR ORDER BY" in line for line in plan):
+        flags.append("temp_btree_order_by")
+    if any("USE TEMP B-TREE" in line and "ORDER BY" not in line for line in plan):
+        flags.append("temp_btree")
+    if any("AUTOMATIC" in line for line in plan):
+        flags.append("auto_index")
+    return flags
+
+
+class SlowQueryLog:
+    """Per-process slow statement log: a rotating JSON-lines file plus a top-N by statement shape."""
+
+    def __init__(self, threshold_ms: int = SLOW_QUERY_THRESHOLD_MS, top_n: int = SLOW_QUERY_TOP_N,
+                 path: str = SLOW_QUERY_LOG, max_bytes: int = SLOW_QUERY_LOG_MAX_BYTES,
+                 backups: int = SLOW_QUERY_LOG_BACKUPS):
+        if top_n < 1:
+            raise ValueError("Slow-query `top_n` must be at least 1.")
+        self.threshold_ms = threshold_ms
+        self.top_n = top_n
+        self.pid = os.getpid()
+        self.path = path.format(pid=self.pid) if path else ""
+        self._handler = RotatingFileHandler(self.path, maxBytes=max_bytes, backupCount=backups, delay=True) if self.path else None
+        self._lock = threading.Lock()
+        self._top: Dict[Tuple[str, str, Tuple[str, ...]], dict] = {}  # (kind, sql, parameter shape) -> aggregate
+        self._counters = {"recorded": 0, "explain_errors": 0}
+
+    def record(self, conn: sqlite3.Connection, kind: str, sql: str, params: Sequence[Any], duration_ms: float) -> dict:
+        """Explains a slow statement and stores the entry; returns it."""
+        statement = " ".join(sql.split())
+        try:
+            plan, issues = explain(conn, sql, params)
+            flags = plan_flags(plan, issues.full_scans)
+        except sqlite3.Error as e:  # E.g. the connection was interrupted
+            plan, flags = [f"EXPLAIN failed: {e}"], []
+            with self._lock:
+                self._counters["explain_errors"] += 1
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "kind": kind, "sql": statement,
+            "params": parameter_shape(params), "durationMs": round(duration_ms, 3), "plan": plan, "flags": flags,
+        }
+        key = (kind, statement, tuple(entry["params"]))
+        with self._lock:
+            self._counters["recorded"] += 1
+            item = self._top.get(key)
+            if item is None:
+                item = self._top[key] = {
+                    "kind": kind, "sql": statement, "params": entry["params"], "count": 0, "totalMs": 0.0, "maxMs": 0.0,
+                }
+            item["count"] += 1
+            item["totalMs"] += duration_ms
+            if duration_ms >= item["maxMs"]:
+                item.update(maxMs=duration_ms, plan=plan, flags=flags, lastSlowest=entry["time"])
+            item["lastSeen"] = entry["time"]
+            if len(self._top) > 2 * self.top_n:  # Prune in batches to keep recording cheap
+                keep = sorted(self._top.items(), key=lambda pair: pair[1]["maxMs"], reverse=True)[:self.top_n]
+                self._top = dict(keep)
+            if self._handler is not None:
+                self._handler.handle(logging.makeLogRecord({"msg": json.dumps(entry), "levelno": logging.WARNING}))
+        return entry
+
+    def top(self, limit: Optional[int] = None, kind: Optional[str] = None) -> List[dict]:
+        """The statement shapes with the worst durations, slowest first."""
+        with self._lock:
+            items = [dict(item) for item in self._top.values() if kind is None or item["kind"] == kind]
+        items.sort(key=lambda item: item["maxMs"], reverse=True)
+        for item in items:
+            item["avgMs"] = round(item["totalMs"] / item["count"], 3)
+            item["maxMs"] = round(item["maxMs"], 3)
+            item["totalMs"] = round(item["totalMs"], 3)
+        return items[:min(limit or self.top_n, self.top_n)]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._top.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"threshold_ms": self.threshold_ms, "shapes": len(self._top), "path": self.path, **self._counters}
+
+    def close(self) -> None:
+        if self._handler is not None:
+            self._handler.close()
+
+
+_log: Optional[SlowQueryLog] = None
+_log_lock = threading.Lock()
+
+
+def get_slow_query_log() -> SlowQueryLog:
+    """Returns this process's slow-query log, creating it on first use (and after a fork)."""
+    global _log
+    log = _log
+    if log is not None and log.pid == os.getpid():
+        return log
+    with _log_lock:
+        if _log is None or _log.pid != os.getpid():
+            _log = SlowQueryLog()
+        return _log
+
+
+def close_slow_query_log() -> None:
+    global _log
+    with _log_lock:
+        if _log is not None:
+            _log.close()
+        _log = None
+
+
+def check_statement(conn: sqlite3.Connection, kind: str, sql: str, params: Sequence[Any], started: float) -> None:
+    """Records `sql` if it ran longer than the threshold; `started` is `time.perf_counter()` before it ran."""
+    if not SLOW_QUERY_ENABLED:
+        return
+    duration_ms = (time.perf_counter() - started) * 1000
+    log = get_slow_query_log()
+    if duration_ms >= log.threshold_ms:
+        log.record(conn, kind, sql, params, duration_ms)
@@ -0,0 +1,45 @@
+import unittest
+
+# Assuming aggregates.py is in the parent directory
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from aggregates import GROUPABLE_FIELDS, build_aggregate_query
+from filter_compiler import compile_filter
+from schema import VisitaFilterInput, StringFilterInput
+
+class TestAggregateQuery(unittest.TestCase):
+
+    def test_group_by_with_top_n(self):
+        compiled = compile_filter(VisitaFilterInput(tipo_dispositivo=StringFilterInput(equals="Mobile")))
+        sql, params = build_aggregate_query(compiled, ["nome_dominio", "dia"], ["visits", "distinct_ips"], "visits", True, 5)
+        self.assertEqual(
+            sql,
+            "SELECT dd.nome_dominio AS nome_dominio, dt.dia AS dia, COUNT(*) AS visits, COUNT(DISTINCT fv.id_dim_ip) AS distinct_ips"
+            " FROM FatoVisitas fv"
+            " JOIN DimDominio dd ON fv.id_dim_dominio = dd.id_dim_dominio"
+            " JOIN DimDispositivo ddi ON fv.id_dim_dispositivo = ddi.id_dim_dispositivo"
+            " JOIN DimTempo dt ON fv.id_dim_tempo = dt.id_dim_tempo"
+            " WHERE ddi.tipo_dispositivo = ?"
+            " GROUP BY dd.nome_dominio, dt.dia ORDER BY visits DESC, nome_dominio, dia LIMIT ?"
+        )
+        self.assertEqual(params, ["Mobile", 5])
+
+    def test_without_group_by_counts_everything(self):
+        sql, params = build_aggregate_query(compile_filter(None), [], ["visits"], limit=5)
+        self.assertEqual(sql, "SELECT COUNT(*) AS visits FROM FatoVisitas fv")
+        self.assertEqual(params, [])
+
+    def test_rejects_invalid_requests(self):
+        self.assertNotIn("id_visita", GROUPABLE_FIELDS)
+        with self.assertRaises(ValueError):
+            build_aggregate_query(compile_filter(None), ["id_visita"], ["visits"])
+        with self.assertRaises(ValueError):
+            build_aggregate_query(compile_filter(None), ["ano"], [])
+        with self.assertRaises(ValueError):
+            build_aggregate_query(compile_filter(None), ["ano"], ["visits"], order_by="distinct_ips")
+
+
+if __name__ == '__main__':
+    unittest.main()
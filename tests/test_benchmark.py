@@ -0,0 +1,38 @@
+import unittest
+import os
+import tempfile
+import contextlib
+import io
+
+# Assuming benchmark.py is in the parent directory
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmark import CASES, compare, percentile, run_benchmarks
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_percentile(self):
+        samples = list(range(1, 101))
+        self.assertEqual((percentile(samples, 50), percentile(samples, 95), percentile(samples, 99)), (50, 95, 99))
+        self.assertEqual(percentile([3.0], 99), 3.0)
+
+    def test_runs_every_case_and_compares(self):
+        with tempfile.TemporaryDirectory() as data_dir, contextlib.redirect_stderr(io.StringIO()):
+            report = run_benchmarks([400], list(CASES), iterations=2, warmup=0, data_dir=data_dir, where_iterations=3)
+        results = report["results"]
+        for name, case in CASES.items():
+            self.assertGreater(results[f"400/{name}/get_visitas"]["rows_per_sec"], 0, name)
+            self.assertEqual(f"400/{name}/build_where_clause" in results, case.filter is not None, name)
+        result = results["400/no_filter/get_visitas"]
+        self.assertLessEqual(result["p50_ms"], result["p95_ms"])
+        self.assertGreater(result["peak_kib"], 0)
+
+        self.assertEqual(compare(report, report, threshold=0.1), [])
+        faster = {"results": {key: {**value, "p50_ms": value["p50_ms"] / 2} for key, value in results.items()}}
+        regressions = compare(report, faster, threshold=0.5, min_delta_ms=0)
+        self.assertEqual(len(regressions), len(results))
+        self.assertTrue(all("p50_ms" in line for line in regressions))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import unittest
+import sqlite3
+import os
+import random
+import tempfile
+
+# Assuming bitmap_index.py is in the parent directory
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from bitmap_index import Bitmap, BitmapIndex, id_set_filter
+from filter_compiler import compile_filter
+from query_planner import build_from_clause, required_aliases
+from schema import VisitaFilterInput, StringFilterInput, IntFilterInput
+
+SCHEMA_FILE = os.path.join(os.path.dirname(__file__), '..', 'schema.sql')
+
+class TestBitmap(unittest.TestCase):
+
+    def test_set_operations_match_python_sets(self):
+        rng = random.Random(3)
+        a = set(rng.sample(range(300000), 2000))
+        b = set(rng.sample(range(300000), 90000))
+        bitmap_a, bitmap_b = Bitmap.from_ids(a), Bitmap.from_ids(b)
+        self.assertEqual(list(bitmap_a & bitmap_b), sorted(a & b))
+        self.assertEqual(list(bitmap_a | bitmap_b), sorted(a | b))
+        self.assertEqual(list(bitmap_b - bitmap_a), sorted(b - a))
+        self.assertEqual(len(bitmap_b), len(b))
+        for low, high in [(0, 10), (65535, 65537), (1000, 200000), (None, 131071), (131072, None), (9, 3)]:
+            expected = sorted(x for x in b if (low is None or x >= low) and (high is None or x <= high))
+            self.assertEqual(list(bitmap_b.clip(low, high)), expected)
+        self.assertFalse(Bitmap.from_ids([]))
+
+class TestBitmapIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.conn = sqlite3.connect(os.path.join(self.tmpdir.name, "bitmaps.db"))
+        with open(SCHEMA_FILE) as f:
+            self.conn.executescript(f.read())
+        self.conn.executemany("INSERT INTO DimDominio (nome_dominio) VALUES (?)", [("a.com",), ("b.com",), ("c.org",)])
+        self.conn.executemany("INSERT INTO DimPagina (caminho_pagina) VALUES (?)", [("/",), ("/blog",)])
+        self.conn.execute("INSERT INTO DimUrl (url_completa) VALUES ('https://a.com/')")
+        self.conn.executemany(
+            "INSERT INTO DimNavegador (nome_navegador, versao_navegador, sistema_operacional_usuario) VALUES (?, ?, ?)",
+            [("Chrome", "1", "Linux"), ("Firefox", None, "Linux"), ("Chrome", "2", "Windows")]
+        )
+        self.conn.execute("INSERT INTO DimSessao (id_sessao_navegador) VALUES ('s1')")
+        self.conn.execute("INSERT INTO DimIp (endereco_ip) VALUES ('10.0.0.1')")
+        self.conn.executemany("INSERT INTO DimDispositivo (tipo_dispositivo) VALUES (?)", [("Mobile",), ("Desktop",)])
+        self.conn.executemany("INSERT INTO DimGeografia (pais, cidade) VALUES (?, ?)", [("Brazil", "Campinas"), ("Chile", None)])
+        self.conn.executemany("INSERT INTO DimReferencia (tipo_referencia) VALUES (?)", [("Organic",), ("Social",)])
+        self.conn.execute("INSERT INTO DimTempo (data_completa, ano, mes, dia, dia_semana, hora, minuto) VALUES ('2023-01-01 09:00:00', 2023, 1, 1, 0, 9, 0)")
+        self.rng = random.Random(11)
+        self._add_visits(400)
+        self.index = BitmapIndex(batch_size=50)
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmpdir.cleanup()
+
+    def _add_visits(self, count):
+        rng = self.rng
+        self.conn.executemany(
+            "INSERT INTO FatoVisitas (id_dim_dominio, id_dim_pagina, id_dim_url, id_dim_navegador, id_dim_sessao,"
+            " id_dim_dispositivo, id_dim_ip, id_dim_tempo, id_dim_geografia, id_dim_referencia, timestamp_visita)"
+            " VALUES (?, ?, 1, ?, 1, ?, 1, 1, ?, ?, ?)",
+            [
+                (rng.randint(1, 3), rng.randint(1, 2), rng.randint(1, 3), rng.randint(1, 2),
+                 rng.choice([None, 1, 2]), rng.choice([None, 1, 2]), rng.randint(0, 1000))
+                for _ in range(count)
+            ]
+        )
+        self.conn.commit()
+
+    def _sql_ids(self, compiled):
+        sql = f"SELECT fv.id_visita{build_from_clause(required_aliases(compiled.fields))}{compiled.where} ORDER BY fv.id_visita"
+        return [row[0] for row in self.conn.execute(sql, compiled.params)]
+
+    def test_rows_match_sql(self):
+        filters = [
+            None,
+            VisitaFilterInput(nome_navegador=StringFilterInput(equals="Chrome")),
+            VisitaFilterInput(pais_geografia=StringFilterInput(notEquals="Brazil"), caminho_pagina=StringFilterInput(In=["/blog"])),
+            VisitaFilterInput(id_visita=IntFilterInput(greaterThan=100, notBetween=[150, 200]), nome_dominio=StringFilterInput(endsWith=".com")),
+            VisitaFilterInput(OR=[
+                VisitaFilterInput(tipo_referencia=StringFilterInput(equals="Social")),
+                VisitaFilterInput(AND=[
+                    VisitaFilterInput(versao_navegador=StringFilterInput(notEquals="1")),
+                    VisitaFilterInput(id_visita=IntFilterInput(In=[3, 5, 8, 13, 21, 34])),
+                ]),
+            ]),
+            VisitaFilterInput(nome_dominio=StringFilterInput(equals="nowhere.net")),
+        ]
+        for filter_input in filters:
+            compiled = compile_filter(filter_input)
+            with self.subTest(where=compiled.where):
+                self.assertEqual(list(self.index.rows(self.conn, compiled, token=(0, 1))), self._sql_ids(compiled))
+
+    def test_uncovered_fields_fall_back(self):
+        compiled = compile_filter(VisitaFilterInput(hora=IntFilterInput(equals=9)))
+        self.assertIsNone(self.index.rows(self.conn, compiled, token=(0, 1)))
+
+    def test_refresh_and_id_set_page_filter(self):
+        compiled = compile_filter(VisitaFilterInput(tipo_dispositivo=StringFilterInput(equals="Mobile")))
+        self.index.rows(self.conn, compiled, token=(0, 1))
+        self._add_visits(100)
+        rows = self.index.rows(self.conn, compiled, token=(0, 2))
+        self.assertEqual(list(rows), self._sql_ids(compiled))
+        self.assertEqual((self.index.stats()["rows_indexed"], self.index.stats()["full_loads"]), (500, 1))
+        # The id-set filter selects exactly the same page as the original filter
+        page = " ORDER BY fv.timestamp_visita, fv.id_visita LIMIT 15 OFFSET 10"
+        by_ids = id_set_filter(rows)
+        self.assertEqual(
+            self.conn.execute(f"SELECT fv.id_visita FROM FatoVisitas fv{by_ids.where}{page}", by_ids.params).fetchall(),
+            self.conn.execute(
+                f"SELECT fv.id_visita{build_from_clause(required_aliases(compiled.fields))}{compiled.where}{page}", compiled.params
+            ).fetchall()
+        )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import unittest
+import sqlite3
+import os
+import random
+import datetime
+import tempfile
+
+# Assuming columnar.py is in the parent directory
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from aggregates import build_aggregate_query
+from columnar import ColumnarStore, np
+from filter_compiler import compile_filter
+from query_planner import build_from_clause, required_aliases
+from schema import VisitaFilterInput, StringFilterInput, IntFilterInput, DateTimeFilterInput
+
+SCHEMA_FILE = os.path.join(os.path.dirname(__file__), '..', 'schema.sql')
+
+@unittest.skipIf(np is None, "NumPy is not installed")
+class TestColumnarStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.conn = sqlite3.connect(os.path.join(self.tmpdir.name, "columnar.db"))
+        with open(SCHEMA_FILE) as f:
+            self.conn.executescript(f.read())
+        self.conn.executemany("INSERT INTO DimDominio (nome_dominio) VALUES (?)", [("a.com",), ("b.com",), ("c.org",)])
+        self.conn.executemany("INSERT INTO DimPagina (caminho_pagina) VALUES (?)", [("/",), ("/blog",)])
+        self.conn.execute("INSERT INTO DimUrl (url_completa) VALUES ('https://a.com/')")
+        self.conn.executemany(
+            "INSERT INTO DimNavegador (nome_navegador, versao_navegador, sistema_operacional_usuario) VALUES (?, ?, ?)",
+            [("Chrome", "1", "Linux"), ("Firefox", None, "Linux"), ("Chrome", "2", "Windows")]
+        )
+        self.conn.executemany("INSERT INTO DimSessao (id_sessao_navegador) VALUES (?)", [(f"s{i}",) for i in range(20)])
+        self.conn.executemany("INSERT INTO DimIp (endereco_ip) VALUES (?)", [(f"10.0.0.{i}",) for i in range(15)])
+        self.conn.executemany("INSERT INTO DimDispositivo (tipo_dispositivo) VALUES (?)", [("Mobile",), ("Desktop",)])
+        self.conn.executemany("INSERT INTO DimGeografia (pais, cidade) VALUES (?, ?)", [("Brazil", "Campinas"), ("Chile", None)])
+        self.conn.executemany("INSERT INTO DimReferencia (tipo_referencia) VALUES (?)", [("Organic",), ("Social",)])
+        self.conn.executemany(
+            "INSERT INTO DimTempo (data_completa, ano, mes, dia, dia_semana, hora, minuto) VALUES (?, 2023, 1, ?, 0, ?, 0)",
+            [(f"2023-01-{day:02d} {hour:02d}:00:00", day, hour) for day in (1, 2, 3) for hour in (8, 9, 10)]
+        )
+        self.rng = random.Random(7)
+        self._add_visits(300)
+        self.store = ColumnarStore(batch_size=64)
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmpdir.cleanup()
+
+    def _add_visits(self, count):
+        rng = self.rng
+        self.conn.executemany(
+            "INSERT INTO FatoVisitas (id_dim_dominio, id_dim_pagina, id_dim_url, id_dim_navegador, id_dim_utm, id_dim_sessao,"
+            " id_dim_dispositivo, id_dim_ip, id_dim_tempo, id_dim_geografia, id_dim_referencia, timestamp_visita)"
+            " VALUES (?, ?, 1, ?, NULL, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (rng.randint(1, 3), rng.randint(1, 2), rng.randint(1, 3), rng.randint(1, 20), rng.randint(1, 2),
+                 rng.randint(1, 15), rng.randint(1, 9), rng.choice([None, 1, 2]), rng.choice([None, 1, 2]),
+                 1672560000 + rng.randint(0, 200000))
+                for _ in range(count)
+            ]
+        )
+        self.conn.commit()
+
+    def _sql_count(self, compiled):
+        sql = f"SELECT COUNT(fv.id_visita){build_from_clause(required_aliases(compiled.fields))}{compiled.where}"
+        return self.conn.execute(sql, compiled.params).fetchone()[0]
+
+    FILTERS = [
+        None,
+        VisitaFilterInput(nome_navegador=StringFilterInput(equals="Chrome")),
+        VisitaFilterInput(pais_geografia=StringFilterInput(notEquals="Brazil")),
+        VisitaFilterInput(cidade_geografia=StringFilterInput(In=["Campinas"]), hora=IntFilterInput(between=[8, 9])),
+        VisitaFilterInput(id_visita=IntFilterInput(greaterThan=100, notIn=[150, 151]), nome_dominio=StringFilterInput(endsWith=".com")),
+        VisitaFilterInput(timestamp_visita=DateTimeFilterInput(lessThan=datetime.datetime(2023, 1, 2, tzinfo=datetime.timezone.utc))),
+        VisitaFilterInput(OR=[
+            VisitaFilterInput(tipo_referencia=StringFilterInput(equals="Social")),
+            VisitaFilterInput(AND=[
+                VisitaFilterInput(versao_navegador=StringFilterInput(notEquals="1")),
+                VisitaFilterInput(dia=IntFilterInput(notBetween=[2, 2])),
+            ]),
+        ]),
+        VisitaFilterInput(nome_dominio=StringFilterInput(equals="nowhere.net")),
+    ]
+
+    def test_counts_match_sql(self):
+        for filter_input in self.FILTERS:
+            compiled = compile_filter(filter_input)
+            with self.subTest(where=compiled.where):
+                self.assertEqual(self.store.count(self.conn, compiled, token=(0, 1)), self._sql_count(compiled))
+
+    def test_aggregates_match_sql(self):
+        cases = [
+            ([], ["visits", "distinct_sessions", "distinct_ips"], None, None),
+            (["nome_dominio", "pais_geografia"], ["visits", "distinct_ips"], None, None),
+            (["nome_navegador"], ["visits", "distinct_sessions"], "distinct_sessions", 1),
+            (["hora", "tipo_referencia"], ["visits"], "visits", 4),
+        ]
+        for filter_input in self.FILTERS:
+            compiled = compile_filter(filter_input)
+            for group_by, metrics, order_by, limit in cases:
+                with self.subTest(where=compiled.where, group_by=group_by):
+                    expected = self.conn.execute(*build_aggregate_query(compiled, group_by, metrics, order_by, True, limit)).fetchall()
+                    rows = self.store.aggregate(self.conn, compiled, group_by, metrics, order_by, True, limit, token=(0, 1))
+                    self.assertEqual(rows, expected)
+
+    def test_refreshes_incrementally(self):
+        compiled = compile_filter(VisitaFilterInput(tipo_dispositivo=StringFilterInput(equals="Mobile")))
+        self.store.count(self.conn, compiled, token=(0, 1))
+        self._add_visits(50)
+        self.assertEqual(self.store.count(self.conn, compiled, token=(0, 2)), self._sql_count(compiled))
+        stats = self.store.stats()
+        self.assertEqual((stats["rows"], stats["rows_loaded"], stats["full_loads"]), (350, 350, 1))
+        # Keys first seen in appended rows widen the lookup tables without a full load
+        self.conn.execute("INSERT INTO DimDispositivo (tipo_dispositivo) VALUES ('Tablet')")
+        self._add_visits(5)
+        self.conn.execute("UPDATE FatoVisitas SET id_dim_dispositivo = 3 WHERE id_visita > 350")
+        self.conn.commit()
+        tablets = compile_filter(VisitaFilterInput(tipo_dispositivo=StringFilterInput(equals="Tablet")))
+        self.assertEqual(self.store.count(self.conn, tablets, token=(0, 3)), 5)
+        self.assertEqual(self.store._snapshot()[2]["id_dim_dispositivo"], 4)
+        # A new token epoch reloads everything
+        self.store.count(self.conn, compiled, token=(1, 1))
+        self.assertEqual(self.store.stats()["full_loads"], 2)
+
+if __name__ == '__main__':
+    unittest.main()
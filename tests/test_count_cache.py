@@ -0,0 +1,110 @@
+import unittest
+import sqlite3
+import os
+from fastapi.testclient import TestClient # type: ignore
+
+# Assuming count_cache.py is in the parent directory
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from count_cache import CountCache, close_count_cache, get_count_cache
+from filter_compiler import CompiledFilter
+from main import app
+from init_db import init_db, DATABASE_FILE
+from db_pool import close_pool
+from seed_data import seed_data
+from response_cache import close_response_cache
+
+class TestCountCache(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.execute("CREATE TABLE FatoVisitas (id_visita INTEGER PRIMARY KEY, kind INTEGER)")
+        self.conn.executemany("INSERT INTO FatoVisitas (kind) VALUES (?)", [(i % 3,) for i in range(30)])
+        self.statements = []
+        self.filter = CompiledFilter("fv.kind = ? OR fv.kind = ?", [0, 1], frozenset(), ("shape",))
+
+    def tearDown(self):
+        self.conn.close()
+
+    def _run(self, sql, params):
+        self.statements.append((sql, list(params)))
+        return self.conn.execute(sql, params).fetchone()
+
+    def _count(self, cache, token):
+        return cache.count(self.filter.key, token, "FROM FatoVisitas fv", self.filter, self._run)
+
+    def test_counts_only_new_facts(self):
+        cache = CountCache()
+        self.assertEqual(self._count(cache, (1, 1)), (20, 20))
+        self.assertEqual(self._count(cache, (1, 1)), (20, 0)) # Same data version: no statement
+        self.assertEqual(len(self.statements), 1)
+        self.conn.executemany("INSERT INTO FatoVisitas (kind) VALUES (?)", [(0,), (2,), (1,)])
+        self.assertEqual(self._count(cache, (1, 2)), (22, 2))
+        self.assertEqual(self.statements[-1][1], [0, 1, 30]) # Above the high-water mark, with OR kept grouped
+        self.assertIn("WHERE (fv.kind = ? OR fv.kind = ?) AND fv.id_visita > ?", self.statements[-1][0])
+        self.assertEqual(self._count(cache, (2, 1)), (22, 22)) # New epoch: full recount
+        self.conn.execute("DELETE FROM FatoVisitas WHERE id_visita > 10")
+        self.assertEqual(self._count(cache, (2, 2)), (7, 7)) # High-water mark went backwards: full recount
+        self.assertEqual(cache.stats(), {"entries": 1, "max_size": 4096, "hits": 1, "increments": 1, "misses": 3})
+
+    def test_lru(self):
+        cache = CountCache(max_size=1)
+        self._count(cache, (1, 1))
+        other = CompiledFilter("", [], frozenset(), None)
+        self.assertEqual(cache.count(other.key, (1, 1), "FROM FatoVisitas fv", other, self._run), (30, 30))
+        self._count(cache, (1, 1))
+        self.assertEqual(cache.stats()["misses"], 3)
+
+class TestCountCacheAPI(unittest.TestCase):
+
+    QUERY = """
+        query($cursorArgs: CursorModeInput, $offsetArgs: PaginationModeInput) {
+            getVisitas(filter: {idSessaoNavegador: {startsWith: "sess"}}, cursorArgs: $cursorArgs, offsetArgs: $offsetArgs) {
+                totalCount pageInfo { endCursor }
+            }
+        }
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        close_pool()
+        close_count_cache()
+        close_response_cache()
+        if os.path.exists(DATABASE_FILE):
+            os.remove(DATABASE_FILE)
+        init_db()
+        seed_data()
+        cls.client = TestClient(app)
+
+    @classmethod
+    def tearDownClass(cls):
+        close_count_cache()
+        close_pool()
+        if os.path.exists(DATABASE_FILE):
+            os.remove(DATABASE_FILE)
+
+    def _get(self, **variables):
+        return self.client.post("/graphql", json={"query": self.QUERY, "variables": variables}).json()["data"]["getVisitas"]
+
+    def test_shared_across_pages_and_modes(self):
+        cache = get_count_cache()
+        first = self._get(cursorArgs={"first": 5})
+        before = cache.stats()
+        second = self._get(cursorArgs={"first": 5, "after": first["pageInfo"]["endCursor"]})
+        offset = self._get(offsetArgs={"limit": 5, "offset": 40})
+        self.assertEqual({first["totalCount"], second["totalCount"], offset["totalCount"]}, {first["totalCount"]})
+        self.assertEqual(cache.stats()["hits"], before["hits"] + 2)
+
+        conn = sqlite3.connect(DATABASE_FILE)
+        conn.execute("INSERT INTO FatoVisitas SELECT NULL, id_dim_dominio, id_dim_pagina, id_dim_url, id_dim_navegador, id_dim_utm,"
+                     " id_dim_sessao, id_dim_dispositivo, id_dim_ip, id_dim_tempo, id_dim_geografia, id_dim_referencia, timestamp_visita"
+                     " FROM FatoVisitas LIMIT 2")
+        conn.commit()
+        conn.close()
+        self.assertEqual(self._get(offsetArgs={"limit": 5})["totalCount"], first["totalCount"] + 2)
+        self.assertGreaterEqual(cache.stats()["increments"], 1)
+        self.assertIn("count_cache", self.client.get("/health").json())
+
+if __name__ == '__main__':
+    unittest.main()
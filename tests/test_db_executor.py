@@ -0,0 +1,53 @@
+import unittest
+import asyncio
+import threading
+import os
+
+# Assuming db_executor.py is in the parent directory
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from db_executor import DatabaseExecutor, ExecutorSaturatedError
+
+class TestDatabaseExecutor(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = DatabaseExecutor(max_workers=2, max_queue=1)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_runs_on_worker_thread(self):
+        caller = threading.get_ident()
+        worker = asyncio.run(self.executor.run(threading.get_ident))
+        self.assertNotEqual(worker, caller)
+        stats = self.executor.stats()
+        self.assertEqual(stats["submitted"], 1)
+        self.assertEqual(stats["completed"], 1)
+        self.assertEqual(stats["in_flight"], 0)
+
+    def test_rejects_beyond_queue_limit(self):
+        release = threading.Event()
+
+        async def scenario():
+            blocked = [asyncio.ensure_future(self.executor.run(release.wait, 5)) for _ in range(3)]
+            await asyncio.sleep(0.05)
+            with self.assertRaises(ExecutorSaturatedError):
+                await self.executor.run(lambda: None)
+            self.assertEqual(self.executor.stats()["queued"], 1)
+            release.set()
+            await asyncio.gather(*blocked)
+
+        asyncio.run(scenario())
+        self.assertEqual(self.executor.stats()["rejected"], 1)
+
+    def test_propagates_exceptions(self):
+        def fail():
+            raise ValueError("boom")
+        with self.assertRaises(ValueError):
+            asyncio.run(self.executor.run(fail))
+        self.assertEqual(self.executor.stats()["in_flight"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import unittest
+import sqlite3
+import os
+import tempfile
+import threading
+from unittest import mock
+
+# Assuming db_pool.py is in the parent directory
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from db_pool import ConnectionPool, PoolTimeoutError
+
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmpdir.name, "pool_test.db")
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE t (x INTEGER)")
+        conn.execute("INSERT INTO t VALUES (1)")
+        conn.commit()
+        conn.close()
+        self.pool = ConnectionPool(database_file=self.db_path, max_size=2, timeout=0.2)
+
+    def tearDown(self):
+        self.pool.close()
+        self.tmpdir.cleanup()
+
+    def test_connection_is_reused(self):
+        with self.pool.connection() as conn1:
+            pass
+        with self.pool.connection() as conn2:
+            self.assertIs(conn1, conn2)
+        stats = self.pool.stats()
+        self.assertEqual(stats["connections_created"], 1)
+        self.assertEqual(stats["acquired"], 2)
+        self.assertEqual(stats["idle"], 1)
+
+    def test_connection_is_tuned(self):
+        with self.pool.connection() as conn:
+            self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+            self.assertEqual(conn.execute("PRAGMA temp_store").fetchone()[0], 2) # MEMORY
+            self.assertIsInstance(conn.execute("SELECT x FROM t").fetchone(), sqlite3.Row)
+
+    def test_pool_is_bounded(self):
+        conn1 = self.pool.acquire()
+        conn2 = self.pool.acquire()
+        with self.assertRaises(PoolTimeoutError):
+            self.pool.acquire()
+        self.assertEqual(self.pool.stats()["timeouts"], 1)
+        # A waiter is woken up when a connection is released
+        threading.Timer(0.05, self.pool.release, args=(conn1,)).start()
+        conn3 = self.pool.acquire()
+        self.assertIs(conn3, conn1)
+        self.pool.release(conn2)
+        self.pool.release(conn3)
+
+    def test_read_only_mode(self):
+        ro_pool = ConnectionPool(database_file=self.db_path, read_only=True)
+        try:
+            with ro_pool.connection() as conn:
+                self.assertEqual(conn.execute("SELECT x FROM t").fetchone()[0], 1)
+                with self.assertRaises(sqlite3.OperationalError):
+                    conn.execute("INSERT INTO t VALUES (2)")
+        finally:
+            ro_pool.close()
+
+    def _replace_file(self):
+        """Recreates the database under the same name (new inode)."""
+        os.rename(self.db_path, self.db_path + ".old")
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE t2 (y INTEGER)")
+        conn.commit()
+        conn.close()
+
+    def test_replaced_file_drops_idle_connections(self):
+        with self.pool.connection():
+            pass
+        generation = self.pool.generation
+        self._replace_file()
+        with self.pool.connection() as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM t2").fetchone()[0], 0)
+        self.assertEqual(self.pool.generation, generation + 1)
+        self.assertEqual(self.pool.stats()["file_replacements"], 1)
+
+    def test_connection_checked_out_across_replacement_is_closed(self):
+        stale = self.pool.acquire()
+        self._replace_file()
+        with self.pool.connection() as fresh: # Notices the replacement
+            self.assertIsNot(fresh, stale)
+        self.pool.release(stale)
+        self.assertEqual(self.pool.stats()["open"], 1)
+        with self.pool.connection() as conn:
+            self.assertIsNot(conn, stale)
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM t2").fetchone()[0], 0)
+
+    def test_failed_reconnect_releases_the_slot(self):
+        connect = self.pool._connect
+        def replaced_while_connecting():
+            if not calls:
+                calls.append(1)
+                self.pool.generation += 1
+                return connect()
+            raise sqlite3.OperationalError("unable to open database file")
+        calls = []
+        with mock.patch.object(self.pool, "_connect", side_effect=replaced_while_connecting):
+            with self.assertRaises(sqlite3.OperationalError):
+                self.pool.acquire()
+        self.assertEqual(self.pool.stats()["open"], 0)
+        conns = [self.pool.acquire(), self.pool.acquire()] # Both slots are still available
+        for conn in conns:
+            self.pool.release(conn)
+
+    def test_health_check(self):
+        result = self.pool.health_check()
+        self.assertTrue(result["healthy"])
+        self.assertIsNone(result["error"])
+        self.assertEqual(result["pool"]["max_size"], 2)
+
+    def test_data_version_moves_on_external_commit(self):
+        token = self.pool.data_version()
+        self.assertEqual(self.pool.data_version(), token)
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("INSERT INTO t VALUES (2)")
+        conn.commit()
+        conn.close()
+        changed = self.pool.data_version()
+        self.assertNotEqual(changed, token)
+        self.assertEqual(self.pool.data_version(), changed)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+import sqlite3
+import os
+import tempfile
+
+# Assuming dimension_cache.py is in the parent directory
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from dimension_cache import DimensionCache
+
+class TestDimensionCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.conn = sqlite3.connect(os.path.join(self.tmpdir.name, "dims.db"))
+        self.conn.execute("CREATE TABLE DimDominio (id_dim_dominio INTEGER PRIMARY KEY AUTOINCREMENT, nome_dominio TEXT)")
+        self.conn.execute(
+            "CREATE TABLE DimGeografia (id_dim_geografia INTEGER PRIMARY KEY AUTOINCREMENT, pais TEXT, regiao TEXT, cidade TEXT)"
+        )
+        self.conn.executemany("INSERT INTO DimDominio (nome_dominio) VALUES (?)", [("a.com",), ("b.com",)])
+        self.conn.execute("INSERT INTO DimGeografia (pais, regiao, cidade) VALUES ('BR', 'SP', 'Campinas')")
+        self.conn.commit()
+        self.cache = DimensionCache(["dd", "dg"])
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmpdir.cleanup()
+
+    def test_loads_id_indexed_rows(self):
+        self.cache.refresh(self.conn, token=(0, 1))
+        self.assertEqual(self.cache.row(self.conn, "dd", 2), ("b.com",))
+        self.assertEqual(self.cache.row(self.conn, "dg", 1), ("BR", "SP", "Campinas"))
+        self.assertIsNone(self.cache.row(self.conn, "dg", None))
+        self.assertEqual(self.cache.stats()["dimensions"], {"dd": 2, "dg": 1})
+
+    def test_refreshes_incrementally_when_token_moves(self):
+        self.cache.refresh(self.conn, token=(0, 1))
+        self.conn.execute("INSERT INTO DimDominio (nome_dominio) VALUES ('c.com')")
+        self.conn.commit()
+        self.cache.refresh(self.conn, token=(0, 1))  # Same token: nothing is read
+        self.assertEqual(self.cache.stats()["rows_loaded"], 3)
+        self.cache.refresh(self.conn, token=(0, 2))
+        stats = self.cache.stats()
+        self.assertEqual(stats["rows_loaded"], 4)
+        self.assertEqual(stats["full_loads"], 1)
+        self.assertEqual(self.cache.row(self.conn, "dd", 3), ("c.com",))
+
+    def test_unknown_key_is_read_through(self):
+        self.cache.refresh(self.conn, token=(0, 1))
+        self.conn.execute("INSERT INTO DimDominio (nome_dominio) VALUES ('late.com')")
+        self.conn.commit()
+        self.assertEqual(self.cache.row(self.conn, "dd", 3), ("late.com",))
+        self.assertIsNone(self.cache.row(self.conn, "dd", 99))
+        self.assertEqual(self.cache.stats()["point_loads"], 1)
+
+    def test_new_generation_reloads_everything(self):
+        self.cache.refresh(self.conn, token=(0, 1))
+        self.conn.execute("UPDATE DimDominio SET nome_dominio = 'renamed.com' WHERE id_dim_dominio = 1")
+        self.conn.commit()
+        self.cache.refresh(self.conn, token=(1, 1))
+        self.assertEqual(self.cache.row(self.conn, "dd", 1), ("renamed.com",))
+        self.assertEqual(self.cache.stats()["full_loads"], 2)
+
+    def test_rejects_unknown_alias(self):
+        with self.assertRaises(ValueError):
+            DimensionCache(["nope"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+import datetime
+
+# Assuming filter_compiler.py is in the parent directory
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from filter_compiler import compile_filter, filter_cache_info
+from schema import VisitaFilterInput, StringFilterInput, IntFilterInput, DateTimeFilterInput
+
+class TestFilterCompiler(unittest.TestCase):
+
+    def test_same_shape_reuses_sql_text(self):
+        first = compile_filter(VisitaFilterInput(nome_dominio=StringFilterInput(equals="a.com"), ano=IntFilterInput(In=[2022, 2023])))
+        hits_before = filter_cache_info().hits
+        second = compile_filter(VisitaFilterInput(nome_dominio=StringFilterInput(equals="b.com"), ano=IntFilterInput(In=[2020, 2021])))
+        self.assertIs(first.condition, second.condition)
+        self.assertEqual(first.shape, second.shape)
+        self.assertNotEqual(first.key, second.key)
+        self.assertEqual(second.params, ["b.com", 2020, 2021])
+        self.assertEqual(filter_cache_info().hits, hits_before + 1)
+
+    def test_list_length_is_part_of_the_shape(self):
+        two = compile_filter(VisitaFilterInput(nome_navegador=StringFilterInput(In=["Chrome", "Edge"])))
+        three = compile_filter(VisitaFilterInput(nome_navegador=StringFilterInput(In=["Chrome", "Edge", "Safari"])))
+        self.assertNotEqual(two.shape, three.shape)
+        self.assertEqual(three.where, " WHERE dn.nome_navegador IN (?, ?, ?)")
+
+    def test_same_values_give_same_key(self):
+        ts = datetime.datetime(2023, 1, 1, 12, 0, 0)
+        first = compile_filter(VisitaFilterInput(timestamp_visita=DateTimeFilterInput(greaterThan=ts)))
+        second = compile_filter(VisitaFilterInput(timestamp_visita=DateTimeFilterInput(greaterThan=ts)))
+        self.assertEqual(first.key, second.key)
+        self.assertEqual(first.params, [int(ts.timestamp())])
+
+    def test_empty_nested_filters_are_dropped(self):
+        compiled = compile_filter(VisitaFilterInput(AND=[VisitaFilterInput()], OR=[VisitaFilterInput(), VisitaFilterInput(mes=IntFilterInput(equals=3))]))
+        self.assertEqual(compiled.where, " WHERE (dt.mes = ?)")
+        self.assertEqual(compiled.params, [3])
+
+    def test_no_conditions(self):
+        compiled = compile_filter(VisitaFilterInput(AND=[VisitaFilterInput()]))
+        self.assertEqual(compiled.where, "")
+        self.assertIsNone(compiled.shape)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,30 @@
+import unittest
+import os
+
+# Assuming filter_inputs.py is in the parent directory
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from filter_compiler import compile_filter
+from filter_inputs import IntFilterInput, StringFilterInput, VisitaFilterInput, parse_fields, parse_filter
+
+class TestFilterInputs(unittest.TestCase):
+
+    def test_parse_filter_matches_graphql_inputs(self):
+        parsed = parse_filter({"nomeDominio": {"equals": "a.com"}, "OR": [{"ano": {"In": [2022, 2023]}}]})
+        expected = VisitaFilterInput(nome_dominio=StringFilterInput(equals="a.com"), OR=[VisitaFilterInput(ano=IntFilterInput(In=[2022, 2023]))])
+        self.assertIsInstance(parsed, VisitaFilterInput)
+        self.assertEqual(compile_filter(parsed).key, compile_filter(expected).key)
+        self.assertIsNone(parse_filter(None))
+        for value in ({"nope": {}}, {"ano": {"equals": "x"}}):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                parse_filter(value)
+
+    def test_parse_fields(self):
+        self.assertEqual(parse_fields(["idVisita", "nomeDominio", "idVisita"]), ("id_visita", "nome_dominio"))
+        for names in ("idVisita", [], ["nope"]):
+            with self.subTest(names=names), self.assertRaises(ValueError):
+                parse_fields(names)
+
+if __name__ == '__main__':
+    unittest.main()
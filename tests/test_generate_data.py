@@ -0,0 +1,82 @@
+import unittest
+import sqlite3
+import os
+import hashlib
+import tempfile
+import contextlib
+import io
+
+# Assuming generate_data.py is in the parent directory
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from generate_data import main
+from warehouse import DIMENSIONS
+
+class TestGenerateData(unittest.TestCase):
+
+    ARGS = ["--rows", "3000", "--chunk-rows", "700", "--days", "2", "--seed", "7",
+            "--cardinality", "dd=40", "--cardinality", "ds=300", "--cardinality", "du=500",
+            "--cardinality", "dp=200", "--cardinality", "dg=200", "--cardinality", "dr=200", "--skew", "dn=0"]
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _generate(self, name, *extra):
+        path = os.path.join(self.tmpdir.name, name)
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            main(["--database", path, *self.ARGS, *extra])
+        return path
+
+    def _digest(self, conn):
+        digest = hashlib.sha256()
+        for table in ["FatoVisitas"] + [dim.table for dim in DIMENSIONS]:
+            for row in conn.execute(f"SELECT * FROM {table} ORDER BY 1"):
+                digest.update(repr(row).encode())
+        return digest.hexdigest()
+
+    def test_output_is_deterministic_and_consistent(self):
+        serial = sqlite3.connect(self._generate("serial.db", "--workers", "1"))
+        parallel = sqlite3.connect(self._generate("parallel.db", "--workers", "2"))
+        self.addCleanup(serial.close)
+        self.addCleanup(parallel.close)
+        self.assertEqual(self._digest(serial), self._digest(parallel))
+        conn = parallel
+        self.assertEqual(conn.execute("SELECT COUNT(*), MIN(id_visita), MAX(id_visita) FROM FatoVisitas").fetchone(), (3000, 1, 3000))
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM DimTempo").fetchone()[0], 2 * 24 * 60)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM DimDominio").fetchone()[0], 40)
+        self.assertEqual(conn.execute("PRAGMA foreign_key_check").fetchall(), [])
+        # Visits arrive in time order, and each timestamp falls in its DimTempo minute
+        self.assertEqual(conn.execute(
+            "SELECT COUNT(*) FROM (SELECT timestamp_visita, LAG(timestamp_visita) OVER (ORDER BY id_visita) AS previous"
+            " FROM FatoVisitas) WHERE timestamp_visita < previous"
+        ).fetchone()[0], 0)
+        self.assertEqual(conn.execute(
+            "SELECT COUNT(*) FROM FatoVisitas fv JOIN DimTempo dt ON fv.id_dim_tempo = dt.id_dim_tempo"
+            " WHERE fv.timestamp_visita / 60 * 60 != CAST(strftime('%s', dt.data_completa, 'utc') AS INTEGER)"
+        ).fetchone()[0], 0)
+        # Zipf skew makes key 1 the most popular domain; --skew dn=0 keeps browsers uniform
+        top = conn.execute("SELECT id_dim_dominio, COUNT(*) FROM FatoVisitas GROUP BY 1 ORDER BY 2 DESC LIMIT 1").fetchone()
+        self.assertEqual(top[0], 1)
+        self.assertGreater(top[1], 3000 / 40 * 3)
+        self.assertLess(conn.execute("SELECT MAX(c) FROM (SELECT COUNT(*) AS c FROM FatoVisitas GROUP BY id_dim_navegador)").fetchone()[0], 3000 / 300 * 4)
+        # Deferred indexes and the rollups were built
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        self.assertIn("idx_fato_dominio_timestamp", indexes)
+        self.assertEqual(conn.execute("SELECT SUM(visits) FROM RollupVisitasDia").fetchone()[0], 3000)
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+
+    def test_refuses_to_overwrite_without_force(self):
+        path = self._generate("data.db", "--skip-rollups")
+        with contextlib.redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+            main(["--database", path, *self.ARGS])
+        with contextlib.redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+            main(["--database", os.path.join(self.tmpdir.name, "other.db"), "--cardinality", "dt=5"])
+        self._generate("data.db", "--skip-rollups", "--force", "--seed", "8")
+        self.assertEqual(sorted(os.listdir(self.tmpdir.name)), ["data.db"])
+
+if __name__ == '__main__':
+    unittest.main()
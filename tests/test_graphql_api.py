@@ -4,7 +4,10 @@ import sqlite3
 import os
 import datetime
 import time
-import base64
+import json
+import asyncio
+import threading
+from unittest import mock
 
 # Assuming main.py and init_db.py are in the parent directory
 import sys
@@ -12,8 +15,15 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 
 from main import app
 from init_db import init_db, DATABASE_FILE
+from db_pool import close_pool, get_pool
+from db_executor import configure_executor
 from seed_data import seed_data
 from schema import DEFAULT_PAGE_SIZE # Import default page size
+from schema import _fetch_visitas, _fetch_aggregates, PaginationModeInput, VisitaFilterInput, StringFilterInput
+from query_planner import FULL_SELECTION
+from offset_index import configure_offset_checkpoints
+import export
+from export import VisitaExport
 
 # Helper to get total count for comparison (adjust query as needed)
 def get_total_visitas_count(filter_dict=None):
@@ -35,6 +45,7 @@ class TestGraphQLAPI(unittest.TestCase):
     def setUpClass(cls):
         """Set up the test database and seed data once for all tests."""
         # Ensure a clean database for testing
+        close_pool()
         if os.path.exists(DATABASE_FILE):
             os.remove(DATABASE_FILE)
         init_db()
@@ -47,6 +58,7 @@ class TestGraphQLAPI(unittest.TestCase):
     @classmethod
     def tearDownClass(cls):
         """Remove the test database after all tests are done."""
+        close_pool() # Pooled connections keep the file (and its WAL) open
         if os.path.exists(DATABASE_FILE):
             os.remove(DATABASE_FILE)
 
@@ -128,6 +140,204 @@ class TestGraphQLAPI(unittest.TestCase):
             self.assertEqual(edge["node"]["nomeDominio"], domain_to_filter)
             self.assertIsNotNone(edge["cursor"])
 
+    def test_selection_and_filter_on_different_dimensions(self):
+        """Test that a filter on one dimension works while selecting fields of another (join pruning)."""
+        query = """
+            query GetVisitas($filter: VisitaFilterInput) {
+                getVisitas(filter: $filter) {
+                    edges { node { idVisita ...Device } }
+                    totalCount
+                }
+            }
+            fragment Device on VisitaType { tipoDispositivo }
+        """
+        variables = { "filter": { "nomeNavegador": { "equals": "Chrome" } } }
+        data = self._run_query(query, variables)
+        connection = data.get("getVisitas")
+        conn = sqlite3.connect(DATABASE_FILE)
+        expected = conn.execute(
+            "SELECT COUNT(*) FROM FatoVisitas fv JOIN DimNavegador dn ON fv.id_dim_navegador = dn.id_dim_navegador WHERE dn.nome_navegador = ?",
+            ("Chrome",)
+        ).fetchone()[0]
+        conn.close()
+        self.assertEqual(connection["totalCount"], expected)
+        for edge in connection["edges"]:
+            self.assertIn(edge["node"]["tipoDispositivo"], ["Desktop", "Mobile", "Tablet"])
+
+    def test_projection_reads_only_selected_columns(self):
+        """Test that the page query selects only requested columns and nodes hold only those attributes."""
+        statements = []
+        with get_pool().connection() as conn:
+            conn.set_trace_callback(statements.append)
+            try:
+                selection = FULL_SELECTION._replace(node_fields=frozenset({"id_visita", "timestamp_visita"}))
+                connection = _fetch_visitas(conn, None, None, PaginationModeInput(limit=3), selection)
+            finally:
+                conn.set_trace_callback(None)
+        data_sql = [sql for sql in statements if "LIMIT" in sql][0]
+        self.assertIn("SELECT fv.id_visita, fv.timestamp_visita FROM FatoVisitas fv", " ".join(data_sql.split()))
+        self.assertNotIn("JOIN", data_sql)
+        self.assertEqual(len(connection.edges), 3)
+        node = connection.edges[0].node
+        self.assertEqual(node._fields, ("id_visita", "timestamp_visita"))
+        self.assertFalse(hasattr(node, "nome_dominio"))
+        self.assertIsInstance(node.timestamp_visita, datetime.datetime)
+
+    def test_cached_dimensions_are_not_joined(self):
+        """Test that cached dimension fields come from memory and match the joined values."""
+        fields = frozenset({"id_visita", "nome_dominio", "tipo_dispositivo", "pais_geografia", "url_completa"})
+        connection, statements = self._traced_statements(FULL_SELECTION._replace(node_fields=fields), PaginationModeInput(limit=5))
+        data_sql = [sql for sql in statements if "LIMIT" in sql][0]
+        self.assertIn("JOIN DimUrl", data_sql)
+        for table in ("DimDominio", "DimDispositivo", "DimGeografia"):
+            self.assertNotIn(f"JOIN {table}", data_sql)
+        conn = sqlite3.connect(DATABASE_FILE)
+        for edge in connection.edges:
+            expected = conn.execute(
+                "SELECT dd.nome_dominio, ddi.tipo_dispositivo, dg.pais FROM FatoVisitas fv"
+                " JOIN DimDominio dd ON fv.id_dim_dominio = dd.id_dim_dominio"
+                " JOIN DimDispositivo ddi ON fv.id_dim_dispositivo = ddi.id_dim_dispositivo"
+                " LEFT JOIN DimGeografia dg ON fv.id_dim_geografia = dg.id_dim_geografia WHERE fv.id_visita = ?",
+                (edge.node.id_visita,)
+            ).fetchone()
+            self.assertEqual((edge.node.nome_dominio, edge.node.tipo_dispositivo, edge.node.pais_geografia), expected)
+        conn.close()
+
+    def test_unmatched_dimension_filter_skips_fact_table(self):
+        """Test that a dimension value that does not exist returns an empty page without reading FatoVisitas."""
+        statements = []
+        with get_pool().connection() as conn:
+            conn.set_trace_callback(statements.append)
+            try:
+                filter_input = VisitaFilterInput(nome_navegador=StringFilterInput(equals="NoSuchBrowser"))
+                connection = _fetch_visitas(conn, filter_input, None, None, FULL_SELECTION)
+            finally:
+                conn.set_trace_callback(None)
+        self.assertFalse(any("FatoVisitas" in sql for sql in statements))
+        self.assertEqual(connection.totalCount, 0)
+        self.assertEqual(connection.edges, [])
+        self.assertFalse(connection.pageInfo.has_next_page)
+
+    def test_deep_offset_matches_plain_offset(self):
+        """Test that checkpoint seeks return the same pages as LIMIT/OFFSET."""
+        configure_offset_checkpoints(interval=10)
+        try:
+            filter_input = VisitaFilterInput(tipo_dispositivo=StringFilterInput(equals="Desktop"))
+            conn = sqlite3.connect(DATABASE_FILE)
+            for offset in (0, 10, 25, 49, 95, self.TOTAL_VISITAS + 5):
+                with get_pool().connection() as pooled:
+                    connection = _fetch_visitas(pooled, filter_input, None, PaginationModeInput(limit=7, offset=offset), FULL_SELECTION)
+                expected = [row[0] for row in conn.execute(
+                    "SELECT fv.id_visita FROM FatoVisitas fv JOIN DimDispositivo ddi ON fv.id_dim_dispositivo = ddi.id_dim_dispositivo"
+                    " WHERE ddi.tipo_dispositivo = ? ORDER BY fv.timestamp_visita, fv.id_visita LIMIT 7 OFFSET ?",
+                    ("Desktop", offset)
+                )]
+                self.assertEqual([edge.node.id_visita for edge in connection.edges], expected, offset)
+                self.assertEqual(connection.pageInfo.has_previous_page, offset > 0)
+            conn.close()
+        finally:
+            configure_offset_checkpoints()
+
+    def test_aggregate_visitas_group_by(self):
+        """Test aggregateVisitas counts per group against the same GROUP BY in SQL."""
+        query = """
+            query Aggregate($filter: VisitaFilterInput) {
+                aggregateVisitas(filter: $filter, groupBy: [NOME_DOMINIO], metrics: [VISITS, DISTINCT_SESSIONS]) {
+                    group { nomeDominio tipoDispositivo }
+                    visits distinctSessions distinctIps
+                }
+            }
+        """
+        data = self._run_query(query, {"filter": {"tipoDispositivo": {"equals": "Desktop"}}})
+        conn = sqlite3.connect(DATABASE_FILE)
+        expected = conn.execute(
+            "SELECT dd.nome_dominio, COUNT(*), COUNT(DISTINCT fv.id_dim_sessao) FROM FatoVisitas fv"
+            " JOIN DimDominio dd ON fv.id_dim_dominio = dd.id_dim_dominio"
+            " JOIN DimDispositivo ddi ON fv.id_dim_dispositivo = ddi.id_dim_dispositivo"
+            " WHERE ddi.tipo_dispositivo = ? GROUP BY dd.nome_dominio ORDER BY dd.nome_dominio",
+            ("Desktop",)
+        ).fetchall()
+        conn.close()
+        rows = data["aggregateVisitas"]
+        self.assertEqual([(r["group"]["nomeDominio"], r["visits"], r["distinctSessions"]) for r in rows], expected)
+        for row in rows:
+            self.assertIsNone(row["group"]["tipoDispositivo"])
+            self.assertIsNone(row["distinctIps"])
+
+    def test_aggregate_visitas_top_n_and_total(self):
+        """Test ordering by a metric with a limit, and the ungrouped total."""
+        query = """
+            query {
+                top: aggregateVisitas(groupBy: [NOME_NAVEGADOR], orderBy: VISITS, limit: 2) { group { nomeNavegador } visits }
+                total: aggregateVisitas { visits }
+                none: aggregateVisitas(filter: { nomeNavegador: { equals: "NoSuchBrowser" } }) { visits }
+            }
+        """
+        data = self._run_query(query)
+        top = [row["visits"] for row in data["top"]]
+        self.assertEqual(len(top), 2)
+        self.assertGreaterEqual(top[0], top[1])
+        self.assertEqual(data["total"], [{"visits": self.TOTAL_VISITAS}])
+        self.assertEqual(data["none"], [{"visits": 0}])
+        self._run_query("query { aggregateVisitas(orderBy: DISTINCT_IPS) { visits } }", expect_error=True)
+
+    def test_aggregate_visits_served_from_rollup(self):
+        """Test that a visits-only aggregate inside a rollup's grain sums the rollup and matches the facts."""
+        statements = []
+        filter_input = VisitaFilterInput(pais_geografia=StringFilterInput(notEquals="Brazil"))
+        with get_pool().connection() as conn:
+            conn.set_trace_callback(statements.append)
+            try:
+                rows = _fetch_aggregates(conn, filter_input, ["tipo_dispositivo", "hora"], ["visits"], None, True, None)
+            finally:
+                conn.set_trace_callback(None)
+            expected = conn.execute(
+                "SELECT ddi.tipo_dispositivo, dt.hora, COUNT(*) FROM FatoVisitas fv"
+                " JOIN DimDispositivo ddi ON fv.id_dim_dispositivo = ddi.id_dim_dispositivo"
+                " JOIN DimTempo dt ON fv.id_dim_tempo = dt.id_dim_tempo"
+                " LEFT JOIN DimGeografia dg ON fv.id_dim_geografia = dg.id_dim_geografia"
+                " WHERE dg.pais != ? GROUP BY 1, 2 ORDER BY 1, 2",
+                ("Brazil",)
+            ).fetchall()
+        self.assertTrue(any("FROM RollupVisitasHora r" in sql for sql in statements))
+        self.assertEqual([(r.group.tipo_dispositivo, r.group.hora, r.visits) for r in rows], [tuple(row) for row in expected])
+
+    def _traced_statements(self, selection, offset_args=None):
+        statements = []
+        with get_pool().connection() as conn:
+            conn.set_trace_callback(statements.append)
+            try:
+                connection = _fetch_visitas(conn, None, None, offset_args, selection)
+            finally:
+                conn.set_trace_callback(None)
+        return connection, statements
+
+    def test_count_skipped_when_total_count_not_selected(self):
+        """Test that no COUNT runs when totalCount is not selected, and hasNextPage comes from a LIMIT+1 probe."""
+        selection = FULL_SELECTION._replace(total_count=False)
+        connection, statements = self._traced_statements(selection, PaginationModeInput(limit=5, offset=self.TOTAL_VISITAS - 5))
+        self.assertFalse(any("COUNT(" in sql for sql in statements))
+        self.assertEqual(len(connection.edges), 5)
+        self.assertFalse(connection.pageInfo.has_next_page)
+        connection, _ = self._traced_statements(selection, PaginationModeInput(limit=5, offset=self.TOTAL_VISITAS - 6))
+        self.assertEqual(len(connection.edges), 5)
+        self.assertTrue(connection.pageInfo.has_next_page)
+
+    def test_page_query_skipped_for_total_count_only(self):
+        """Test that a totalCount-only query does not fetch any rows."""
+        selection = FULL_SELECTION._replace(node_fields=frozenset(), edges=False, cursors=False, page_info=False, page_count=False)
+        self._traced_statements(selection) # Rollup freshness is checked once per data version
+        connection, statements = self._traced_statements(selection)
+        self.assertEqual(len(statements), 1)
+        self.assertIn("FROM RollupVisitasDia", statements[0])
+        self.assertEqual(connection.totalCount, self.TOTAL_VISITAS)
+
+    def test_total_count_only_query(self):
+        """Test a totalCount-only query through the API."""
+        data = self._run_query("query { getVisitas { totalCount pageSize } }")
+        self.assertEqual(data["getVisitas"]["totalCount"], self.TOTAL_VISITAS)
+        self.assertEqual(data["getVisitas"]["pageSize"], DEFAULT_PAGE_SIZE)
+
     # --- Tests for Etapa 10 Filters (Modified for Connection structure) ---
 
     def test_filter_timestamp_between_connection(self):
@@ -483,6 +693,96 @@ class TestGraphQLAPI(unittest.TestCase):
         variables = {"cursorArgs": {"last": 5, "before": cursor}, "offsetArgs": {"offset": 5}}
         self._run_query(query, variables, expect_error=True)
 
+    # --- Operational endpoints ---
+
+    def test_health_endpoint(self):
+        """Test that /health reports a healthy pool with its statistics."""
+        response = self.client.get("/health")
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertTrue(body["healthy"])
+        self.assertIn("pool", body)
+        self.assertGreaterEqual(body["pool"]["max_size"], 1)
+
+    def test_saturated_executor_returns_503(self):
+        """Test that getVisitas fails fast with 503 when the database executor is saturated."""
+        executor = configure_executor(max_workers=1, max_queue=0)
+        release = threading.Event()
+        blocker = threading.Thread(target=lambda: asyncio.run(executor.run(release.wait, 5)))
+        blocker.start()
+        try:
+            deadline = time.monotonic() + 2
+            while executor.stats()["in_flight"] == 0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            response = self.client.post("/graphql", json={"query": "query { getVisitas { totalCount } }"})
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.headers.get("retry-after"), "1")
+            self.assertIn("saturated", response.json()["errors"][0]["message"])
+        finally:
+            release.set()
+            blocker.join()
+            configure_executor()
+        self.assertIsNotNone(self._run_query("query { getVisitas { totalCount } }"))
+
+    # --- Export Tests ---
+
+    def test_export_ndjson_matches_get_visitas(self):
+        """Test that the NDJSON export streams every matching visit in getVisitas order."""
+        filter_json = {"OR": [{"tipoDispositivo": {"equals": "Mobile"}}, {"paisGeografia": {"equals": "Brazil"}}]}
+        response = self.client.post("/export/visitas", json={"filter": filter_json, "fields": ["idVisita", "paisGeografia"]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["content-type"], "application/x-ndjson")
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        data = self._run_query(
+            "query($filter: VisitaFilterInput, $n: Int) { getVisitas(filter: $filter, offsetArgs: {limit: $n}) {"
+            " totalCount edges { node { idVisita paisGeografia } } } }",
+            {"filter": filter_json, "n": self.TOTAL_VISITAS}
+        )
+        self.assertEqual(len(lines), data["getVisitas"]["totalCount"])
+        self.assertEqual(lines, [edge["node"] for edge in data["getVisitas"]["edges"]])
+
+    def test_export_csv_and_validation(self):
+        """Test the CSV header and row count, and 400 responses for invalid requests."""
+        response = self.client.post("/export/visitas?format=csv", json={"fields": ["idVisita", "timestampVisita", "cidadeGeografia"]})
+        self.assertEqual(response.status_code, 200)
+        rows = response.text.splitlines()
+        self.assertEqual(rows[0], "idVisita,timestampVisita,cidadeGeografia")
+        self.assertEqual(len(rows), self.TOTAL_VISITAS + 1)
+        self.assertEqual(self.client.post("/export/visitas?format=xml").status_code, 400)
+        self.assertEqual(self.client.post("/export/visitas", json={"fields": ["nope"]}).status_code, 400)
+        self.assertEqual(self.client.post("/export/visitas", json={"filter": {"hora": {"equals": "x"}}}).status_code, 400)
+
+    def test_export_releases_connection_when_abandoned(self):
+        """Test that closing an export mid-stream returns its connection to the pool."""
+        async def read_one_chunk():
+            export = VisitaExport(None, ["id_visita"], batch_size=10)
+            await export.open()
+            chunks = export.stream()
+            first = await chunks.__anext__()
+            self.assertEqual(get_pool().stats()["in_use"], 1)
+            await chunks.aclose() # What the server does when the client disconnects
+            return first
+        first = asyncio.run(read_one_chunk())
+        self.assertEqual(len(first.splitlines()), 10)
+        self.assertEqual(get_pool().stats()["in_use"], 0)
+
+    def test_concurrent_exports_are_limited(self):
+        """Test that exports beyond EXPORT_MAX_CONCURRENT get a 503 and leave the pool to queries."""
+        async def hold_export():
+            held = VisitaExport(None, ["id_visita"], batch_size=10)
+            await held.open()
+            try:
+                response = self.client.post("/export/visitas", json={"fields": ["idVisita"]})
+                self.assertEqual(response.status_code, 503)
+                self.assertEqual(response.headers["retry-after"], "1")
+                self.assertIn("getVisitas", self._run_query("{ getVisitas(offsetArgs: {limit: 1}) { totalCount } }"))
+            finally:
+                held.close()
+        with mock.patch.object(export, "EXPORT_MAX_CONCURRENT", 1):
+            asyncio.run(hold_export())
+            self.assertEqual(self.client.post("/export/visitas", json={"fields": ["idVisita"]}).status_code, 200)
+        self.assertEqual(get_pool().stats()["in_use"], 0)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+import sqlite3
+import os
+import tempfile
+
+# Assuming index_advisor.py is in the parent directory
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from index_advisor import (
+    MANAGED_INDEXES, StatementRecorder, advise, create_indexes, drop_superseded_indexes, ensure_managed_indexes,
+    existing_indexes, load_statements,
+)
+
+SCHEMA_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'schema.sql'))
+FILTERED_PAGE = (
+    "SELECT fv.id_visita FROM FatoVisitas fv WHERE fv.id_dim_navegador IN (?) "
+    "ORDER BY fv.timestamp_visita ASC, fv.id_visita ASC LIMIT ?"
+)
+
+class TestIndexAdvisor(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.conn = sqlite3.connect(os.path.join(self.tmpdir.name, "advisor.db"))
+        with open(SCHEMA_FILE) as f:
+            self.conn.executescript(f.read())
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmpdir.cleanup()
+
+    def test_schema_matches_managed_indexes(self):
+        indexes = existing_indexes(self.conn)
+        for name, columns in MANAGED_INDEXES.items():
+            self.assertEqual(indexes.get(name), columns, name)
+
+    def test_recommends_index_that_removes_scan(self):
+        self.conn.execute("DROP INDEX idx_fato_navegador_timestamp")
+        [advice] = advise(self.conn, [FILTERED_PAGE])
+        self.assertGreater(advice.issues.total, 0)
+        self.assertEqual(advice.recommended, ("idx_fato_navegador_timestamp", ("id_dim_navegador", "timestamp_visita")))
+        self.assertEqual(advice.issues_after.total, 0)
+        # The real database is untouched until the recommendation is applied
+        self.assertNotIn("idx_fato_navegador_timestamp", existing_indexes(self.conn))
+        self.assertEqual(create_indexes(self.conn, [advice.recommended]), ["idx_fato_navegador_timestamp"])
+        [advice] = advise(self.conn, [FILTERED_PAGE])
+        self.assertEqual(advice.issues.total, 0)
+        self.assertIsNone(advice.recommended)
+
+    def test_ensure_managed_indexes(self):
+        self.conn.execute("DROP INDEX idx_fato_dominio_timestamp")
+        self.assertEqual(ensure_managed_indexes(self.conn), ["idx_fato_dominio_timestamp"])
+        self.assertEqual(ensure_managed_indexes(self.conn), [])
+
+    def test_drop_superseded_indexes(self):
+        # Indexes of the schema before the composites replaced them
+        self.conn.execute("CREATE INDEX idx_fato_dominio ON FatoVisitas (id_dim_dominio)")
+        self.conn.execute("CREATE INDEX idx_fato_navegador ON FatoVisitas (id_dim_navegador)")
+        # Indexes an operator added on purpose, even where they lead a managed index
+        self.conn.execute("CREATE INDEX idx_fato_utm ON FatoVisitas (id_dim_utm) WHERE id_dim_utm IS NOT NULL")
+        self.conn.execute("CREATE INDEX idx_fato_geografia ON FatoVisitas (id_dim_geografia COLLATE NOCASE)")
+        self.conn.execute("CREATE INDEX idx_fato_referencia_only ON FatoVisitas (id_dim_referencia)")
+        self.conn.execute("CREATE UNIQUE INDEX idx_fato_dispositivo ON FatoVisitas (id_dim_dispositivo)")
+        # An old index whose replacement is missing is kept
+        self.conn.execute("DROP INDEX idx_fato_referencia_timestamp")
+        self.conn.execute("CREATE INDEX idx_fato_referencia ON FatoVisitas (id_dim_referencia)")
+        self.assertEqual(sorted(drop_superseded_indexes(self.conn)), ["idx_fato_dominio", "idx_fato_navegador"])
+        indexes = existing_indexes(self.conn)
+        for name in ("idx_fato_utm", "idx_fato_geografia", "idx_fato_referencia_only", "idx_fato_dispositivo", "idx_fato_referencia"):
+            self.assertIn(name, indexes)
+        self.assertEqual(drop_superseded_indexes(self.conn), [])
+
+    def test_recorder_keeps_distinct_statements(self):
+        log_path = os.path.join(self.tmpdir.name, "statements.log")
+        recorder = StatementRecorder(log_path)
+        recorder.record(FILTERED_PAGE)
+        recorder.record("  " + FILTERED_PAGE.replace(" ", "\n", 1))
+        recorder.record("SELECT COUNT(fv.id_visita) FROM FatoVisitas fv")
+        self.assertEqual(load_statements(log_path), [FILTERED_PAGE, "SELECT COUNT(fv.id_visita) FROM FatoVisitas fv"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,226 @@
+import unittest
+import sqlite3
+import os
+import json
+import datetime
+import tempfile
+import threading
+from types import SimpleNamespace
+from unittest import mock
+from fastapi.testclient import TestClient # type: ignore
+
+# Assuming ingest.py is in the parent directory
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from ingest import IngestQueueFullError, IngestUnavailableError, IngestWriter, close_ingest_writer, parse_events
+from main import app
+from init_db import init_db, DATABASE_FILE
+from db_pool import close_pool
+from seed_data import seed_data
+
+SCHEMA_FILE = os.path.join(os.path.dirname(__file__), '..', 'schema.sql')
+
+def make_event(**overrides):
+    event = {
+        "timestamp_visita": int(datetime.datetime(2024, 3, 4, 10, 15, 42).timestamp()),
+        "nome_dominio": "example.com", "caminho_pagina": "/", "url_completa": "https://example.com/",
+        "nome_navegador": "Chrome", "versao_navegador": "120.0", "so_usuario_navegador": "Linux",
+        "id_sessao_navegador": "session_1", "tipo_dispositivo": "Desktop", "endereco_ip": "10.0.0.1",
+    }
+    event.update(overrides)
+    return event
+
+class TestIngestWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "ingest.db")
+        self.conn = sqlite3.connect(self.path)
+        with open(SCHEMA_FILE) as f:
+            self.conn.executescript(f.read())
+        self.conn.execute("INSERT INTO DimDominio (nome_dominio) VALUES ('example.com')")
+        self.conn.commit()
+        self.writer = IngestWriter(self.path, refresh_rollups=False)
+
+    def tearDown(self):
+        self.writer.close()
+        self.conn.close()
+        self.tmpdir.cleanup()
+
+    def test_resolves_dimensions(self):
+        events = [
+            make_event(utm_source="google", pais_geografia="Brazil"),
+            make_event(utm_source="google", pais_geografia="Brazil", id_usuario_sessao="user_1"),
+            make_event(nome_dominio="other.org", timestamp_visita="2024-03-04T10:16:05", tipo_referencia="Social"),
+        ]
+        result = self.writer.ingest(events)
+        self.assertEqual(result, (3, 1, 3))
+        # Existing rows are reused; natural keys holding NULLs are matched null-safely
+        self.assertEqual(self.conn.execute("SELECT nome_dominio FROM DimDominio ORDER BY 1").fetchall(),
+                         [("example.com",), ("other.org",)])
+        for table in ("DimUtm", "DimGeografia", "DimSessao", "DimNavegador", "DimReferencia"):
+            self.assertEqual(self.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0], 1, table)
+        rows = self.conn.execute(
+            "SELECT fv.id_dim_utm, fv.id_dim_geografia, fv.id_dim_referencia, dt.data_completa, dt.hora, dt.minuto"
+            " FROM FatoVisitas fv JOIN DimTempo dt ON fv.id_dim_tempo = dt.id_dim_tempo ORDER BY fv.id_visita"
+        ).fetchall()
+        self.assertEqual(rows, [
+            (1, 1, None, "2024-03-04 10:15:00", 10, 15),
+            (1, 1, None, "2024-03-04 10:15:00", 10, 15),
+            (None, None, 1, "2024-03-04 10:16:00", 10, 16), # Absent left-joined dimensions stay NULL
+        ])
+        # A new writer (empty key maps) resolves the same keys from the database
+        other = IngestWriter(self.path, refresh_rollups=False)
+        try:
+            self.assertEqual(other.ingest(events[:1]), (1, 4, 4))
+        finally:
+            other.close()
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM DimUtm").fetchone()[0], 1)
+
+    def test_concurrent_batches_share_a_commit(self):
+        blocker = sqlite3.connect(self.path, check_same_thread=False)
+        blocker.execute("BEGIN IMMEDIATE") # Holds the write lock so batches pile up behind the first one
+        futures = [self.writer.submit([make_event(endereco_ip=f"10.0.1.{i}")] * 3) for i in range(5)]
+        threading.Timer(0.2, blocker.rollback).start()
+        results = [future.result(timeout=10) for future in futures]
+        blocker.close()
+        self.assertEqual([(r.first_id, r.last_id) for r in results], [(1, 3), (4, 6), (7, 9), (10, 12), (13, 15)])
+        self.assertLessEqual(self.writer.stats()["commits"], 2)
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM FatoVisitas").fetchone()[0], 15)
+
+    def test_rejects_invalid_batches(self):
+        invalid = [
+            [make_event(tipo_dispositivo=None)],
+            [make_event(extra="x")],
+            [make_event(timestamp_visita="yesterday")],
+            [make_event(pais_geografia=42)],
+            [make_event(utm_source="google", tipo_referencia=None, url_referencia="https://a.b/")],
+        ]
+        for events in invalid:
+            with self.subTest(events=events):
+                with self.assertRaises(ValueError):
+                    self.writer.submit(events)
+        small = IngestWriter(self.path, max_batch=2, max_pending=2, refresh_rollups=False)
+        try:
+            with self.assertRaises(ValueError):
+                small.submit([make_event()] * 3)
+        finally:
+            small.close()
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM FatoVisitas").fetchone()[0], 0)
+
+    def test_typed_batches_still_check_required_attributes(self):
+        # GraphQL accepts `urlReferencia` without `tipoReferencia`; DimReferencia does not
+        partial = SimpleNamespace(**make_event(url_referencia="https://a.b/"))
+        valid = SimpleNamespace(**make_event(url_referencia="https://a.b/", tipo_referencia="Social"))
+        with self.assertRaises(ValueError):
+            self.writer.submit([valid, partial], typed=True)
+        self.assertEqual(self.writer.submit([valid], typed=True).result(timeout=10).accepted, 1)
+        self.assertEqual(self.writer.stats()["failed_commits"], 0)
+
+    def test_queue_full(self):
+        blocker = sqlite3.connect(self.path)
+        blocker.execute("BEGIN IMMEDIATE")
+        writer = IngestWriter(self.path, max_batch=2, max_pending=2, refresh_rollups=False)
+        try:
+            future = writer.submit([make_event()] * 2)
+            with self.assertRaises(IngestQueueFullError):
+                writer.submit([make_event()])
+            blocker.rollback()
+            self.assertEqual(future.result(timeout=10).accepted, 2)
+            self.assertEqual(writer.submit([make_event()]).result(timeout=10).accepted, 1)
+        finally:
+            blocker.close()
+            writer.close()
+
+    def test_failed_rollup_refresh_keeps_the_writer_running(self):
+        writer = IngestWriter(self.path, refresh_rollups=True)
+        try:
+            with mock.patch("ingest.refresh_rollups", side_effect=RuntimeError("boom")):
+                self.assertEqual(writer.submit([make_event()]).result(timeout=10).accepted, 1)
+                self.assertEqual(writer.submit([make_event()]).result(timeout=10).accepted, 1)
+            self.assertEqual(writer.stats()["rollup_refresh_failures"], 2)
+        finally:
+            writer.close()
+
+    def test_parse_events(self):
+        self.assertEqual(
+            parse_events(b'{"nomeDominio": "a.com", "timestampVisita": 1}\n\n{"enderecoIp": "1.2.3.4"}\n', ndjson=True),
+            [{"nome_dominio": "a.com", "timestamp_visita": 1}, {"endereco_ip": "1.2.3.4"}]
+        )
+        for body in (b'{"nomeDominio": "a.com"}', b'[{"dataCompleta": "x"}]', b'[1]', b'[{'):
+            with self.subTest(body=body):
+                with self.assertRaises(ValueError):
+                    parse_events(body)
+
+class TestIngestAPI(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        close_pool()
+        close_ingest_writer()
+        if os.path.exists(DATABASE_FILE):
+            os.remove(DATABASE_FILE)
+        init_db()
+        seed_data()
+        cls.client = TestClient(app)
+
+    @classmethod
+    def tearDownClass(cls):
+        close_ingest_writer()
+        close_pool()
+        if os.path.exists(DATABASE_FILE):
+            os.remove(DATABASE_FILE)
+
+    def _count(self, filter_value):
+        response = self.client.post("/graphql", json={
+            "query": "query($filter: VisitaFilterInput) { getVisitas(filter: $filter) { totalCount } }",
+            "variables": {"filter": filter_value},
+        })
+        return response.json()["data"]["getVisitas"]["totalCount"]
+
+    def test_mutation_and_bulk_endpoint(self):
+        mutation = """
+            mutation($events: [VisitaEventInput!]!) {
+                ingestVisitas(events: $events) { accepted firstIdVisita lastIdVisita }
+            }
+        """
+        event = {
+            "timestampVisita": "2024-03-04T10:15:42", "nomeDominio": "ingested.example", "caminhoPagina": "/",
+            "urlCompleta": "https://ingested.example/", "nomeNavegador": "Chrome", "soUsuarioNavegador": "Linux",
+            "idSessaoNavegador": "session_abc", "tipoDispositivo": "Mobile", "enderecoIp": "10.0.0.5",
+        }
+        before = self._count(None)
+        response = self.client.post("/graphql", json={"query": mutation, "variables": {"events": [event, event]}})
+        self.assertEqual(response.status_code, 200, response.text)
+        result = response.json()["data"]["ingestVisitas"]
+        self.assertEqual((result["accepted"], result["lastIdVisita"] - result["firstIdVisita"]), (2, 1))
+        response = self.client.post(
+            "/ingest/visitas", content="\n".join([json.dumps({**event, "paisGeografia": "Chile"})] * 3),
+            headers={"Content-Type": "application/x-ndjson"}
+        )
+        self.assertEqual(response.status_code, 200, response.text)
+        self.assertEqual(response.json()["firstIdVisita"], result["lastIdVisita"] + 1)
+        self.assertEqual(self._count(None), before + 5)
+        self.assertEqual(self._count({"nomeDominio": {"equals": "ingested.example"}}), 5)
+        self.assertEqual(self._count({"paisGeografia": {"equals": "Chile"}, "hora": {"equals": 10}}), 3)
+
+        response = self.client.post("/graphql", json={
+            "query": mutation, "variables": {"events": [{**event, "urlReferencia": "https://a.b/"}]}
+        })
+        self.assertIn("tipo_referencia", response.json()["errors"][0]["message"])
+        self.assertEqual(self._count(None), before + 5)
+
+        response = self.client.post("/ingest/visitas", json=[{**event, "tipoDispositivo": None}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("tipo_dispositivo", response.json()["error"])
+
+    def test_unavailable_writer(self):
+        error = IngestUnavailableError("Ingestion is unavailable on a read-only database pool.")
+        with mock.patch("main.get_ingest_writer", side_effect=error):
+            response = self.client.post("/ingest/visitas", json=[])
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json(), {"error": str(error)})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+import os
+from fastapi.testclient import TestClient # type: ignore
+
+# Assuming metrics.py is in the parent directory
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from metrics import Histogram, RequestTimings, _current, phase_laps
+from main import app
+from response_cache import close_response_cache, get_response_cache
+from init_db import init_db, DATABASE_FILE
+from db_pool import close_pool
+from seed_data import seed_data
+
+QUERY = """
+query {
+    getVisitas(filter: {tipoDispositivo: {equals: "Mobile"}}, offsetArgs: {limit: 3, offset: 2}) {
+        totalCount edges { node { idVisita nomeDominio } }
+    }
+}
+"""
+
+class TestMetrics(unittest.TestCase):
+
+    def test_histogram_render(self):
+        histogram = Histogram("test_seconds", "Test histogram.", ("phase",), (0.1, 1))
+        for value in (0.05, 0.5, 5):
+            histogram.observe(("count",), value)
+        self.assertEqual(histogram.render(), [
+            "# HELP test_seconds Test histogram.",
+            "# TYPE test_seconds histogram",
+            'test_seconds_bucket{phase="count",le="0.1"} 1',
+            'test_seconds_bucket{phase="count",le="1"} 2',
+            'test_seconds_bucket{phase="count",le="+Inf"} 3',
+            'test_seconds_sum{phase="count"} 5.55',
+            'test_seconds_count{phase="count"} 3',
+        ])
+
+    def test_laps_outside_an_operation_record_nothing(self):
+        laps = phase_laps("getVisitas")
+        laps.lap("count")
+        laps.rows(1, 1)
+        self.assertIsNone(laps.timings)
+        timings = RequestTimings()
+        token = _current.set(timings)
+        try:
+            laps = phase_laps("getVisitas")
+            laps.lap("count")
+            laps.lap("count")
+            laps.statement("SELECT  1\n")
+        finally:
+            _current.reset(token)
+        self.assertEqual(list(timings.phases), [("getVisitas", "count")])
+        self.assertEqual(timings.statements, ["SELECT 1"])
+
+class TestMetricsAPI(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        close_pool()
+        if os.path.exists(DATABASE_FILE):
+            os.remove(DATABASE_FILE)
+        init_db()
+        seed_data()
+        cls.client = TestClient(app)
+
+    @classmethod
+    def tearDownClass(cls):
+        close_response_cache()
+        close_pool()
+        if os.path.exists(DATABASE_FILE):
+            os.remove(DATABASE_FILE)
+
+    def _post(self, headers=None):
+        response_cache = get_response_cache()
+        if response_cache is not None:
+            response_cache.clear() # Time the SQL phases, not a cache hit
+        return self.client.post("/graphql", json={"query": QUERY}, headers=headers)
+
+    def test_timings_extension_and_metrics_route(self):
+        self.assertNotIn("extensions", self._post().json())
+
+        responses = [self._post({"X-Request-Timings": "1"}) for _ in range(2)]
+        timings = [r.json()["extensions"]["timings"] for r in responses]
+        phases = timings[0]["phasesMs"]
+        for phase in ("parse", "validate", "execute", "serialize", "getVisitas.compile_filter", "getVisitas.count",
+                      "getVisitas.page_query", "getVisitas.fetchall", "getVisitas.build_nodes"):
+            self.assertIn(phase, phases)
+        self.assertGreaterEqual(phases["execute"], phases["getVisitas.page_query"])
+        self.assertEqual(timings[0]["rowsReturned"], {"getVisitas": 3})
+        self.assertGreaterEqual(timings[0]["rowsScanned"]["getVisitas"], 5) # 2 skipped + 3 returned, plus the count
+        self.assertEqual(timings[0]["sqlShape"], timings[1]["sqlShape"]) # Same shape, same hash
+
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/plain; version=0.0.4"))
+        text = response.text
+        self.assertIn("# TYPE graphql_phase_duration_seconds histogram", text)
+        self.assertIn('graphql_phase_duration_seconds_count{field="getVisitas",phase="fetchall"}', text)
+        self.assertIn('graphql_rows_returned_bucket{field="getVisitas",le="10"}', text)
+        count = next(line for line in text.splitlines() if line.startswith('graphql_operation_duration_seconds_count{operation="query"}'))
+        self.assertGreaterEqual(int(count.split()[-1]), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+import sqlite3
+import os
+import tempfile
+
+# Assuming offset_index.py is in the parent directory
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from offset_index import OffsetCheckpoints
+
+class TestOffsetCheckpoints(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.conn = sqlite3.connect(os.path.join(self.tmpdir.name, "facts.db"))
+        self.conn.execute("CREATE TABLE FatoVisitas (id_visita INTEGER PRIMARY KEY, timestamp_visita INTEGER, kind INTEGER)")
+        # Many rows share a timestamp, so seeks must break ties on id_visita
+        self.conn.executemany(
+            "INSERT INTO FatoVisitas VALUES (?, ?, ?)",
+            [(i, 1000 + (i * 7919) % 23, i % 3) for i in range(1, 201)]
+        )
+        self.conn.commit()
+        self.index = OffsetCheckpoints(interval=10)
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmpdir.cleanup()
+
+    def _page(self, condition, params, offset, limit=5, token=(1, 1)):
+        conditions, seek_params, residual = self.index.seek(self.conn, condition, token, " FROM FatoVisitas fv", condition, params, offset)
+        all_conditions = ([condition] if condition else []) + conditions
+        where_clause = " WHERE " + " AND ".join(all_conditions) if all_conditions else ""
+        return [row[0] for row in self.conn.execute(
+            f"SELECT fv.id_visita FROM FatoVisitas fv{where_clause} ORDER BY fv.timestamp_visita, fv.id_visita LIMIT ? OFFSET ?",
+            params + seek_params + [limit, residual]
+        )], residual
+
+    def _expected(self, condition, params, offset, limit=5):
+        where = f" WHERE {condition}" if condition else ""
+        return [row[0] for row in self.conn.execute(
+            f"SELECT fv.id_visita FROM FatoVisitas fv{where} ORDER BY fv.timestamp_visita, fv.id_visita LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        )]
+
+    def test_matches_plain_offset(self):
+        for condition, params in (("", []), ("fv.kind = ?", [1])):
+            matching = self.conn.execute(f"SELECT COUNT(*) FROM FatoVisitas fv WHERE {condition or 1}", params).fetchone()[0]
+            for offset in (0, 9, 10, 11, 37, 66, 67, 68, 150, 199, 250):
+                page, residual = self._page(condition, params, offset)
+                self.assertEqual(page, self._expected(condition, params, offset), (condition, offset))
+                if offset < matching:
+                    self.assertLess(residual, 10)
+
+    def test_checkpoints_are_reused_and_invalidated(self):
+        self._page("", [], 55)
+        built = self.index.stats()["checkpoints_built"]
+        self.assertEqual(built, 5)
+        self._page("", [], 45)
+        self.assertEqual(self.index.stats()["checkpoints_built"], built)
+        # Rows inserted before existing checkpoints shift every position: a new token rebuilds
+        self.conn.execute("INSERT INTO FatoVisitas VALUES (500, 0, 0)")
+        self.conn.commit()
+        page, _ = self._page("", [], 55, token=(1, 2))
+        self.assertEqual(page, self._expected("", [], 55))
+        self.assertEqual(self.index.stats()["invalidations"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
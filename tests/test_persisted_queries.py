@@ -0,0 +1,91 @@
+import unittest
+import os
+import json
+from fastapi.testclient import TestClient # type: ignore
+
+# Assuming persisted_queries.py is in the parent directory
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from persisted_queries import (
+    PersistedQueryStore, close_persisted_queries, document_cache_stats, get_persisted_query_store, query_hash,
+)
+from main import app
+from init_db import init_db, DATABASE_FILE
+from db_pool import close_pool
+from seed_data import seed_data
+
+class TestCaches(unittest.TestCase):
+
+    def test_persisted_query_store(self):
+        store = PersistedQueryStore(max_size=1)
+        with self.assertRaises(ValueError):
+            store.register(query_hash("{ b }"), "{ a }")
+        store.register(query_hash("{ a }").upper(), "{ a }")
+        self.assertEqual(store.get(query_hash("{ a }")), "{ a }")
+        store.register(query_hash("{ b }"), "{ b }")
+        self.assertIsNone(store.get(query_hash("{ a }")))
+        self.assertEqual(store.stats(), {"entries": 1, "max_size": 1, "hits": 1, "misses": 1, "registrations": 2})
+
+class TestPersistedQueriesAPI(unittest.TestCase):
+
+    QUERY = "query($limit: Int!) { getVisitas(offsetArgs: {limit: $limit}) { totalCount edges { node { idVisita } } } }"
+
+    @classmethod
+    def setUpClass(cls):
+        close_pool()
+        close_persisted_queries()
+        if os.path.exists(DATABASE_FILE):
+            os.remove(DATABASE_FILE)
+        init_db()
+        seed_data()
+        cls.client = TestClient(app)
+
+    @classmethod
+    def tearDownClass(cls):
+        close_persisted_queries()
+        close_pool()
+        if os.path.exists(DATABASE_FILE):
+            os.remove(DATABASE_FILE)
+
+    def _extensions(self, query=QUERY):
+        return {"persistedQuery": {"version": 1, "sha256Hash": query_hash(query)}}
+
+    def test_apq_flow(self):
+        variables = {"limit": 2}
+        missing = self.client.post("/graphql", json={"variables": variables, "extensions": self._extensions()})
+        self.assertEqual(missing.status_code, 200)
+        self.assertEqual(missing.json()["errors"][0]["extensions"]["code"], "PERSISTED_QUERY_NOT_FOUND")
+
+        registered = self.client.post("/graphql", json={"query": self.QUERY, "variables": variables, "extensions": self._extensions()})
+        by_hash = self.client.post("/graphql", json={"variables": variables, "extensions": self._extensions()})
+        self.assertEqual(len(registered.json()["data"]["getVisitas"]["edges"]), 2)
+        self.assertEqual(by_hash.json(), registered.json())
+
+        by_get = self.client.get("/graphql", params={
+            "variables": json.dumps(variables), "extensions": json.dumps(self._extensions()),
+        })
+        self.assertEqual(by_get.json(), registered.json())
+
+        mismatch = self.client.post("/graphql", json={"query": "{ __typename }", "extensions": self._extensions()})
+        self.assertEqual(mismatch.status_code, 400)
+        version = self.client.post("/graphql", json={"extensions": {"persistedQuery": {"version": 2, "sha256Hash": "x"}}})
+        self.assertEqual(version.status_code, 400)
+        self.assertGreaterEqual(get_persisted_query_store().stats()["hits"], 2)
+
+    def test_document_cache_skips_parse_and_validation(self):
+        query = "{ getVisitas(offsetArgs: {limit: 1}) { totalCount } }"
+        first = self.client.post("/graphql", json={"query": query}).json()
+        before = document_cache_stats()
+        self.assertEqual(self.client.post("/graphql", json={"query": query}).json(), first)
+        after = document_cache_stats()
+        for step in ("parse", "validation"):
+            self.assertEqual((after[step]["hits"], after[step]["misses"]), (before[step]["hits"] + 1, before[step]["misses"]))
+
+        for _ in range(2): # Cached validation errors and uncached syntax errors are still reported
+            self.assertIn("errors", self.client.post("/graphql", json={"query": "{ getVisitas { nope } }"}).json())
+            self.assertIn("errors", self.client.post("/graphql", json={"query": "{ getVisitas "}).json())
+        self.assertIn("document_cache", self.client.get("/health").json())
+
+if __name__ == '__main__':
+    unittest.main()
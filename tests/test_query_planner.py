@@ -0,0 +1,62 @@
+import unittest
+import datetime
+
+# Assuming query_planner.py is in the parent directory
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from query_planner import build_from_clause, plan_projection, required_aliases
+from filter_compiler import compile_filter
+from schema import VisitaFilterInput, StringFilterInput, DateTimeFilterInput
+
+class TestQueryPlanner(unittest.TestCase):
+
+    def test_fact_only_fields_need_no_joins(self):
+        self.assertEqual(required_aliases({"id_visita", "timestamp_visita"}), frozenset())
+        self.assertEqual(build_from_clause(set()), " FROM FatoVisitas fv")
+        self.assertEqual(build_from_clause(set(), leading="sample_blocks sb"), " FROM sample_blocks sb CROSS JOIN FatoVisitas fv")
+
+    def test_joins_follow_schema_order_and_join_type(self):
+        from_clause = build_from_clause(required_aliases({"pais_geografia", "nome_dominio"}))
+        self.assertEqual(
+            from_clause,
+            " FROM FatoVisitas fv"
+            " JOIN DimDominio dd ON fv.id_dim_dominio = dd.id_dim_dominio"
+            " LEFT JOIN DimGeografia dg ON fv.id_dim_geografia = dg.id_dim_geografia"
+        )
+
+    def test_filter_fields_walk_nested_logic(self):
+        filter_input = VisitaFilterInput(
+            timestamp_visita=DateTimeFilterInput(greaterThan=datetime.datetime(2023, 1, 1)),
+            OR=[
+                VisitaFilterInput(AND=[VisitaFilterInput(pais_geografia=StringFilterInput(equals="USA"))]),
+                VisitaFilterInput(nome_navegador=StringFilterInput(equals="Chrome")),
+            ]
+        )
+        fields = compile_filter(filter_input).fields
+        self.assertEqual(fields, {"timestamp_visita", "pais_geografia", "nome_navegador"})
+        self.assertEqual(required_aliases(fields), {"dg", "dn"})
+
+    def test_no_filter(self):
+        self.assertEqual(compile_filter(None).fields, frozenset())
+        self.assertEqual(compile_filter(VisitaFilterInput()).fields, frozenset())
+
+    def test_projection_reads_cached_dimensions_through_foreign_keys(self):
+        projection = plan_projection({"id_visita", "nome_dominio", "cidade_geografia", "pais_geografia"}, True, {"dd", "dg"})
+        self.assertEqual(projection.columns, ("fv.id_visita", "fv.timestamp_visita", "fv.id_dim_dominio", "fv.id_dim_geografia"))
+        self.assertEqual(projection.aliases, frozenset())
+        self.assertEqual(projection.direct, (("id_visita", 0),))
+        self.assertEqual(projection.cached, (
+            ("dd", 2, (("nome_dominio", 0),)),
+            ("dg", 3, (("pais_geografia", 0), ("cidade_geografia", 2))),
+        ))
+        self.assertEqual((projection.timestamp_index, projection.id_index), (1, 0))
+        # Without the cache the dimension columns are joined
+        projection = plan_projection({"nome_dominio"}, False)
+        self.assertEqual(projection.columns, ("dd.nome_dominio",))
+        self.assertEqual(projection.aliases, {"dd"})
+
+
+if __name__ == '__main__':
+    unittest.main()
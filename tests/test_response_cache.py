@@ -0,0 +1,114 @@
+import unittest
+import sqlite3
+import os
+import time
+from fastapi.testclient import TestClient # type: ignore
+
+# Assuming response_cache.py is in the parent directory
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from response_cache import ResponseCache, close_response_cache, estimate_size, get_response_cache
+from schema import PageInfo, VisitaConnection, _row_class
+from query_planner import plan_projection
+from main import app
+from init_db import init_db, DATABASE_FILE
+from db_pool import close_pool
+from seed_data import seed_data
+
+def make_connection(rows):
+    row_class = _row_class(plan_projection({"id_visita", "nome_dominio"}, False), False)
+    edges = [row_class((i, "example.com")) for i in range(rows)]
+    return VisitaConnection(edges=edges, pageInfo=PageInfo(has_next_page=False, has_previous_page=False),
+                            totalCount=rows, pageSize=rows, pageCount=rows)
+
+class TestResponseCache(unittest.TestCase):
+
+    def test_lru_by_size_and_ttl(self):
+        size = estimate_size(make_connection(10))
+        cache = ResponseCache(max_bytes=size * 2, ttl=0.05)
+        for key in ("a", "b"):
+            cache.put(key, (1, 1), make_connection(10))
+        self.assertIsNotNone(cache.get("a", (1, 1))) # "b" becomes the least recently used
+        cache.put("c", (1, 1), make_connection(10))
+        self.assertIsNone(cache.get("b", (1, 1)))
+        self.assertIsNotNone(cache.get("c", (1, 1)))
+        cache.put("huge", (1, 1), make_connection(100)) # Larger than the whole cache: not stored
+        self.assertEqual(cache.stats()["entries"], 2)
+        time.sleep(0.06)
+        self.assertIsNone(cache.get("a", (1, 1)))
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["evictions"], stats["expirations"]), (2, 2, 1, 1))
+
+    def test_data_version_invalidates(self):
+        cache = ResponseCache()
+        cache.put("a", (1, 1), make_connection(1))
+        self.assertIsNotNone(cache.get("a", (1, 1)))
+        self.assertIsNone(cache.get("a", (1, 2))) # A commit happened
+        cache.put("a", (1, 1), make_connection(1)) # Computed before that commit: dropped
+        self.assertIsNone(cache.get("a", (1, 2)))
+        cache.put("a", (1, 2), make_connection(1))
+        self.assertIsNotNone(cache.get("a", (1, 2)))
+        self.assertEqual(cache.stats()["invalidations"], 1)
+
+    def test_key(self):
+        key = ResponseCache.key(("shape", (1,)), None, None, ("selection",))
+        self.assertEqual(key, ResponseCache.key(("shape", (1,)), None, None, ("selection",)))
+        self.assertNotEqual(key, ResponseCache.key(("shape", (2,)), None, None, ("selection",)))
+
+class TestResponseCacheAPI(unittest.TestCase):
+
+    QUERY = """
+        query($filter: VisitaFilterInput, $offsetArgs: PaginationModeInput) {
+            getVisitas(filter: $filter, offsetArgs: $offsetArgs) { totalCount edges { node { idVisita tipoDispositivo } } }
+        }
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        close_pool()
+        close_response_cache()
+        if os.path.exists(DATABASE_FILE):
+            os.remove(DATABASE_FILE)
+        init_db()
+        seed_data()
+        cls.client = TestClient(app)
+
+    @classmethod
+    def tearDownClass(cls):
+        close_response_cache()
+        close_pool()
+        if os.path.exists(DATABASE_FILE):
+            os.remove(DATABASE_FILE)
+
+    def _get(self, filter_value, offset_args=None):
+        response = self.client.post("/graphql", json={
+            "query": self.QUERY, "variables": {"filter": filter_value, "offsetArgs": offset_args},
+        })
+        return response.json()["data"]["getVisitas"]
+
+    def test_repeated_requests_hit_until_data_changes(self):
+        cache = get_response_cache()
+        cache.clear()
+        mobile = {"tipoDispositivo": {"equals": "Mobile"}}
+        first = self._get(mobile)
+        before = cache.stats()
+        self.assertEqual(self._get(mobile), first)
+        self.assertEqual(cache.stats()["hits"], before["hits"] + 1)
+        self._get(mobile, {"limit": 5}) # Another page is another entry
+        self._get({"tipoDispositivo": {"equals": "Tablet"}})
+        self.assertEqual(cache.stats()["hits"], before["hits"] + 1)
+
+        conn = sqlite3.connect(DATABASE_FILE)
+        conn.execute("INSERT INTO FatoVisitas SELECT NULL, id_dim_dominio, id_dim_pagina, id_dim_url, id_dim_navegador, id_dim_utm,"
+                     " id_dim_sessao, id_dim_dispositivo, id_dim_ip, id_dim_tempo, id_dim_geografia, id_dim_referencia, timestamp_visita"
+                     " FROM FatoVisitas WHERE id_visita = ?", (first["edges"][0]["node"]["idVisita"],))
+        conn.commit()
+        conn.close()
+        self.assertEqual(self._get(mobile)["totalCount"], first["totalCount"] + 1)
+        self.assertGreaterEqual(cache.stats()["invalidations"], 1)
+        self.assertIn("response_cache", self.client.get("/health").json())
+        self.assertIn('response_cache_events_total{event="hits"}', self.client.get("/metrics").text)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import unittest
+import sqlite3
+import os
+import tempfile
+
+# Assuming rollups.py is in the parent directory
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from aggregates import build_aggregate_query
+from filter_compiler import compile_filter
+from query_planner import build_from_clause, required_aliases
+from rollups import ROLLUPS, choose_rollup, fresh_rollups, rebuild_rollups, refresh_rollups, rollup_count_query
+from schema import VisitaFilterInput, StringFilterInput, IntFilterInput
+
+SCHEMA_FILE = os.path.join(os.path.dirname(__file__), '..', 'schema.sql')
+
+class TestRollups(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.conn = sqlite3.connect(os.path.join(self.tmpdir.name, "rollups.db"))
+        with open(SCHEMA_FILE) as f:
+            self.conn.executescript(f.read())
+        for table, columns, values in [
+            ("DimDominio", "nome_dominio", ["a.com", "b.com"]),
+            ("DimPagina", "caminho_pagina", ["/"]),
+            ("DimUrl", "url_completa", ["https://a.com/"]),
+            ("DimSessao", "id_sessao_navegador", ["s1"]),
+            ("DimIp", "endereco_ip", ["10.0.0.1"]),
+        ]:
+            self.conn.executemany(f"INSERT INTO {table} ({columns}) VALUES (?)", [(value,) for value in values])
+        self.conn.execute("INSERT INTO DimNavegador (nome_navegador, sistema_operacional_usuario) VALUES ('Chrome', 'Linux')")
+        self.conn.execute("INSERT INTO DimDispositivo (tipo_dispositivo) VALUES ('Mobile')")
+        self.conn.execute("INSERT INTO DimGeografia (pais, regiao, cidade) VALUES ('Brazil', 'SP', 'Campinas')")
+        self.conn.execute("INSERT INTO DimReferencia (tipo_referencia) VALUES ('Organic')")
+        self.conn.executemany(
+            "INSERT INTO DimTempo (data_completa, ano, mes, dia, dia_semana, hora, minuto) VALUES (?, 2023, 1, ?, 0, ?, 0)",
+            [("2023-01-01 09:00:00", 1, 9), ("2023-01-01 10:00:00", 1, 10), ("2023-01-02 09:00:00", 2, 9)]
+        )
+        self.conn.commit()
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmpdir.cleanup()
+
+    def _add_visits(self, *visits):
+        """Inserts facts as (domain id, time id, geography id or None)."""
+        self.conn.executemany(
+            "INSERT INTO FatoVisitas (id_dim_dominio, id_dim_pagina, id_dim_url, id_dim_navegador, id_dim_sessao,"
+            " id_dim_dispositivo, id_dim_ip, id_dim_tempo, id_dim_geografia, id_dim_referencia, timestamp_visita)"
+            " VALUES (?, 1, 1, 1, 1, 1, 1, ?, ?, NULL, 0)",
+            visits
+        )
+        self.conn.commit()
+
+    def _counts(self, filter_input, group_by):
+        """Returns (fact-table rows, rollup rows) of a `visits` aggregate."""
+        compiled = compile_filter(filter_input)
+        rollup = choose_rollup(compiled.fields | set(group_by))
+        facts = self.conn.execute(*build_aggregate_query(compiled, group_by, ["visits"])).fetchall()
+        rolled = self.conn.execute(*build_aggregate_query(compiled, group_by, ["visits"], rollup=rollup)).fetchall()
+        return facts, rolled
+
+    def test_choose_rollup_picks_coarsest_covering_grain(self):
+        self.assertEqual(choose_rollup({"nome_dominio", "dia"}), ROLLUPS[0])
+        self.assertEqual(choose_rollup({"pais_geografia", "hora"}), ROLLUPS[1])
+        self.assertIsNone(choose_rollup({"minuto"}))
+        self.assertIsNone(choose_rollup({"nome_dominio", "endereco_ip"}))
+
+    def test_refresh_is_incremental_and_null_safe(self):
+        self._add_visits((1, 1, 1), (1, 1, None), (2, 2, None))
+        self.assertEqual(refresh_rollups(self.conn), {"RollupVisitasDia": 3, "RollupVisitasHora": 3})
+        self.assertEqual(refresh_rollups(self.conn), {})
+        # New facts add to existing groups, NULL keys included, instead of duplicating them
+        self._add_visits((1, 1, None), (2, 3, 1))
+        refresh_rollups(self.conn)
+        self.assertEqual(self.conn.execute("SELECT COUNT(*), SUM(visits) FROM RollupVisitasDia").fetchone(), (4, 5))
+        self.assertEqual(
+            self.conn.execute("SELECT visits FROM RollupVisitasDia WHERE nome_dominio = 'a.com' AND pais_geografia IS NULL").fetchone(),
+            (2,)
+        )
+        watermarks = dict(self.conn.execute("SELECT rollup, id_visita FROM RollupWatermark").fetchall())
+        self.assertEqual(watermarks, {"RollupVisitasDia": 5, "RollupVisitasHora": 5})
+
+    def test_reads_skip_stale_rollups_without_refreshing(self):
+        self._add_visits((1, 1, 1))
+        refresh_rollups(self.conn)
+        self.assertEqual(fresh_rollups(self.conn), {"RollupVisitasDia", "RollupVisitasHora"})
+        self._add_visits((2, 2, None))
+        changes = self.conn.total_changes
+        self.assertEqual(fresh_rollups(self.conn), frozenset()) # Behind the facts: not used, and not written to
+        self.assertEqual(self.conn.total_changes, changes)
+        self.assertEqual(fresh_rollups(self.conn, auto_refresh=True), {"RollupVisitasDia", "RollupVisitasHora"})
+
+    def test_rollup_answers_match_fact_table(self):
+        self._add_visits((1, 1, 1), (1, 2, None), (2, 2, None), (2, 3, 1), (1, 3, 1))
+        refresh_rollups(self.conn)
+        cases = [
+            (None, []),
+            (None, ["nome_dominio", "dia"]),
+            (VisitaFilterInput(pais_geografia=StringFilterInput(notEquals="Brazil")), []),
+            (VisitaFilterInput(hora=IntFilterInput(equals=9)), ["pais_geografia"]),
+            (VisitaFilterInput(OR=[
+                VisitaFilterInput(nome_dominio=StringFilterInput(equals="b.com")),
+                VisitaFilterInput(dia=IntFilterInput(greaterThan=1)),
+            ]), ["nome_dominio"]),
+            (VisitaFilterInput(nome_dominio=StringFilterInput(equals="nowhere.com")), []),
+        ]
+        for filter_input, group_by in cases:
+            with self.subTest(filter=filter_input, group_by=group_by):
+                facts, rolled = self._counts(filter_input, group_by)
+                self.assertEqual(rolled, facts)
+        compiled = compile_filter(VisitaFilterInput(nome_dominio=StringFilterInput(equals="a.com")))
+        count_sql = f"SELECT COUNT(*){build_from_clause(required_aliases(compiled.fields))}{compiled.where}"
+        self.assertEqual(
+            self.conn.execute(*rollup_count_query(ROLLUPS[0], compiled)).fetchone(),
+            self.conn.execute(count_sql, compiled.params).fetchone()
+        )
+
+    def test_rebuild_recomputes_after_deletes(self):
+        self._add_visits((1, 1, 1), (2, 2, None))
+        refresh_rollups(self.conn)
+        self.conn.execute("DELETE FROM FatoVisitas WHERE id_dim_dominio = 2")
+        self.conn.commit()
+        rebuild_rollups(self.conn)
+        self.assertEqual(self.conn.execute("SELECT nome_dominio, visits FROM RollupVisitasHora").fetchall(), [("a.com", 1)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import unittest
+import sqlite3
+import os
+import random
+from fastapi.testclient import TestClient # type: ignore
+
+# Assuming sampling.py is in the parent directory
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sampling import estimate_count, sample_blocks
+from filter_compiler import CompiledFilter
+from count_cache import get_count_cache
+from main import app
+from init_db import init_db, DATABASE_FILE
+from db_pool import close_pool
+from seed_data import seed_data
+
+class TestSampling(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.execute("CREATE TABLE FatoVisitas (id_visita INTEGER PRIMARY KEY, kind INTEGER)")
+        rng = random.Random(5)
+        self.conn.executemany("INSERT INTO FatoVisitas (kind) VALUES (?)", [(rng.randrange(10),) for _ in range(100000)])
+        self.statements = 0
+
+    def tearDown(self):
+        self.conn.close()
+
+    def _estimate(self, condition, params, sample_rows):
+        def run(query, query_params):
+            self.statements += 1
+            return self.conn.execute(query, query_params).fetchall()
+        return estimate_count(self.conn, frozenset(), CompiledFilter(condition, params, frozenset(), None),
+                              sample_rows, 0.95, run)
+
+    def test_sample_blocks(self):
+        self.assertEqual(sample_blocks(1, 100, 1000, blocks=4), [(1, 100)])
+        self.assertEqual(sample_blocks(1, 100, 8, blocks=4), [(1, 2), (26, 27), (51, 52), (76, 77)])
+
+    def test_estimate_within_interval(self):
+        exact = self.conn.execute("SELECT COUNT(*) FROM FatoVisitas WHERE kind < 3").fetchone()[0]
+        estimate = self._estimate("fv.kind < ?", [3], 5000)
+        self.assertFalse(estimate.exact)
+        self.assertLessEqual(estimate.lower, exact)
+        self.assertGreaterEqual(estimate.upper, exact)
+        self.assertLess(estimate.upper - estimate.lower, exact * 0.2)
+        self.assertAlmostEqual(estimate.sample_fraction, 0.05, places=2)
+        self.assertEqual(estimate, self._estimate("fv.kind < ?", [3], 5000)) # Deterministic
+
+        nothing = self._estimate("fv.kind = ?", [42], 5000)
+        self.assertEqual((nothing.value, nothing.lower), (0, 0))
+        self.assertGreater(nothing.upper, 0) # No match in the sample does not prove there is none
+
+        everything = self._estimate("", [], 200000) # The sample covers the table: exact
+        self.assertEqual((everything.value, everything.upper, everything.exact), (100000, 100000, True))
+
+class TestSamplingAPI(unittest.TestCase):
+
+    QUERY = """
+        query($approximate: ApproximateInput, $offsetArgs: PaginationModeInput) {
+            getVisitas(filter: {idSessaoNavegador: {startsWith: "sess"}}, approximate: $approximate, offsetArgs: $offsetArgs) {
+                totalCount
+                totalCountEstimate { value lower upper confidence sampleFraction sampledRows exact }
+                pageInfo { hasNextPage }
+            }
+        }
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        close_pool()
+        if os.path.exists(DATABASE_FILE):
+            os.remove(DATABASE_FILE)
+        init_db()
+        seed_data()
+        cls.client = TestClient(app)
+
+    @classmethod
+    def tearDownClass(cls):
+        close_pool()
+        if os.path.exists(DATABASE_FILE):
+            os.remove(DATABASE_FILE)
+
+    def _post(self, approximate, offset_args=None):
+        return self.client.post("/graphql", json={
+            "query": self.QUERY, "variables": {"approximate": approximate, "offsetArgs": offset_args},
+        }).json()
+
+    def test_approximate_total_count(self):
+        exact = self._post(None)["data"]["getVisitas"]
+        self.assertIsNone(exact["totalCountEstimate"])
+
+        full = self._post({})["data"]["getVisitas"] # The default sample covers the seeded table
+        self.assertEqual(full["totalCountEstimate"]["value"], exact["totalCount"])
+        self.assertTrue(full["totalCountEstimate"]["exact"])
+
+        cached = self._post({"sampleRows": 128}, {"limit": 5, "offset": 0})["data"]["getVisitas"]["totalCountEstimate"]
+        self.assertEqual((cached["value"], cached["exact"], cached["sampledRows"]), (exact["totalCount"], True, 0)) # From the count cache
+
+        get_count_cache().clear()
+        sampled = self._post({"sampleRows": 128, "confidence": 0.99}, {"limit": 5, "offset": 0})["data"]["getVisitas"]
+        estimate = sampled["totalCountEstimate"]
+        self.assertFalse(estimate["exact"])
+        self.assertEqual((sampled["totalCount"], estimate["confidence"]), (estimate["value"], 0.99))
+        self.assertLessEqual(estimate["lower"], exact["totalCount"])
+        self.assertGreaterEqual(estimate["upper"], exact["totalCount"])
+        self.assertLessEqual(estimate["sampledRows"], 128)
+        self.assertTrue(sampled["pageInfo"]["hasNextPage"]) # Probed, not derived from the estimate
+
+        for approximate in ({"sampleRows": 0}, {"confidence": 1.0}):
+            with self.subTest(approximate=approximate):
+                self.assertIn("errors", self._post(approximate))
+
+if __name__ == '__main__':
+    unittest.main()
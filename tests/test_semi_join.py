@@ -0,0 +1,88 @@
+import unittest
+import sqlite3
+import os
+import tempfile
+
+# Assuming semi_join.py is in the parent directory
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from filter_compiler import compile_filter
+from semi_join import rewrite_semi_joins, semi_join_cache_info
+from schema import VisitaFilterInput, StringFilterInput, IntFilterInput
+
+class TestSemiJoinRewrite(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.conn = sqlite3.connect(os.path.join(self.tmpdir.name, "dims.db"))
+        self.conn.execute(
+            "CREATE TABLE DimNavegador (id_dim_navegador INTEGER PRIMARY KEY AUTOINCREMENT, nome_navegador TEXT,"
+            " versao_navegador TEXT, motor_renderizacao TEXT, sistema_operacional_usuario TEXT)"
+        )
+        self.conn.execute(
+            "CREATE TABLE DimGeografia (id_dim_geografia INTEGER PRIMARY KEY AUTOINCREMENT, pais TEXT, regiao TEXT, cidade TEXT)"
+        )
+        self.conn.executemany(
+            "INSERT INTO DimNavegador (nome_navegador, sistema_operacional_usuario) VALUES (?, ?)",
+            [("Chrome", "Windows"), ("Firefox", "Linux"), ("Chrome", "macOS")]
+        )
+        self.conn.execute("INSERT INTO DimGeografia (pais, regiao, cidade) VALUES ('Brazil', 'SP', 'Campinas')")
+        self.conn.commit()
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmpdir.cleanup()
+
+    def _rewrite(self, filter_input, **kwargs):
+        return rewrite_semi_joins(compile_filter(filter_input), self.conn, **kwargs)
+
+    def test_dimension_leaf_becomes_foreign_key_list(self):
+        rewritten = self._rewrite(VisitaFilterInput(
+            nome_navegador=StringFilterInput(equals="Chrome"), id_visita=IntFilterInput(greaterThan=10)
+        ))
+        self.assertEqual(rewritten.where, " WHERE (fv.id_visita > ? AND fv.id_dim_navegador IN (?, ?))")
+        self.assertEqual(rewritten.params, [10, 1, 3])
+        self.assertEqual(rewritten.fields, {"id_visita"})
+
+    def test_large_key_sets_stay_subqueries(self):
+        rewritten = self._rewrite(VisitaFilterInput(nome_navegador=StringFilterInput(equals="Chrome")), max_ids=1)
+        self.assertEqual(
+            rewritten.where,
+            " WHERE fv.id_dim_navegador IN (SELECT id_dim_navegador FROM DimNavegador dn WHERE dn.nome_navegador = ?)"
+        )
+        self.assertEqual(rewritten.params, ["Chrome"])
+
+    def test_empty_key_set_simplifies(self):
+        # An unmatched leaf falsifies its AND group...
+        self.assertIsNone(self._rewrite(VisitaFilterInput(
+            id_visita=IntFilterInput(equals=1), pais_geografia=StringFilterInput(equals="Atlantis")
+        )))
+        # ...and drops out of an OR, together with its parameters
+        rewritten = self._rewrite(VisitaFilterInput(OR=[
+            VisitaFilterInput(id_visita=IntFilterInput(equals=1), pais_geografia=StringFilterInput(equals="Atlantis")),
+            VisitaFilterInput(pais_geografia=StringFilterInput(equals="Brazil")),
+        ]))
+        self.assertEqual(rewritten.where, " WHERE (fv.id_dim_geografia IN (?))")
+        self.assertEqual(rewritten.params, [1])
+        self.assertIsNone(self._rewrite(VisitaFilterInput(OR=[
+            VisitaFilterInput(nome_navegador=StringFilterInput(equals="Opera")),
+            VisitaFilterInput(pais_geografia=StringFilterInput(equals="Atlantis")),
+        ])))
+
+    def test_resolutions_are_cached_per_token(self):
+        filter_input = VisitaFilterInput(nome_navegador=StringFilterInput(equals="Firefox"))
+        statements = []
+        self.conn.set_trace_callback(statements.append)
+        self._rewrite(filter_input, token=("test", 1))
+        hits = semi_join_cache_info()["hits"]
+        self._rewrite(filter_input, token=("test", 1))
+        self.assertEqual(len(statements), 1)
+        self.assertEqual(semi_join_cache_info()["hits"], hits + 1)
+        self._rewrite(filter_input, token=("test", 2))
+        self.assertEqual(len(statements), 2)
+        self.conn.set_trace_callback(None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import unittest
+import sqlite3
+import os
+import json
+import tempfile
+from unittest import mock
+from fastapi.testclient import TestClient # type: ignore
+
+# Assuming slow_query.py is in the parent directory
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from slow_query import SlowQueryLog, close_slow_query_log, get_slow_query_log, parameter_shape
+import main
+from main import app
+from init_db import init_db, DATABASE_FILE
+from db_pool import close_pool
+from seed_data import seed_data
+
+class TestSlowQueryLog(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.executescript("""
+            CREATE TABLE FatoVisitas (id_visita INTEGER PRIMARY KEY, id_dim_dominio INTEGER, timestamp_visita INTEGER);
+            CREATE TABLE DimDominio (id_dim_dominio INTEGER, nome_dominio TEXT);
+        """)
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmpdir.cleanup()
+
+    def test_records_plans_flags_and_top_n(self):
+        path = os.path.join(self.tmpdir.name, "slow-{pid}.log")
+        log = SlowQueryLog(threshold_ms=0, top_n=2, path=path, max_bytes=1500, backups=1)
+        self.addCleanup(log.close)
+        page = "SELECT fv.id_visita FROM FatoVisitas fv WHERE fv.id_dim_dominio = ?  ORDER BY fv.timestamp_visita LIMIT ?"
+        entry = log.record(self.conn, "page", page, [3, 20], 12.5)
+        self.assertEqual(entry["params"], ["int*2"])
+        self.assertEqual(entry["flags"], ["full_scan", "temp_btree_order_by"])
+        self.assertIn("USE TEMP B-TREE FOR ORDER BY", entry["plan"])
+        join = "SELECT COUNT(*) FROM FatoVisitas fv JOIN DimDominio dd ON dd.id_dim_dominio = fv.id_dim_dominio WHERE dd.nome_dominio = ?"
+        self.assertIn("auto_index", log.record(self.conn, "count", join, ["a.com"], 30.0)["flags"])
+
+        log.record(self.conn, "page", page, [4, 20], 40.0) # Same shape, other values
+        for i in range(4): # Less slow shapes are pruned past 2 * top_n
+            log.record(self.conn, "count", f"SELECT {i} FROM FatoVisitas", [], 1.0)
+        top = log.top()
+        self.assertEqual([(item["kind"], item["count"], item["maxMs"], item["avgMs"]) for item in top],
+                         [("page", 2, 40.0, 26.25), ("count", 1, 30.0, 30.0)])
+        self.assertEqual(log.top(kind="count")[0]["sql"], " ".join(join.split()))
+        self.assertEqual(log.stats()["recorded"], 7)
+
+        # JSON lines, rotated into one backup
+        log.close()
+        files = sorted(os.listdir(self.tmpdir.name))
+        self.assertEqual(files, [f"slow-{os.getpid()}.log", f"slow-{os.getpid()}.log.1"])
+        with open(os.path.join(self.tmpdir.name, files[1])) as f:
+            first = json.loads(f.readline())
+        self.assertEqual((first["kind"], first["durationMs"]), ("page", 12.5))
+
+    def test_parameter_shape(self):
+        self.assertEqual(parameter_shape([1, 2, "a", None, 1.5, 1.5]), ["int*2", "str", "NoneType", "float*2"])
+        self.assertEqual(parameter_shape([]), [])
+
+class TestSlowQueryAPI(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        close_pool()
+        close_slow_query_log()
+        if os.path.exists(DATABASE_FILE):
+            os.remove(DATABASE_FILE)
+        init_db()
+        seed_data()
+        cls.client = TestClient(app)
+
+    @classmethod
+    def tearDownClass(cls):
+        close_slow_query_log()
+        close_pool()
+        if os.path.exists(DATABASE_FILE):
+            os.remove(DATABASE_FILE)
+
+    def test_admin_endpoint(self):
+        self.client.headers["X-Admin-Token"] = "secret"
+        self.addCleanup(self.client.headers.pop, "X-Admin-Token")
+        self.enterContext(mock.patch.object(main, "ADMIN_TOKEN", "secret"))
+        get_slow_query_log().threshold_ms = 0 # Every statement counts as slow
+        response = self.client.post("/graphql", json={
+            "query": '{ getVisitas(filter: {caminhoPagina: {contains: "a"}}) { totalCount edges { node { idVisita } } } }'
+        })
+        self.assertEqual(response.status_code, 200, response.text)
+        queries = self.client.get("/admin/slow-queries").json()["queries"]
+        self.assertEqual(sorted(item["kind"] for item in queries), ["count", "page"])
+        for item in queries:
+            self.assertTrue(item["plan"])
+            self.assertNotIn("%a%", json.dumps(item)) # Parameter values are never kept
+        self.assertEqual(len(self.client.get("/admin/slow-queries", params={"kind": "page"}).json()["queries"]), 1)
+        self.client.delete("/admin/slow-queries")
+        self.assertEqual(self.client.get("/admin/slow-queries").json()["queries"], [])
+
+    def test_admin_endpoint_requires_token(self):
+        self.assertEqual(self.client.get("/admin/slow-queries").status_code, 404) # No ADMIN_TOKEN configured
+        with mock.patch.object(main, "ADMIN_TOKEN", "secret"):
+            self.assertEqual(self.client.get("/admin/slow-queries").status_code, 403)
+            self.assertEqual(self.client.delete("/admin/slow-queries", headers={"X-Admin-Token": "wrong"}).status_code, 403)
+            self.assertEqual(self.client.get("/admin/slow-queries", headers={"X-Admin-Token": "secret"}).status_code, 200)
+
+if __name__ == '__main__':
+    unittest.main()
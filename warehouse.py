@@ -0,0 +1,68 @@
+"""Star-schema metadata for the visits data warehouse.
+
+Describes how each `VisitaType` field maps onto `FatoVisitas` and its dimension
+tables, so query builders can derive JOINs and column lists instead of hard-coding them.
+"""
+from typing import Dict, NamedTuple, Tuple
+
+FACT_TABLE = "FatoVisitas"
+FACT_ALIAS = "fv"
+
+
+class Dimension(NamedTuple):
+    table: str
+    alias: str
+    key: str  # Surrogate key; the fact table's foreign key column has the same name
+    left_join: bool  # Nullable foreign key on the fact table
+    fields: Dict[str, str]  # VisitaType field -> dimension column
+
+
+DIMENSIONS: Tuple[Dimension, ...] = (
+    Dimension("DimDominio", "dd", "id_dim_dominio", False, {"nome_dominio": "nome_dominio"}),
+    Dimension("DimPagina", "dp", "id_dim_pagina", False, {"caminho_pagina": "caminho_pagina"}),
+    Dimension("DimUrl", "du", "id_dim_url", False, {"url_completa": "url_completa"}),
+    Dimension("DimNavegador", "dn", "id_dim_navegador", False, {
+        "nome_navegador": "nome_navegador", "versao_navegador": "versao_navegador",
+        "motor_renderizacao_navegador": "motor_renderizacao", "so_usuario_navegador": "sistema_operacional_usuario",
+    }),
+    Dimension("DimUtm", "dut", "id_dim_utm", True, {
+        "utm_source": "utm_source", "utm_medium": "utm_medium", "utm_campaign": "utm_campaign",
+        "utm_term": "utm_term", "utm_content": "utm_content",
+    }),
+    Dimension("DimSessao", "ds", "id_dim_sessao", False, {
+        "id_usuario_sessao": "id_usuario_sessao", "id_sessao_navegador": "id_sessao_navegador",
+    }),
+    Dimension("DimDispositivo", "ddi", "id_dim_dispositivo", False, {
+        "tipo_dispositivo": "tipo_dispositivo", "marca_dispositivo": "marca_dispositivo",
+        "modelo_dispositivo": "modelo_dispositivo", "resolucao_tela": "resolucao_tela",
+    }),
+    Dimension("DimIp", "dip", "id_dim_ip", False, {"endereco_ip": "endereco_ip"}),
+    Dimension("DimTempo", "dt", "id_dim_tempo", False, {
+        "data_completa": "data_completa", "ano": "ano", "mes": "mes", "dia": "dia",
+        "dia_semana": "dia_semana", "hora": "hora", "minuto": "minuto",
+    }),
+    Dimension("DimGeografia", "dg", "id_dim_geografia", True, {
+        "pais_geografia": "pais", "regiao_geografia": "regiao", "cidade_geografia": "cidade",
+    }),
+    Dimension("DimReferencia", "dr", "id_dim_referencia", True, {
+        "url_referencia": "url_referencia", "tipo_referencia": "tipo_referencia",
+    }),
+)
+
+FACT_FIELDS: Dict[str, str] = {"id_visita": "id_visita", "timestamp_visita": "timestamp_visita"}
+
+DIMENSIONS_BY_ALIAS: Dict[str, Dimension] = {dim.alias: dim for dim in DIMENSIONS}
+
+# VisitaType field -> (table alias, column), in VisitaType declaration order
+FIELD_MAPPING: Dict[str, Tuple[str, str]] = {
+    **{field: (FACT_ALIAS, column) for field, column in FACT_FIELDS.items()},
+    **{field: (dim.alias, column) for dim in DIMENSIONS for field, column in dim.fields.items()},
+}
+
+VISITA_FIELDS: Tuple[str, ...] = tuple(FIELD_MAPPING)
+
+
+def join_clause(dim: Dimension, fact_alias: str = FACT_ALIAS) -> str:
+    """Returns the JOIN clause attaching `dim` to the fact table."""
+    join = "LEFT JOIN" if dim.left_join else "JOIN"
+    return f" {join} {dim.table} {dim.alias} ON {fact_alias}.{dim.key} = {dim.alias}.{dim.key}"